@@ -1,33 +1,167 @@
 import uvicorn
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
-import subprocess
+from typing import List, Dict, Any, Optional
+from contextlib import asynccontextmanager
 import os
 import json
-import uuid
 import asyncio
+import uuid
 
-from utils.vector_store import VectorStore
+from utils.vector_store import AGENT_KEY_PATTERN, VectorStore
+from utils.agent_data import BACKENDS
+from utils.embeddings import SentenceTransformerEncoder
 from utils.llm_interaction import LLMInteraction
+from utils.crawl_engine import CrawlEngine
+from utils.answer_cache import AnswerCache
+from utils.ingest_jobs import IngestJobManager, IngestQueueFull, URL_FAILED
+from utils.llm_interaction import ERROR_RESPONSES, IncompleteAnswerError
+from utils.metrics import MetricsMiddleware, format_timings, metrics
 
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI()
-vector_store = VectorStore()
-llm_interaction = LLMInteraction(api_key=os.getenv("GROQ_API_KEY"))
+near_duplicate_similarity = os.getenv("NEAR_DUPLICATE_SIMILARITY")
+# Agents are loaded lazily and kept in memory up to this budget
+vector_store = VectorStore(
+    memory_budget_mb=int(os.getenv("VECTOR_STORE_MEMORY_MB", "512")),
+    # Retrieval backend of new agents: tfidf, dense (embeddings) or hybrid
+    default_backend=os.getenv("RETRIEVAL_BACKEND", "tfidf"),
+    encoder=SentenceTransformerEncoder(os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")),
+    hybrid_alpha=float(os.getenv("HYBRID_DENSE_WEIGHT", "0.5")),
+    quantize_embeddings=os.getenv("EMBEDDING_QUANTIZE", "false").lower() == "true",
+    # New pages with the same text as a stored one become aliases of it. With NEAR_DUPLICATE_SIMILARITY
+    # set (e.g. 0.8), so do pages at least this similar; their own text is then not indexed.
+    deduplicate=os.getenv("DEDUPLICATE_PAGES", "true").lower() == "true",
+    near_duplicate_similarity=float(near_duplicate_similarity) if near_duplicate_similarity else None,
+    # Several worker processes on one data directory (e.g. uvicorn --workers N): writes are locked
+    # across processes and each worker reloads the agents another one changed
+    shared=os.getenv("VECTOR_STORE_SHARED", "false").lower() == "true"
+)
+# LLM_BASE_URL points at any OpenAI-compatible chat completions endpoint (the benchmarks use a local mock)
+llm_interaction = LLMInteraction(
+    api_key=os.getenv("GROQ_API_KEY"),
+    base_url=os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1/chat/completions"),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+)
+# Repeated questions are answered without retrieval or an LLM call until the agent's corpus changes
+near_duplicate_threshold = os.getenv("ANSWER_CACHE_NEAR_DUPLICATE_THRESHOLD")
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+    near_duplicate_threshold=float(near_duplicate_threshold) if near_duplicate_threshold else None
+)
+vector_store.add_change_listener(answer_cache.invalidate_agent)
+# Scrapy runs inside this process; the reactor is started once and reused by every request
+crawl_engine = CrawlEngine(settings={
+    "HTTP_REVALIDATION_CACHE_PATH": os.getenv("HTTP_REVALIDATION_CACHE_PATH", "http_cache/revalidation.sqlite3"),
+})
+# Scrape-and-store work runs on a bounded pool of background workers
+ingest_jobs = IngestJobManager(
+    crawl=crawl_engine.crawl,
+    store=vector_store.store_pages,
+    workers=int(os.getenv("INGEST_WORKERS", "4")),
+    queue_depth=int(os.getenv("INGEST_QUEUE_DEPTH", "1000")),
+    per_host_concurrency=int(os.getenv("INGEST_PER_HOST_CONCURRENCY", "2")),
+    retention=int(os.getenv("INGEST_JOB_RETENTION", "1000")),
+    remember_validators=crawl_engine.remember_validators,
+    not_indexed=vector_store.near_duplicate_aliases,
+    max_result_chars=int(os.getenv("INGEST_RESULT_MAX_CHARS", "100000000"))
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    crawl_engine.start()
+    ingest_jobs.start()
+    yield
+    await ingest_jobs.stop()
+    crawl_engine.stop()
+    await llm_interaction.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+# Request latencies for /metrics; set PROFILE_SLOW_REQUEST_MS to profile a sample of requests and keep the slow ones
+slow_request_ms = os.getenv("PROFILE_SLOW_REQUEST_MS")
+app.add_middleware(
+    MetricsMiddleware,
+    slow_request_ms=float(slow_request_ms) if slow_request_ms else None,
+    profile_sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.05")),
+    profile_dir=os.getenv("PROFILE_DIR", "profiles")
+)
+metrics.add_collector(vector_store.update_metrics)
+metrics.add_collector(ingest_jobs.update_metrics)
+metrics.add_collector(answer_cache.update_metrics)
 
 # Ensure the data directory exists
 os.makedirs("data", exist_ok=True)
 
 class ScrapAndStoreRequest(BaseModel):
     urls: str
+    backend: Optional[str] = None # Retrieval backend of the new agent (tfidf, dense, hybrid); RETRIEVAL_BACKEND if unset
+    timings: bool = False # Add the time spent per stage (milliseconds) to the response
+    stream: bool = False # /scrap_and_store only: send an NDJSON line per URL as soon as it is stored
+    include_content: bool = True # Return the scraped content and sections; if off, each URL only reports content_length
+    agent_key: Optional[str] = None # Refresh or extend this agent instead of creating one; unchanged pages are not fetched again
+    crawl: bool = False # Site crawl: follow the links of each URL and store every page found
+    max_depth: int = 2 # Crawl only: link hops from the given URLs
+    max_pages: Optional[int] = None # Crawl only: pages per given URL; SITE_CRAWL_MAX_PAGES if unset
+    allowed_domains: Optional[List[str]] = None # Crawl only: hosts (and their subdomains) to stay on; the given URLs' hosts if unset
+
+class AgentBackendRequest(BaseModel):
+    agent_key: str
+    backend: str
 
 class QuerySearchRequest(BaseModel):
     user_query: str
     agent_key: str
+    top_k: int = 5 # Number of best matching chunks considered
+    token_budget: int = 1500 # Approximate token limit for the context sent to the LLM
+    stream: bool = False # Stream the answer as plain text while the LLM generates it
+    timings: bool = False # Add the time spent per stage (milliseconds) to the response; not for streamed answers
+
+class QuerySearchBatchRequest(BaseModel):
+    user_queries: List[str]
+    agent_key: str
+    top_k: int = 5
+    token_budget: int = 1500
+    max_concurrency: int = 8 # LLM calls of this batch in flight at once (also bounded by LLM_MAX_CONCURRENCY)
+    timings: bool = False # Add the time spent per stage (milliseconds), summed over the batch, to the response
+
+# Upper bound on queries per /query_search_batch request
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "1000"))
+
+FALLBACK_RESPONSE = "Fallback: The asked query does not match or is not found in the stored data for this agent key."
+
+def with_timings(response: dict, requested: bool) -> dict:
+    if requested:
+        response["timings"] = format_timings(metrics.current_timings() or {})
+    return response
+
+async def submit_ingest_job(request: ScrapAndStoreRequest):
+    urls = [url.strip() for url in request.urls.split(',') if url.strip()]
+    if not urls:
+        raise HTTPException(status_code=400, detail="No URLs provided.")
+    if request.agent_key is None:
+        agent_key = str(uuid.uuid4()) # Generate a unique agent key
+    elif AGENT_KEY_PATTERN.fullmatch(request.agent_key):
+        agent_key = request.agent_key
+    else:
+        raise HTTPException(status_code=400, detail="Invalid agent key.")
+    crawl_options = None
+    if request.crawl:
+        crawl_options = {"max_depth": request.max_depth, "max_pages": request.max_pages, "crawl_domains": request.allowed_domains}
+    if request.backend is not None:
+        if request.backend not in BACKENDS:
+            raise HTTPException(status_code=400, detail=f"Unknown backend, expected one of: {', '.join(BACKENDS)}")
+        # Encoding an existing agent's chunks, or waiting for its running ingest, takes a while
+        await asyncio.to_thread(vector_store.set_backend, agent_key, request.backend)
+    try:
+        return ingest_jobs.submit(urls, agent_key, keep_content=request.include_content, crawl_options=crawl_options)
+    except IngestQueueFull as e:
+        # Backpressure: the client should retry later instead of piling up work
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "10"})
 
 @app.post("/scrap_and_store", summary="Scrap content from URLs, vectorize, and store")
 async def scrap_and_store(request: ScrapAndStoreRequest):
@@ -35,64 +169,95 @@ async def scrap_and_store(request: ScrapAndStoreRequest):
     Scraps content from the provided URLs (comma-separated),
     converts it into vectors, and stores it locally.
     Returns the scrapped content and an alphanumeric agent key.
+    Runs as an ingest job and waits for it; see /ingest_jobs to submit
+    without waiting. With stream set, the response is NDJSON instead: one
+    line per URL as soon as it is stored, then a summary line.
+    With crawl set, each URL starts a site crawl and every page found is
+    stored under its own URL. Given an existing agent_key, pages the agent
+    already has are revalidated and skipped if unchanged.
     """
-    urls = [url.strip() for url in request.urls.split(',') if url.strip()]
-    if not urls:
-        raise HTTPException(status_code=400, detail="No URLs provided.")
+    job = await submit_ingest_job(request)
+    if request.stream:
+        return StreamingResponse(stream_ingest_job(job, request.timings), media_type="application/x-ndjson")
+    try:
+        await job.done.wait()
+        return scrap_and_store_response(job, request.timings)
+    finally:
+        # The response has the results and the job id is not handed out, so no one asks for them
+        # again; if the client went away first, the URLs still running keep none either
+        job.drop_results()
+
+def scrap_and_store_response(job, timings: bool) -> dict:
+    if all(entry["status"] == URL_FAILED for entry in job.url_status.values()):
+        errors = "; ".join(f"{entry['url']}: {entry['error']}" for entry in job.url_status.values())
+        raise HTTPException(status_code=500, detail=f"Internal server error during scraping: {errors}")
 
-    scraped_data_list = []
-    agent_key = str(uuid.uuid4()) # Generate a unique agent key
-
-    for url in urls:
-        try:
-            # Run Scrapy spider as a subprocess
-            # The output will be a JSON array of scraped items
-            process = await asyncio.create_subprocess_exec(
-                "scrapy", "crawl", "generic_spider",
-                "-a", f"start_url={url}",
-                "-o", "-", # Output to stdout
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            stdout, stderr = await process.communicate()
-
-            if process.returncode != 0:
-                # MODIFIED: Print and include stderr in the HTTPException detail
-                error_message = stderr.decode(errors='ignore').strip() # Decode with error handling
-                print(f"Scrapy process returned non-zero exit code for {url}. Stderr: {error_message}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Scraping failed for {url}. Error: {error_message if error_message else 'Unknown Scrapy error (no stderr output). See container logs for more details.'}"
-                )
-
-            # Decode and parse the JSON output from Scrapy
-            scraped_items = json.loads(stdout.decode())
-            if scraped_items:
-                # Assuming each item has a 'content' field
-                full_content_for_url = " ".join([item.get('content', '') for item in scraped_items])
-                scraped_data_list.append({
-                    "url": url,
-                    "content": full_content_for_url,
-                    "beautified_content": scraped_items # Provide the raw scraped items for beautified format
-                })
-                # Store the vectorized content
-                vector_store.store_data(agent_key, url, full_content_for_url)
-            else:
-                scraped_data_list.append({
-                    "url": url,
-                    "content": "No content scraped.",
-                    "beautified_content": []
-                })
-
-        except Exception as e:
-            print(f"Error scraping {url}: {e}")
-            raise HTTPException(status_code=500, detail=f"Internal server error during scraping for {url}: {str(e)}")
-
-    return {
+    # URLs that failed still get an entry; the others keep the work already done
+    result = job.to_dict(include_results=False)
+    scraped_data_list = [job.results.get(url) or job.make_result(url) for url in job.urls]
+
+    response = {
         "message": "Scraping and storage successful.",
-        "agent_key": agent_key,
-        "scrapped_content": scraped_data_list
+        "agent_key": job.agent_key,
+        "scrapped_content": scraped_data_list,
+        "fetch_stats": job.fetch_stats,
+        "status": result["status"],
+        "urls": result["urls"]
     }
+    if timings:
+        response["timings"] = result["timings"] # Measured on the ingest workers, summed over the URLs
+    return response
+
+async def stream_ingest_job(job, timings: bool):
+    # {"type": "job"} first, {"type": "url"} per URL in the order they finish, {"type": "summary"} last.
+    # Each URL's result is dropped from the job once sent, so memory does not grow with the number of URLs.
+    yield json.dumps({"type": "job", "job_id": job.job_id, "agent_key": job.agent_key, "urls": len(job.urls)}) + "\n"
+    async for url in job.iter_finished():
+        yield json.dumps({"type": "url", **job.url_status[url], **job.release_result(url)}) + "\n"
+    await job.done.wait()
+    result = job.to_dict(include_results=False)
+    summary = {"type": "summary", "status": result["status"], "progress": result["progress"], "fetch_stats": result["fetch_stats"]}
+    if timings:
+        summary["timings"] = result["timings"]
+    yield json.dumps(summary) + "\n"
+
+@app.post("/ingest_jobs", status_code=202, summary="Submit URLs for background scraping and storage")
+async def submit_ingest(request: ScrapAndStoreRequest):
+    """
+    Queues the provided URLs (comma-separated) and returns the job id and
+    agent key right away. Poll /ingest_jobs/{job_id} for progress.
+    """
+    job = await submit_ingest_job(request)
+    return job.to_dict(include_results=False)
+
+@app.get("/ingest_jobs/{job_id}", summary="Progress and results of an ingest job")
+async def get_ingest_job(job_id: str, include_results: bool = True):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return job.to_dict(include_results=include_results)
+
+@app.get("/ingest_stats", summary="Ingest queue and worker counters")
+async def ingest_stats():
+    return ingest_jobs.stats()
+
+def chunk_sources(matched_chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Where each chunk came from: character span [start, end) of the page text stored for the URL
+    return [{"url": chunk["url"], "start": chunk["start"], "end": chunk["end"], "score": chunk["score"]} for chunk in matched_chunks]
+
+async def retrieve(retrieve_chunks, agent_key: str, *args):
+    # Dense and hybrid agents encode every query, and an agent's first use loads it (and re-encodes it if
+    # its embeddings are missing or from another model): those run in a thread, not on the event loop
+    if vector_store.retrieval_may_block(agent_key):
+        return await asyncio.to_thread(retrieve_chunks, agent_key, *args)
+    return retrieve_chunks(agent_key, *args)
+
+def store_answer(agent_key: str, user_query: str, retrieval_params: tuple, matched_content: str, response_from_llm: str, sources: list,
+                 generation: int):
+    # generation: the agent's answer cache generation from before retrieval; answers to a since-changed corpus are dropped
+    if response_from_llm not in ERROR_RESPONSES:
+        query_vector = vector_store.query_vector(agent_key, user_query) if answer_cache.near_duplicate_threshold is not None else None
+        answer_cache.store(agent_key, user_query, retrieval_params, matched_content, response_from_llm, sources, query_vector, generation)
 
 @app.post("/query_search", summary="Query the stored content using AI")
 async def query_search(request: QuerySearchRequest):
@@ -102,23 +267,138 @@ async def query_search(request: QuerySearchRequest):
     """
     user_query = request.user_query
     agent_key = request.agent_key
+    retrieval_params = (request.top_k, request.token_budget)
 
-    # Retrieve and match content for the given agent key
-    matched_content = vector_store.retrieve_matched_content(agent_key, user_query)
+    vector_store.refresh() # Other workers' changes invalidate cached answers before the lookup
+    generation = answer_cache.generation(agent_key)
+    with metrics.stage("cache_lookup"):
+        cached = answer_cache.lookup(agent_key, user_query, retrieval_params, lambda: vector_store.query_vector(agent_key, user_query))
+    if cached is not None:
+        if request.stream:
+            return StreamingResponse(iter([cached["response"]]), media_type="text/plain; charset=utf-8",
+                                     headers={"X-Sources": json.dumps(cached["sources"], ensure_ascii=True), "X-Cache": "hit"})
+        return with_timings({
+            "response": cached["response"],
+            "source_content_used": cached["context"],
+            "sources": cached["sources"],
+            "cached": True
+        }, request.timings)
 
-    if not matched_content:
-        return {
-            "response": "Fallback: The asked query does not match or is not found in the stored data for this agent key.",
+    # Retrieve the best matching chunks for the given agent key
+    matched_chunks = await retrieve(vector_store.retrieve_matched_chunks, agent_key, user_query, request.top_k, request.token_budget)
+
+    if not matched_chunks:
+        return with_timings({
+            "response": FALLBACK_RESPONSE,
             "source": "None"
-        }
+        }, request.timings)
 
     # Pass matched content and query to LLM
-    response_from_llm = llm_interaction.get_ai_response(user_query, matched_content)
+    matched_content = "\n\n".join(chunk["text"] for chunk in matched_chunks)
+    sources = chunk_sources(matched_chunks)
+
+    def cache_answer(response_from_llm: str):
+        store_answer(agent_key, user_query, retrieval_params, matched_content, response_from_llm, sources, generation)
+
+    if request.stream:
+        async def stream_and_cache():
+            pieces = []
+            try:
+                async for piece in llm_interaction.stream_ai_response(user_query, matched_content):
+                    pieces.append(piece)
+                    yield piece
+            except IncompleteAnswerError:
+                return # The client got a truncated answer; it is not cached
+            cache_answer("".join(pieces).strip())
 
-    return {
+        # The body carries only the answer text; the sources travel in a header
+        return StreamingResponse(
+            stream_and_cache(),
+            media_type="text/plain; charset=utf-8",
+            headers={"X-Sources": json.dumps(sources, ensure_ascii=True), "X-Cache": "miss"}
+        )
+
+    response_from_llm = await llm_interaction.get_ai_response(user_query, matched_content)
+    cache_answer(response_from_llm)
+
+    return with_timings({
         "response": response_from_llm,
-        "source_content_used": matched_content # For debugging/verification
-    }
+        "source_content_used": matched_content, # For debugging/verification
+        "sources": sources,
+        "cached": False
+    }, request.timings)
+
+@app.post("/query_search_batch", summary="Answer many queries against one agent")
+async def query_search_batch(request: QuerySearchBatchRequest):
+    """
+    Same as /query_search (without streaming) for a list of queries. Cache
+    misses are retrieved together in one scoring pass, and their LLM calls
+    run concurrently, at most max_concurrency at a time. Results come back
+    in query order, each shaped like a /query_search response.
+    """
+    agent_key = request.agent_key
+    retrieval_params = (request.top_k, request.token_budget)
+    if len(request.user_queries) > QUERY_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {QUERY_BATCH_MAX} queries per batch.")
+    if request.max_concurrency < 1:
+        raise HTTPException(status_code=400, detail="max_concurrency must be at least 1.")
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(request.user_queries)
+    misses = []
+    vector_store.refresh()
+    generation = answer_cache.generation(agent_key)
+    for i, user_query in enumerate(request.user_queries):
+        with metrics.stage("cache_lookup"):
+            cached = answer_cache.lookup(agent_key, user_query, retrieval_params, lambda user_query=user_query: vector_store.query_vector(agent_key, user_query))
+        if cached is not None:
+            results[i] = {"response": cached["response"], "source_content_used": cached["context"], "sources": cached["sources"], "cached": True}
+        else:
+            misses.append(i)
+
+    matched = await retrieve(vector_store.retrieve_matched_chunks_batch, agent_key, [request.user_queries[i] for i in misses],
+                             request.top_k, request.token_budget) if misses else []
+    semaphore = asyncio.Semaphore(request.max_concurrency)
+
+    async def answer(i: int, matched_chunks):
+        user_query = request.user_queries[i]
+        if not matched_chunks:
+            results[i] = {"response": FALLBACK_RESPONSE, "source": "None"}
+            return
+        matched_content = "\n\n".join(chunk["text"] for chunk in matched_chunks)
+        sources = chunk_sources(matched_chunks)
+        async with semaphore:
+            response_from_llm = await llm_interaction.get_ai_response(user_query, matched_content)
+        store_answer(agent_key, user_query, retrieval_params, matched_content, response_from_llm, sources, generation)
+        results[i] = {"response": response_from_llm, "source_content_used": matched_content, "sources": sources, "cached": False}
+
+    await asyncio.gather(*(answer(i, matched_chunks) for i, matched_chunks in zip(misses, matched or [None] * len(misses))))
+    return with_timings({"agent_key": agent_key, "results": results}, request.timings)
+
+@app.post("/agent_backend", summary="Switch an agent's retrieval backend")
+async def agent_backend(request: AgentBackendRequest):
+    """
+    Switches an existing agent between tfidf, dense and hybrid retrieval.
+    Switching to dense or hybrid encodes all of the agent's chunks.
+    """
+    if request.backend not in BACKENDS:
+        raise HTTPException(status_code=400, detail=f"Unknown backend, expected one of: {', '.join(BACKENDS)}")
+    if not vector_store.has_agent(request.agent_key):
+        raise HTTPException(status_code=404, detail="Unknown agent key.")
+    await asyncio.to_thread(vector_store.set_backend, request.agent_key, request.backend) # Encoding can take a while
+    return {"agent_key": request.agent_key, "backend": request.backend}
+
+@app.get("/cache_stats", summary="Answer cache counters")
+async def cache_stats():
+    return answer_cache.stats()
+
+@app.get("/metrics", summary="Prometheus metrics")
+async def get_metrics():
+    """
+    Counters, gauges and per-stage latency histograms in the Prometheus
+    text format: fetch, render and extraction time, indexing and scoring
+    time, LLM latency and tokens, pages and bytes scraped, agent sizes.
+    """
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8080) # Changed port to 8080
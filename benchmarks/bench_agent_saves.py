@@ -0,0 +1,49 @@
+"""
+Cost of storing pages one at a time as an agent grows, the way non-crawl
+ingest jobs store them: every store_data call saves the agent. Reports
+the seconds per --step stores at each agent size, the version chain
+length and disk size at the end, and the time to load the agent cold.
+Per-step times should stay roughly flat, not grow with the agent.
+
+    python -m benchmarks.bench_agent_saves --pages 2500 --step 500
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.bench_dedup import directory_bytes
+from tests.support import make_documents
+from utils.vector_store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2500)
+    parser.add_argument("--step", type=int, default=500)
+    parser.add_argument("--words", type=int, default=300)
+    args = parser.parse_args()
+
+    documents = make_documents(args.pages, args.words, alphabetic=True, seed=1)
+    results = {"pages": args.pages, "steps": []}
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = VectorStore(data_dir=data_dir)
+        start = time.perf_counter()
+        for i, document in enumerate(documents):
+            store.store_data("bench", f"https://example.com/page/{i}", document)
+            if (i + 1) % args.step == 0:
+                results["steps"].append({"pages": i + 1, "seconds": round(time.perf_counter() - start, 2)})
+                start = time.perf_counter()
+        results["versions_in_chain"] = len(store._get_agent("bench")._segments)
+        results["disk_mb"] = round(directory_bytes(os.path.join(data_dir, "bench")) / 2**20, 2)
+
+        start = time.perf_counter()
+        agent = VectorStore(data_dir=data_dir)._get_agent("bench")
+        results["load_seconds"] = round(time.perf_counter() - start, 3)
+        results["loaded_pages"] = len(agent.urls)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
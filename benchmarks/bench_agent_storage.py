@@ -0,0 +1,66 @@
+"""
+Startup and first-query cost with many agents on disk.
+
+    python -m benchmarks.bench_agent_storage --agents 2000 --docs-per-agent 5
+
+Cold start should stay flat as --agents grows; the first query against an
+agent pays for memory-mapping its files, later queries hit the LRU.
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+
+from tests.support import make_documents
+from utils.agent_data import AgentData
+from utils.vector_store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=2000)
+    parser.add_argument("--docs-per-agent", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs_per_agent * 10, vocabulary_size=5000)
+    data_dir = tempfile.mkdtemp(prefix="bench_agents_")
+    start = time.perf_counter()
+    for a in range(args.agents):
+        agent = AgentData()
+        for d in range(args.docs_per_agent):
+            url = f"http://example.com/{a}/{d}"
+            text = documents[(a + d) % len(documents)]
+            agent.set_text(url, text)
+            agent.set_chunks(url, [(0, len(text))], [text]) # One chunk per page
+        agent.save(f"{data_dir}/agent{a}")
+    write_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store = VectorStore(data_dir)
+    cold_start_seconds = time.perf_counter() - start
+
+    rng = random.Random(0)
+    queries = [(f"agent{rng.randrange(args.agents)}", " ".join(rng.choice(documents).split()[:6])) for _ in range(args.queries)]
+    start = time.perf_counter()
+    for agent_key, query in queries:
+        store.retrieve_matched_content(agent_key, query)
+    first_pass_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for agent_key, query in queries:
+        store.retrieve_matched_content(agent_key, query)
+    warm_pass_seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        "agents": args.agents,
+        "write_seconds": round(write_seconds, 3),
+        "cold_start_ms": round(cold_start_seconds * 1000, 3),
+        "first_pass_ms_per_query": round(first_pass_seconds * 1000 / len(queries), 3),
+        "warm_pass_ms_per_query": round(warm_pass_seconds * 1000 / len(queries), 3),
+        "loaded_agents": len(store._agents),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+p50/p99 latency of repeated /query_search calls with the answer cache
+enabled and disabled, against a mock LLM with fixed latency.
+
+    python -m benchmarks.bench_answer_cache --queries 200 --distinct 20 --latency 0.1
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from tests.support import MockLLMServer, make_documents
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=20, help="Distinct questions among the queries")
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    # app.py keeps its data under ./data
+    sys.path.insert(0, os.getcwd())
+    os.chdir(tempfile.mkdtemp(prefix="bench_cache_"))
+    import app as app_module
+    from fastapi.testclient import TestClient
+
+    documents = make_documents(50, words_per_doc=400, vocabulary_size=3000)
+    for i, doc in enumerate(documents):
+        app_module.vector_store.store_data("bench", f"http://example.com/{i}", doc)
+    rng = random.Random(0)
+    questions = [" ".join(rng.choice(documents).split()[:5]) for _ in range(args.distinct)]
+    workload = [rng.choice(questions) for _ in range(args.queries)]
+
+    results = {}
+    with MockLLMServer(latency=args.latency) as llm:
+        app_module.llm_interaction.base_url = llm.url
+        with TestClient(app_module.app) as client:
+            for mode in ("cache_disabled", "cache_enabled"):
+                app_module.answer_cache.invalidate_agent("bench")
+                latencies = []
+                for question in workload:
+                    if mode == "cache_disabled":
+                        app_module.answer_cache.invalidate_agent("bench")
+                    start = time.perf_counter()
+                    client.post("/query_search", json={"user_query": question, "agent_key": "bench"})
+                    latencies.append(time.perf_counter() - start)
+                latencies.sort()
+                results[mode] = {"p50_ms": round(percentile(latencies, 0.5) * 1000, 2), "p99_ms": round(percentile(latencies, 0.99) * 1000, 2)}
+            results["cache_stats"] = client.get("/cache_stats").json()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
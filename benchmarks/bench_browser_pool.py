@@ -0,0 +1,126 @@
+"""
+Pages/second and peak RSS of rendering through the shared BrowserPool,
+compared with the previous approach of launching Chromium per crawl and
+rendering pages one at a time. Needs a Playwright Chromium install
+(`playwright install chromium`).
+
+    python -m benchmarks.bench_browser_pool --pages 40 --crawls 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+from benchmarks.fixtures import FixtureServer
+from utils.crawl_engine import SCRAPY_PROJECT_DIR
+
+sys.path.insert(0, SCRAPY_PROJECT_DIR)
+from scrapy_app.browser_pool import BrowserPool # noqa: E402
+from scrapy_app import settings as scrapy_settings # noqa: E402
+
+
+def process_tree_rss() -> int:
+    """Resident memory of this process and all of its descendants (Linux /proc)."""
+    parents = {}
+    rss_pages = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            parents[int(pid)] = int(fields[1])
+            rss_pages[int(pid)] = int(fields[21])
+        except (OSError, IndexError):
+            continue
+    tree = {os.getpid()}
+    changed = True
+    while changed:
+        changed = False
+        for pid, parent in parents.items():
+            if parent in tree and pid not in tree:
+                tree.add(pid)
+                changed = True
+    return sum(rss_pages.get(pid, 0) for pid in tree) * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakRss:
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, process_tree_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+async def render_launch_per_crawl(crawls):
+    from playwright.async_api import async_playwright
+    async with async_playwright() as playwright:
+        for urls in crawls:
+            browser = await playwright.chromium.launch(**scrapy_settings.PLAYWRIGHT_LAUNCH_OPTIONS)
+            for url in urls:
+                page = await browser.new_page()
+                await page.goto(url)
+                await page.wait_for_load_state('networkidle')
+                await page.content()
+                await page.close()
+            await browser.close()
+
+
+async def render_with_pool(crawls):
+    pool = BrowserPool(
+        launch_options=scrapy_settings.PLAYWRIGHT_LAUNCH_OPTIONS,
+        contexts=scrapy_settings.PLAYWRIGHT_POOL_CONTEXTS,
+        pages_per_context=scrapy_settings.PLAYWRIGHT_POOL_PAGES_PER_CONTEXT,
+    )
+
+    async def render(url):
+        async with pool.page() as page:
+            await page.goto(url)
+            await page.wait_for_load_state('networkidle', timeout=scrapy_settings.PLAYWRIGHT_NETWORKIDLE_TIMEOUT)
+            await page.content()
+
+    try:
+        for urls in crawls:
+            await asyncio.gather(*(render(url) for url in urls))
+    finally:
+        await pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--crawls", type=int, default=4, help="The pages are split over this many crawls")
+    args = parser.parse_args()
+
+    results = {}
+    with FixtureServer() as server:
+        urls = [server.url(f"/page/{i}") for i in range(args.pages)]
+        crawls = [urls[i::args.crawls] for i in range(args.crawls)]
+        for name, render in (("launch_per_crawl", render_launch_per_crawl), ("browser_pool", render_with_pool)):
+            with PeakRss() as rss:
+                start = time.perf_counter()
+                asyncio.run(render(crawls))
+                elapsed = time.perf_counter() - start
+            results[name] = {"pages_per_sec": round(args.pages / elapsed, 2), "peak_rss_mb": round(rss.peak / 1024 / 1024, 1)}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
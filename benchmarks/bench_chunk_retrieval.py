@@ -0,0 +1,71 @@
+"""
+Retrieval latency and prompt size on multi-megabyte pages: whole-page
+retrieval (the previous behaviour) against chunk retrieval under a token
+budget.
+
+    python -m benchmarks.bench_chunk_retrieval --pages 5 --page-mb 2
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+
+from tests.support import make_documents
+from utils.chunking import estimate_tokens
+from utils.tfidf_index import IncrementalTfidfIndex
+from utils.vector_store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--page-mb", type=float, default=2.0)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--token-budget", type=int, default=1500)
+    args = parser.parse_args()
+
+    words_per_page = int(args.page_mb * 1024 * 1024 / 9) # Synthetic words average ~9 characters with the separator
+    pages = make_documents(args.pages, words_per_doc=words_per_page)
+    rng = random.Random(0)
+    queries = []
+    for _ in range(args.queries):
+        words = rng.choice(pages).split()
+        offset = rng.randrange(len(words) - 10)
+        queries.append(" ".join(words[offset:offset + 6]))
+
+    store = VectorStore(tempfile.mkdtemp(prefix="bench_chunks_"))
+    start = time.perf_counter()
+    for i, page in enumerate(pages):
+        store.store_data("agent", f"http://example.com/{i}", page)
+    ingest_seconds = time.perf_counter() - start
+
+    # Whole-page baseline: one row per page, the best page is the whole context
+    page_index = IncrementalTfidfIndex()
+    for i, page in enumerate(pages):
+        page_index.add(i, store._preprocess_text(page))
+
+    results = {"pages": args.pages, "page_mb": args.page_mb, "chunk_ingest_seconds": round(ingest_seconds, 2)}
+    for name, retrieve in (
+        ("whole_page", lambda q: pages[page_index.search(store._preprocess_text(q))[0][0]]),
+        ("chunks", lambda q: store.retrieve_matched_content("agent", q, token_budget=args.token_budget) or ""),
+    ):
+        retrieve(queries[0]) # Warm up cached matrices
+        latencies, prompt_tokens = [], []
+        for query in queries:
+            start = time.perf_counter()
+            context = retrieve(query)
+            latencies.append(time.perf_counter() - start)
+            prompt_tokens.append(estimate_tokens(context))
+        latencies.sort()
+        results[name] = {
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+            "mean_prompt_tokens": round(sum(prompt_tokens) / len(prompt_tokens)),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
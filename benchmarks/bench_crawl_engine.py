@@ -0,0 +1,65 @@
+"""
+Compares URLs/second of the in-process CrawlEngine against the previous
+one-`scrapy crawl`-subprocess-per-URL path, using a local fixture server.
+
+    python -m benchmarks.bench_crawl_engine --urls 20 [--no-render]
+
+--no-render disables the Playwright middleware in both paths so the numbers
+can be taken on machines without a Chromium install.
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import time
+
+from benchmarks.fixtures import FixtureServer
+from utils.crawl_engine import CrawlEngine, SCRAPY_PROJECT_DIR
+
+NO_RENDER_SETTINGS = {"DOWNLOADER_MIDDLEWARES": {"scrapy_app.middlewares.PlaywrightMiddleware": None}}
+
+
+async def run_subprocess_path(urls, settings):
+    items = []
+    for url in urls:
+        cmd = ["scrapy", "crawl", "generic_spider", "-a", f"start_url={url}", "-o", "-:json", "--nolog"]
+        for name, value in settings.items():
+            cmd += ["-s", f"{name}={json.dumps(value)}"]
+        process = await asyncio.create_subprocess_exec(
+            *cmd, cwd=SCRAPY_PROJECT_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, _ = await process.communicate()
+        items.extend(json.loads(stdout.decode() or "[]"))
+    return items
+
+
+async def run_engine_path(urls, settings):
+    engine = CrawlEngine(settings=settings)
+    engine.start()
+    try:
+        return await engine.crawl(urls)
+    finally:
+        engine.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=20)
+    parser.add_argument("--no-render", action="store_true")
+    args = parser.parse_args()
+
+    settings = NO_RENDER_SETTINGS if args.no_render else {}
+    with FixtureServer() as server:
+        urls = [server.url(f"/page/{i}") for i in range(args.urls)]
+        results = {}
+        for name, runner in (("subprocess", run_subprocess_path), ("engine", run_engine_path)):
+            start = time.perf_counter()
+            items = await runner(urls, settings)
+            elapsed = time.perf_counter() - start
+            results[name] = {"items": len(items), "seconds": round(elapsed, 3), "urls_per_sec": round(len(urls) / elapsed, 2)}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
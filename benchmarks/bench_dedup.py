@@ -0,0 +1,139 @@
+"""
+Near-duplicate detection at ingest: stores a corpus with a known share of
+duplicate pages, half exact copies (case and whitespace changes, like print
+views) and half near copies (1% of the words changed and a pagination
+footer), once with deduplication and once without. Reports ingest time,
+indexed documents and chunks, on-disk and in-memory size, how many
+duplicates were caught, unique pages wrongly aliased, and how many of the
+top-5 results of each query repeat a page already in the results. With
+deduplication, some pages with aliases then get entirely new content, and
+the run reports how many aliases still point at them (should be none: they
+become pages of their own). Runs alternate between the two modes; ingest
+time is the median round's.
+
+    python -m benchmarks.bench_dedup --unique 2000 --duplicate-ratio 0.3
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from tests.support import make_documents
+from utils.vector_store import VectorStore
+
+
+def make_corpus(args) -> list[tuple[str, str, int]]:
+    """(url, text, id of the original page) for every page, shuffled."""
+    rng = random.Random(args.seed)
+    documents = make_documents(args.unique, args.words, alphabetic=True, seed=args.seed)
+    pages = [(f"https://example.com/page/{i}", document, i) for i, document in enumerate(documents)]
+    duplicates = int(args.unique * args.duplicate_ratio / (1 - args.duplicate_ratio))
+    for n in range(duplicates):
+        original = rng.randrange(args.unique)
+        words = documents[original].split()
+        if n % 2:
+            for i in rng.sample(range(len(words)), len(words) // 100):
+                words[i] = rng.choice(words)
+            text = " ".join(words) + f" page {n % 7 + 1} of 7"
+            url = f"https://example.com/page/{original}?page={n}"
+        else:
+            text = "\n".join(" ".join(words[i:i + 12]).upper() for i in range(0, len(words), 12))
+            url = f"https://example.com/print/{original}?copy={n}"
+        pages.append((url, text, original))
+    rng.shuffle(pages)
+    return pages
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run(args, pages, queries, deduplicate: bool) -> dict:
+    original_of = {url: original for url, _, original in pages}
+    first_url = {}
+    for url, _, original in pages:
+        first_url.setdefault(original, url)
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = VectorStore(data_dir=data_dir, deduplicate=deduplicate, near_duplicate_similarity=args.similarity)
+        start = time.perf_counter()
+        for i in range(0, len(pages), args.batch):
+            store.store_pages("bench", [(url, text) for url, text, _ in pages[i:i + args.batch]])
+        elapsed = time.perf_counter() - start
+        stats = store.agent_stats()[0]
+        agent = store._get_agent("bench")
+        duplicates = [url for url, _, original in pages if url != first_url[original]]
+        caught = sum(1 for url in duplicates if url in agent.aliases)
+        wrongly_aliased = sum(1 for alias, url in agent.aliases.items() if original_of[alias] != original_of[url])
+
+        repeated = returned = 0
+        for query in queries:
+            chunks = store.retrieve_matched_chunks("bench", query, top_k=5)
+            originals = [original_of[chunk["url"]] for chunk in chunks]
+            returned += len(set(chunk["url"] for chunk in chunks))
+            repeated += len(set(chunk["url"] for chunk in chunks)) - len(set(originals))
+        disk = directory_bytes(os.path.join(data_dir, "bench"))
+
+        changes = {}
+        if deduplicate:
+            changed = set(sorted(set(agent.aliases.values()))[:args.changed_pages])
+            aliases = sum(1 for url in agent.aliases.values() if url in changed)
+            new_texts = make_documents(len(changed), args.words, alphabetic=True, seed=args.seed + 2)
+            store.store_pages("bench", list(zip(sorted(changed), new_texts)))
+            agent = store._get_agent("bench")
+            changes = {
+                "changed_pages_with_aliases": len(changed),
+                "their_aliases": aliases,
+                "stale_aliases": sum(1 for url in agent.aliases.values() if url in changed),
+            }
+    return {
+        "ingest_seconds": round(elapsed, 2),
+        "pages_per_sec": round(len(pages) / elapsed, 1),
+        "documents": stats["documents"],
+        "aliases": stats["aliases"],
+        "chunks": stats["chunks"],
+        "disk_mb": round(disk / 2**20, 2),
+        "memory_mb": round(stats["memory_bytes"] / 2**20, 2),
+        "duplicates_caught": round(caught / len(duplicates), 3) if duplicates else None,
+        "wrongly_aliased": wrongly_aliased,
+        "repeated_pages_in_top5": round(repeated / max(returned, 1), 3),
+        **changes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--unique", type=int, default=2000)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3)
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--similarity", type=float, default=0.8)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--changed-pages", type=int, default=100, help="Pages with aliases given new content after the ingest")
+    args = parser.parse_args()
+
+    pages = make_corpus(args)
+    rng = random.Random(args.seed + 1)
+    queries = []
+    for _ in range(args.queries):
+        words = rng.choice(pages)[1].split()
+        start = rng.randrange(len(words) - 8)
+        queries.append(" ".join(words[start:start + 8]))
+
+    results = {"pages": len(pages), "duplicate_pages": len(pages) - args.unique}
+    runs = {False: [], True: []}
+    for round_number in range(args.rounds):
+        for deduplicate in ((True, False) if round_number % 2 else (False, True)):
+            runs[deduplicate].append(run(args, pages, queries, deduplicate))
+    for deduplicate, rounds in runs.items():
+        # Sizes and counts are the same every round; times are the median round's
+        result = sorted(rounds, key=lambda r: r["ingest_seconds"])[len(rounds) // 2]
+        results["dedup" if deduplicate else "no_dedup"] = result
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Dense retrieval backend: chunk encode throughput, embedding index memory
+per 10k chunks (float32 and int8) and query latency of tfidf, dense and
+hybrid search over the same chunks.
+
+    python -m benchmarks.bench_dense_retrieval --chunks 10000 [--encoder sentence-transformers]
+
+The default --encoder hashing is the deterministic HashingEncoder, so the
+numbers can be taken without downloading a model; encode throughput is
+only meaningful with the real model.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from tests.support import HashingEncoder, make_documents
+from utils.embeddings import DenseIndex, SentenceTransformerEncoder
+from utils.tfidf_index import IncrementalTfidfIndex
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--words", type=int, default=200, help="Words per chunk")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--encoder", choices=("hashing", "sentence-transformers"), default="hashing")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--alpha", type=float, default=0.5)
+    args = parser.parse_args()
+
+    encoder = HashingEncoder() if args.encoder == "hashing" else SentenceTransformerEncoder(batch_size=args.batch_size)
+    chunks = make_documents(args.chunks, args.words)
+    keys = [("bench", i * 1000, i * 1000 + 999) for i in range(args.chunks)]
+    queries = [" ".join(chunk.split()[:12]) for chunk in chunks[:args.queries]]
+
+    encoder.encode(chunks[:8]) # Model load is not part of the throughput
+    start = time.perf_counter()
+    embeddings = np.concatenate([encoder.encode(chunks[i:i + args.batch_size]) for i in range(0, len(chunks), args.batch_size)])
+    encode_seconds = time.perf_counter() - start
+
+    tfidf = IncrementalTfidfIndex()
+    for key, chunk in zip(keys, chunks):
+        tfidf.add(key, chunk)
+    results = {"encoder": encoder.name, "chunks": args.chunks, "encode_chunks_per_sec": round(args.chunks / encode_seconds, 1)}
+
+    query_vectors = encoder.encode(queries)
+    for quantized in (False, True):
+        dense = DenseIndex(encoder.dim, encoder.name, quantized)
+        dense.add(keys, embeddings)
+        name = "int8" if quantized else "float32"
+        results[f"dense_{name}_mb_per_10k_chunks"] = round(dense.memory_bytes() / args.chunks * 10000 / 1024 / 1024, 2)
+
+        latencies = {"tfidf": [], "dense": [], "hybrid": []}
+        for query, query_vector in zip(queries, query_vectors):
+            start = time.perf_counter()
+            tfidf.search(query, 5)
+            latencies["tfidf"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            dense.search(query_vector, 5)
+            latencies["dense"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            tfidf_keys, tfidf_scores = tfidf.scores(query)
+            scores = args.alpha * dense.scores(query_vector, tfidf_keys) + (1 - args.alpha) * tfidf_scores
+            np.argpartition(-scores, 4)[:5]
+            latencies["hybrid"].append(time.perf_counter() - start)
+
+        for backend, samples in latencies.items():
+            if backend == "tfidf" and quantized:
+                continue
+            label = backend if backend == "tfidf" else f"{backend}_{name}"
+            results[f"{label}_query_p50_ms"] = percentile_ms(samples, 50)
+            results[f"{label}_query_p95_ms"] = percentile_ms(samples, 95)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
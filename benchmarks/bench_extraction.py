@@ -0,0 +1,66 @@
+"""
+Content extraction time and output size of the single-pass lxml extractor
+against the previous BeautifulSoup extraction (get_text on every p/h*/li/
+span/div), on large, deeply nested fixture pages. Also checks that the
+same pages wrapped in a <form> (ASP.NET WebForms style) give the same
+content, without the text of the form controls.
+
+    python -m benchmarks.bench_extraction --pages 20 --depth 12
+"""
+import argparse
+import json
+import re
+import sys
+import time
+
+from benchmarks.fixtures import make_nested_page
+from utils.crawl_engine import SCRAPY_PROJECT_DIR
+
+sys.path.insert(0, SCRAPY_PROJECT_DIR)
+from scrapy_app.extraction import extract_content, parse_html # noqa: E402
+
+
+def extract_with_beautifulsoup(html: str) -> str:
+    # The extraction GenericSpider.parse used before
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    content_parts = []
+    for element in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'span', 'div']):
+        text = element.get_text(separator=' ', strip=True)
+        if text:
+            content_parts.append(text)
+    return re.sub(r'\s+', ' ', " ".join(content_parts)).strip()
+
+
+def extract_single_pass(html: str) -> str:
+    return extract_content(parse_html(html))['content']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--sections", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=12)
+    args = parser.parse_args()
+
+    pages = [make_nested_page(i, sections=args.sections, depth=args.depth) for i in range(args.pages)]
+    results = {"html_bytes_per_page": len(pages[0].encode('utf-8'))}
+    for name, extract in (("beautifulsoup", extract_with_beautifulsoup), ("single_pass", extract_single_pass)):
+        start = time.perf_counter()
+        outputs = [extract(page) for page in pages]
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "ms_per_page": round(elapsed * 1000 / len(pages), 2),
+            "output_chars_per_page": sum(len(output) for output in outputs) // len(pages),
+        }
+
+    form_pages = [make_nested_page(i, sections=args.sections, depth=args.depth, form=True) for i in range(args.pages)]
+    results["form_wrapped_pages_match"] = all(extract_single_pass(form_page) == extract_single_pass(page) for form_page, page in zip(form_pages, pages))
+
+    print(json.dumps(results, indent=2))
+    if not results["form_wrapped_pages_match"]:
+        sys.exit("Content of form-wrapped pages differs from the plain pages.")
+
+
+if __name__ == "__main__":
+    main()
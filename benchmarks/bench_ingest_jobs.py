@@ -0,0 +1,82 @@
+"""
+Load test of the ingest job subsystem: submits jobs at a steady rate for a
+while and reports sustained jobs/minute, job latency, rejected submissions
+and the deepest the queue got. Pages come from the local fixture server and
+are stored in a temporary VectorStore. Also reports the page text the
+manager keeps in job results at the end, which stays within
+--max-result-chars.
+
+    python -m benchmarks.bench_ingest_jobs --duration 30 --rate 2 --urls-per-job 5 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+from benchmarks.fixtures import FixtureServer
+from utils.crawl_engine import CrawlEngine
+from utils.ingest_jobs import IngestJobManager, IngestQueueFull
+from utils.vector_store import VectorStore
+
+
+async def run(args, server):
+    engine = CrawlEngine(settings={"LOG_LEVEL": "WARNING"})
+    engine.start()
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = VectorStore(data_dir=data_dir)
+        manager = IngestJobManager(engine.crawl, store.store_pages, workers=args.workers, queue_depth=args.queue_depth,
+                                   per_host_concurrency=args.per_host, max_result_chars=args.max_result_chars)
+        manager.start()
+        jobs, rejected, max_pending = [], 0, 0
+        start = time.perf_counter()
+        try:
+            page = 0
+            while time.perf_counter() - start < args.duration:
+                urls = [server.url(f"/page/{page + i}") for i in range(args.urls_per_job)]
+                page += args.urls_per_job
+                try:
+                    jobs.append(manager.submit(urls))
+                except IngestQueueFull:
+                    rejected += 1
+                max_pending = max(max_pending, manager.stats()["pending_urls"])
+                await asyncio.sleep(1 / args.rate)
+            await asyncio.gather(*(job.done.wait() for job in jobs))
+            elapsed = time.perf_counter() - start
+            retained = manager.retained_result_chars()
+        finally:
+            await manager.stop()
+            engine.stop()
+
+    latencies = sorted(job.finished_at - job.submitted_at for job in jobs)
+    return {
+        "jobs_completed": len(jobs),
+        "jobs_rejected": rejected,
+        "jobs_per_minute": round(len(jobs) * 60 / elapsed, 1),
+        "urls_per_sec": round(len(jobs) * args.urls_per_job / elapsed, 2),
+        "latency_p50_sec": round(latencies[len(latencies) // 2], 3) if latencies else None,
+        "latency_p95_sec": round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+        "max_pending_urls": max_pending,
+        "retained_result_chars": retained,
+        "jobs_with_results_dropped": sum(1 for job in jobs if job.results_dropped),
+        "job_statuses": {status: sum(1 for job in jobs if job.status == status) for status in {job.status for job in jobs}},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of submitting")
+    parser.add_argument("--rate", type=float, default=2, help="Jobs submitted per second")
+    parser.add_argument("--urls-per-job", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument("--queue-depth", type=int, default=1000)
+    parser.add_argument("--max-result-chars", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with FixtureServer() as server:
+        print(json.dumps(asyncio.run(run(args, server)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
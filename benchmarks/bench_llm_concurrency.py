@@ -0,0 +1,61 @@
+"""
+Shows that concurrent LLM calls overlap instead of running one after the
+other, against a local mock OpenAI-compatible server.
+
+    python -m benchmarks.bench_llm_concurrency --requests 32 --latency 0.2
+
+With N requests and latency L, overlapping calls finish in about
+ceil(N / max_concurrency) * L; a blocking client would need N * L.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from tests.support import MockLLMServer
+from utils.llm_interaction import LLMInteraction
+
+
+async def run(args, url):
+    client = LLMInteraction(api_key="mock", base_url=url, max_concurrency=args.max_concurrency, backoff_base=0.05)
+    try:
+        start = time.perf_counter()
+        answers = await asyncio.gather(*(client.get_ai_response(f"question {i}", "context") for i in range(args.requests)))
+        concurrent_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        first_piece_at = None
+        pieces = []
+        async for piece in client.stream_ai_response("question", "context"):
+            if first_piece_at is None:
+                first_piece_at = time.perf_counter() - start
+            pieces.append(piece)
+        stream_seconds = time.perf_counter() - start
+    finally:
+        await client.aclose()
+
+    return {
+        "requests": args.requests,
+        "latency_s": args.latency,
+        "max_concurrency": args.max_concurrency,
+        "concurrent_wall_s": round(concurrent_seconds, 3),
+        "sequential_estimate_s": round(args.requests * args.latency, 3),
+        "all_answered": all(answer == "This is a mock answer." for answer in answers),
+        "stream": {"pieces": len(pieces), "first_piece_s": round(first_piece_at or 0, 3), "total_s": round(stream_seconds, 3), "text": "".join(pieces).strip()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--fail-first", type=int, default=2, help="Initial 503 responses, retried by the client")
+    args = parser.parse_args()
+
+    with MockLLMServer(latency=args.latency, fail_first=args.fail_first) as server:
+        print(json.dumps(asyncio.run(run(args, server.url)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Cost of the metrics layer: the time of one timed stage, and VectorStore
+query throughput with metrics enabled versus disabled (runs alternate, in
+turns starting with either, so drift affects both equally; the median of
+each is reported).
+
+    python -m benchmarks.bench_metrics_overhead --docs 2000 --queries 500
+"""
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+
+from tests.support import make_documents
+from utils.metrics import metrics
+from utils.vector_store import VectorStore
+
+
+def stage_cost_ns(iterations: int) -> float:
+    start = time.perf_counter()
+    with metrics.request_timings():
+        for _ in range(iterations):
+            with metrics.stage("bench"):
+                pass
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs, args.words, alphabetic=True)
+    rng = random.Random(1)
+    queries = []
+    for _ in range(args.queries):
+        words = rng.choice(documents).split()
+        start = rng.randrange(len(words) - 8)
+        queries.append(" ".join(words[start:start + 8]))
+
+    results = {}
+    metrics.enabled = False
+    results["disabled_stage_ns"] = round(stage_cost_ns(200_000), 1)
+    metrics.enabled = True
+    results["enabled_stage_ns"] = round(stage_cost_ns(200_000), 1)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = VectorStore(data_dir=data_dir)
+        for i, document in enumerate(documents):
+            store.store_data("bench", f"https://example.com/{i}", document)
+        store.retrieve_matched_chunks("bench", queries[0]) # Builds the matrix outside the timings
+
+        rates = {True: [], False: []}
+        for round_number in range(args.rounds):
+            for enabled in ((False, True) if round_number % 2 else (True, False)):
+                metrics.enabled = enabled
+                start = time.perf_counter()
+                with metrics.request_timings():
+                    for query in queries:
+                        store.retrieve_matched_chunks("bench", query)
+                rates[enabled].append(len(queries) / (time.perf_counter() - start))
+        metrics.enabled = True
+
+    disabled, enabled = statistics.median(rates[False]), statistics.median(rates[True])
+    results["queries_per_sec_disabled"] = round(disabled, 1)
+    results["queries_per_sec_enabled"] = round(enabled, 1)
+    results["overhead_percent"] = round((disabled / enabled - 1) * 100, 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Multi-worker deployment: N app processes serve one shared data directory
+(VECTOR_STORE_SHARED=true), each on its own port and with its own answer
+cache, against the local fixture site and a mock LLM. For each worker
+count the run
+
+- ingests pages through worker 0 and checks that the last worker answers
+  from them without a restart;
+- asks the last worker a question about a page that is not stored yet,
+  so its answer is cached, then ingests that page through worker 0 and
+  measures how long until the last worker answers from it (the cached
+  answer must not be served once the agent changed);
+- with two or more workers, ingests into the same agent through every
+  worker at once and checks that no page was lost to a concurrent write;
+- sends queries spread evenly over all workers and reports the aggregate
+  queries/s and latency percentiles, plus each worker's peak RSS and
+  proportional set size (PSS: pages shared between the workers, like the
+  memory-mapped index files, are split between them).
+
+    python -m benchmarks.bench_multi_worker --workers 1,2,4 --queries 400 --concurrency 32
+
+Throughput only grows with the worker count when there are CPU cores for
+the workers to run on; `cpus` in the report is the number available.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fixtures import FixtureServer, page_paragraphs
+from benchmarks.load_test import AppProcess, latency_summary, run_requests
+from tests.support import MockLLMServer
+
+AGENT_KEY = "shared"
+
+
+def pss_mb(pid: int):
+    # Proportional set size: shared pages count for each process as size / number of sharers; Linux only
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def page_url(fixture_port: int, page_id: int) -> str:
+    return f"http://127.0.0.1:{fixture_port}/page/{page_id}"
+
+
+async def ingest(client, fixture_port: int, page_ids: list[int], urls_per_request: int = 5, concurrency: int = 4):
+    requests = [("/scrap_and_store", {"agent_key": AGENT_KEY, "include_content": False,
+                                      "urls": ",".join(page_url(fixture_port, i) for i in page_ids[n:n + urls_per_request])})
+                for n in range(0, len(page_ids), urls_per_request)]
+    _, results, elapsed = await run_requests(client, requests, concurrency)
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        raise RuntimeError(f"Ingest failed: {failed[0]}")
+    return elapsed
+
+
+async def answers_from(client, page_id: int, paragraphs: int) -> bool:
+    # A whole paragraph of the page as the query: its top source is that page once the worker has it
+    response = await client.post("/query_search", json={"agent_key": AGENT_KEY, "user_query": page_paragraphs(page_id, paragraphs)[0], "top_k": 1})
+    sources = response.json().get("sources") or []
+    return bool(sources) and sources[0]["url"].endswith(f"/page/{page_id}")
+
+
+async def documents(client) -> int:
+    # From the worker's /metrics; the agent is loaded by a query first
+    await client.post("/query_search", json={"agent_key": AGENT_KEY, "user_query": "page", "top_k": 1})
+    text = (await client.get("/metrics")).text
+    for line in text.splitlines():
+        if line.startswith(f'scrap_search_agent_documents{{agent="{AGENT_KEY}"}}'):
+            return int(float(line.split()[-1]))
+    return 0
+
+
+async def run(args, workers: list[AppProcess], fixture_port: int) -> dict:
+    timeout = httpx.Timeout(600.0)
+    clients = [httpx.AsyncClient(base_url=worker.url, timeout=timeout, limits=httpx.Limits(max_connections=1000)) for worker in workers]
+    try:
+        writer, reader = clients[0], clients[-1]
+        report = {}
+
+        page_ids = list(range(args.pages))
+        elapsed = await ingest(writer, fixture_port, page_ids)
+        report["ingest_seconds"] = round(elapsed, 2)
+        report["visible_on_other_worker"] = await answers_from(reader, page_ids[-1], args.paragraphs)
+
+        # The reader has the agent loaded and an answer to this query cached from other pages,
+        # so this checks that it picks up the change and drops the cached answer
+        new_page = args.pages
+        if await answers_from(reader, new_page, args.paragraphs):
+            raise RuntimeError(f"Page {new_page} answered from before it was stored.")
+        await ingest(writer, fixture_port, [new_page])
+        start = time.perf_counter()
+        while not await answers_from(reader, new_page, args.paragraphs):
+            if time.perf_counter() - start > 30:
+                raise RuntimeError(f"Page {new_page} did not show up on the last worker within 30 seconds.")
+            await asyncio.sleep(0.01)
+        report["propagation_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        expected = args.pages + 1
+
+        if len(clients) > 1:
+            # Same agent, every worker at once; the ingest lock must keep every page
+            first = expected
+            batches = [list(range(first + n * args.concurrent_pages, first + (n + 1) * args.concurrent_pages)) for n in range(len(clients))]
+            await asyncio.gather(*(ingest(client, fixture_port, batch, urls_per_request=1, concurrency=2) for client, batch in zip(clients, batches)))
+            expected += sum(len(batch) for batch in batches)
+        counts = [await documents(client) for client in clients]
+        report["documents_expected"] = expected
+        report["documents_per_worker"] = counts
+        report["lost_pages"] = expected - min(counts)
+
+        # Paragraphs of the stored pages as queries, distinct so that they miss the answer cache, spread evenly over the workers
+        requests = [("/query_search", {"agent_key": AGENT_KEY, "top_k": 5,
+                                       "user_query": page_paragraphs(i % args.pages, args.paragraphs)[(1 + i // args.pages) % args.paragraphs]})
+                    for i in range(args.queries)]
+        per_worker = [requests[n::len(clients)] for n in range(len(clients))]
+        start = time.perf_counter()
+        runs = await asyncio.gather(*(run_requests(client, worker_requests, max(1, args.concurrency // len(clients)))
+                                      for client, worker_requests in zip(clients, per_worker)))
+        elapsed = time.perf_counter() - start
+        latencies = [latency for worker_latencies, _, _ in runs for latency in worker_latencies]
+        report.update({
+            "queries": len(requests),
+            "queries_per_sec": round(len(requests) / elapsed, 2),
+            "failed_queries": sum(1 for _, results, _ in runs for result in results if isinstance(result, Exception)),
+            "cached_answers": sum(1 for _, results, _ in runs for result in results if isinstance(result, dict) and result.get("cached")),
+            **latency_summary(latencies),
+        })
+        return report
+    finally:
+        for client in clients:
+            await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts to run")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--concurrent-pages", type=int, default=4, help="Pages each worker ingests in the concurrent ingest check")
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32, help="Queries in flight, over all workers")
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = {"cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(), "runs": []}
+    with FixtureServer(paragraphs=args.paragraphs) as fixtures, MockLLMServer(latency=args.llm_latency) as llm:
+        env = {"LLM_BASE_URL": llm.url, "GROQ_API_KEY": "mock", "VECTOR_STORE_SHARED": "true"}
+        for count in (int(n) for n in args.workers.split(",")):
+            with tempfile.TemporaryDirectory(prefix="multi_worker_") as workdir:
+                workers = []
+                try:
+                    for _ in range(count):
+                        workers.append(AppProcess(env, workdir).__enter__())
+                    report = asyncio.run(run(args, workers, fixtures.httpd.server_address[1]))
+                    report["peak_rss_mb_per_worker"] = [worker.peak_rss_mb() for worker in workers]
+                    report["pss_mb_per_worker"] = [pss_mb(worker.process.pid) for worker in workers]
+                finally:
+                    for worker in workers:
+                        worker.__exit__(None, None, None)
+            results["runs"].append({"workers": count, **report})
+            print(json.dumps(results["runs"][-1]), flush=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
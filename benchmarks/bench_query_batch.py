@@ -0,0 +1,58 @@
+"""
+Queries/second of VectorStore retrieval one query at a time versus
+retrieve_matched_chunks_batch at batch sizes 1, 32 and 512, and a check
+that both return the same chunks.
+
+    python -m benchmarks.bench_query_batch --docs 2000 --queries 512
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+
+from tests.support import make_documents
+from utils.vector_store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=512)
+    parser.add_argument("--batch-sizes", default="1,32,512")
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs, args.words, alphabetic=True)
+    rng = random.Random(1)
+    queries = []
+    for _ in range(args.queries):
+        words = rng.choice(documents).split()
+        start = rng.randrange(len(words) - 8)
+        queries.append(" ".join(words[start:start + 8]))
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = VectorStore(data_dir=data_dir)
+        for i, document in enumerate(documents):
+            store.store_data("bench", f"https://example.com/{i}", document)
+        store.retrieve_matched_chunks("bench", queries[0]) # Builds the matrix outside the timings
+
+        start = time.perf_counter()
+        single = [store.retrieve_matched_chunks("bench", query) for query in queries]
+        results = {"chunks": len(store._get_agent("bench").index), "single_queries_per_sec": round(len(queries) / (time.perf_counter() - start), 1)}
+
+        for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+            start = time.perf_counter()
+            batched = []
+            for i in range(0, len(queries), batch_size):
+                batched.extend(store.retrieve_matched_chunks_batch("bench", queries[i:i + batch_size]))
+            results[f"batch_{batch_size}_queries_per_sec"] = round(len(queries) / (time.perf_counter() - start), 1)
+            results[f"batch_{batch_size}_matches_single"] = all(
+                [(c["url"], c["start"], c["score"]) for c in a] == [(c["url"], c["start"], c["score"]) for c in b] for a, b in zip(single, batched)
+            )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
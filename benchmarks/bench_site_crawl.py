@@ -0,0 +1,104 @@
+"""
+Site crawl and revalidation: crawls a linked fixture site from its home
+page into an agent, changes a fraction of the pages, then crawls it again
+into the same agent. The recrawl sends the stored validators, so unchanged
+pages answer 304 and are neither downloaded, extracted nor stored again.
+Reports pages/s of both crawls and how much fetch, extract and store work
+the recrawl avoided, and checks that the agent ends up with the new
+versions of the changed pages. The fixture site's pages are near-duplicates
+of each other, so --near-duplicate-similarity exercises aliasing too.
+
+    python -m benchmarks.bench_site_crawl --pages 341 --fanout 4 --changed 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.fixtures import FixtureServer
+from utils.crawl_engine import CrawlEngine
+from utils.ingest_jobs import IngestJobManager
+from utils.vector_store import VectorStore
+
+AGENT_KEY = "site"
+
+
+async def crawl_site(manager, server, args) -> dict:
+    responses = dict(server.responses)
+    crawl_options = {"max_depth": args.max_depth, "max_pages": args.pages + 10}
+    start = time.perf_counter()
+    job = manager.submit([server.url("site/0")], AGENT_KEY, keep_content=False, crawl_options=crawl_options)
+    await job.done.wait()
+    elapsed = time.perf_counter() - start
+    entry = job.url_status[job.urls[0]]
+    assert entry["status"] != "failed", entry["error"]
+    pages = entry["pages"]["stored"] + entry["pages"]["unchanged"]
+    return {
+        "seconds": round(elapsed, 2),
+        "pages": pages,
+        "pages_per_sec": round(pages / elapsed, 1),
+        "stored": entry["pages"]["stored"],
+        "not_modified": entry["pages"]["unchanged"],
+        "downloads": server.responses[200] - responses.get(200, 0),
+        "extract_seconds": round(job.timings.get("extract", 0.0), 3),
+        "store_seconds": round(job.timings.get("store", 0.0), 3),
+    }
+
+
+async def run(args, server, work_dir):
+    engine = CrawlEngine(settings={
+        "LOG_LEVEL": "WARNING",
+        "HTTP_REVALIDATION_CACHE_PATH": os.path.join(work_dir, "http_cache", "revalidation.sqlite3"),
+    })
+    engine.start()
+    store = VectorStore(data_dir=os.path.join(work_dir, "data"), near_duplicate_similarity=args.near_duplicate_similarity)
+    manager = IngestJobManager(engine.crawl, store.store_pages, workers=1, remember_validators=engine.remember_validators,
+                               not_indexed=store.near_duplicate_aliases)
+    manager.start()
+    try:
+        cold = await crawl_site(manager, server, args)
+        changed = random.Random(0).sample(sorted(server.site_versions), int(args.pages * args.changed))
+        for page_id in changed:
+            server.site_versions[page_id] += 1
+        recrawl = await crawl_site(manager, server, args)
+    finally:
+        await manager.stop()
+        engine.stop()
+
+    snapshot = store._get_snapshot(AGENT_KEY)
+    stale = [page_id for page_id in changed if f"v{server.site_versions[page_id]}" not in snapshot.get_text(server.url(f"site/{page_id}"))]
+    return {
+        "changed_pages": len(changed),
+        "cold": cold,
+        "recrawl": recrawl,
+        "fetches_avoided": round(1 - recrawl["downloads"] / cold["downloads"], 3),
+        "extract_seconds_avoided": round(1 - recrawl["extract_seconds"] / cold["extract_seconds"], 3),
+        "store_seconds_avoided": round(1 - recrawl["store_seconds"] / cold["store_seconds"], 3),
+        "stale_changed_pages": len(stale),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=341)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--max-depth", type=int, default=10)
+    parser.add_argument("--changed", type=float, default=0.1)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--near-duplicate-similarity", type=float, default=None)
+    args = parser.parse_args()
+
+    with FixtureServer(paragraphs=args.paragraphs, site_pages=args.pages, site_fanout=args.fanout) as server:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = asyncio.run(run(args, server, work_dir))
+    print(json.dumps(results, indent=2))
+    if results["stale_changed_pages"]:
+        sys.exit("The agent does not have the new version of every changed page.")
+
+
+if __name__ == "__main__":
+    main()
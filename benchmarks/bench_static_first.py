@@ -0,0 +1,72 @@
+"""
+Static-first fetching against rendering every page, on a local corpus that
+mixes static pages (/page/<n> on 127.0.0.1) with JavaScript-rendered ones
+(/spa/<n> on localhost, so the two sit on different domains). Reports
+pages/second and how many pages took each fetch path.
+
+    python -m benchmarks.bench_static_first --static 30 --spa 10
+
+Rendering needs a Playwright Chromium install; without one the browser
+path falls back to a plain download and the numbers only cover the
+static path and the detection overhead.
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from benchmarks.fixtures import FixtureServer
+from utils.crawl_engine import CrawlEngine
+
+
+async def run_mode(static_first: bool, urls: list[str]) -> dict:
+    engine = CrawlEngine(settings={"STATIC_FIRST_FETCH": static_first, "LOG_LEVEL": "WARNING"})
+    engine.start()
+    try:
+        start = time.perf_counter()
+        items = await engine.crawl(urls)
+        elapsed = time.perf_counter() - start
+    finally:
+        engine.stop()
+    return {
+        "items": len(items),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(urls) / elapsed, 2),
+        "fetch": dict(Counter(item.get('fetch', 'rendered') for item in items)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--static", type=int, default=30)
+    parser.add_argument("--spa", type=int, default=10)
+    parser.add_argument("--mode", choices=("static_first", "render_all"), help=argparse.SUPPRESS)
+    parser.add_argument("--urls", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child process: the Twisted reactor cannot be restarted, so each mode gets its own process
+        result = asyncio.run(run_mode(args.mode == "static_first", json.loads(args.urls)))
+        print(json.dumps(result))
+        return
+
+    with FixtureServer() as server:
+        port = server.httpd.server_address[1]
+        urls = ([f"http://127.0.0.1:{port}/page/{i}" for i in range(args.static)] +
+                [f"http://localhost:{port}/spa/{i}" for i in range(args.spa)])
+        results = {}
+        for mode in ("render_all", "static_first"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_static_first", "--mode", mode, "--urls", json.dumps(urls)],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Peak memory of /scrap_and_store as the number of URLs grows, for the
+buffered JSON response, the NDJSON stream, and the NDJSON stream without
+the content echo. Every (mode, URL count) pair runs in its own process,
+since peak RSS only ever goes up. The stored corpus itself grows with the
+URLs in every mode, so the report also gives the peak minus the agent's
+in-memory size: that part stays flat when the response does not buffer.
+
+    python -m benchmarks.bench_stream_ingest --counts 40,160 --paragraphs 200
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.fixtures import FixtureServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {
+    "buffered": {"stream": False, "include_content": True},
+    "stream": {"stream": True, "include_content": True},
+    "stream_no_content": {"stream": True, "include_content": False},
+}
+
+
+def run_child(mode: str, urls: list[str]) -> dict:
+    # Fresh working directory, so the agent data of one run never leaks into another
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, REPO_DIR)
+    import httpx
+    import uvicorn
+    import app as app_module
+
+    # A real server: the test client would hand over a streamed body only once it is complete
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    body = {"urls": ",".join(urls), **MODES[mode]}
+    first_line_at = None
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+        if body["stream"]:
+            url_lines = 0
+            with client.stream("POST", "/scrap_and_store", json=body) as response:
+                for line in response.iter_lines():
+                    event = json.loads(line)
+                    if event["type"] == "url":
+                        url_lines += 1
+                        first_line_at = first_line_at or time.perf_counter() - start
+                    elif event["type"] == "summary":
+                        status = event["status"]
+            assert url_lines == len(urls)
+        else:
+            result = client.post("/scrap_and_store", json=body).json()
+            status = result["status"]
+            del result
+    elapsed = time.perf_counter() - start
+    agent_bytes = sum(agent["memory_bytes"] for agent in app_module.vector_store.agent_stats())
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    server.should_exit = True
+    thread.join()
+    return {
+        "status": status,
+        "seconds": round(elapsed, 2),
+        "first_url_seconds": round(first_line_at if first_line_at is not None else elapsed, 2),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "peak_growth_mb": round((peak_kb - baseline_kb) / 1024, 1),
+        "agent_mb": round(agent_bytes / 2**20, 1),
+        "growth_minus_agent_mb": round((peak_kb - baseline_kb) / 1024 - agent_bytes / 2**20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", default="40,160")
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--urls", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_child(args.mode, json.loads(args.urls))))
+        return
+
+    env = dict(os.environ, INGEST_WORKERS="8", INGEST_PER_HOST_CONCURRENCY="8", INGEST_QUEUE_DEPTH="100000")
+    results = {}
+    with FixtureServer(paragraphs=args.paragraphs) as server:
+        for mode in args.modes.split(","):
+            for count in (int(count) for count in args.counts.split(",")):
+                urls = [server.url(f"page/{i}") for i in range(count)]
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_stream_ingest", "--mode", mode, "--urls", json.dumps(urls)],
+                    capture_output=True, text=True, check=True, env=env, cwd=REPO_DIR,
+                ).stdout
+                results[f"{mode}_{count}"] = json.loads(output.strip().splitlines()[-1])
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
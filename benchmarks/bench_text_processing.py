@@ -0,0 +1,44 @@
+"""
+Tokens/second of utils.text_processing against the previous NLTK pipeline
+(word_tokenize + stopwords.words('english') per token), plus a parity
+check of their output on the same corpus.
+
+    python -m benchmarks.bench_text_processing --docs 2000 --reference-docs 100
+"""
+import argparse
+import json
+import time
+
+from tests.support import make_corpus, reference_preprocess
+from utils.text_processing import preprocess_batch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--reference-docs", type=int, default=100, help="Documents run through the slow NLTK pipeline")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.docs)
+    reference_corpus = corpus[:args.reference_docs]
+
+    start = time.perf_counter()
+    output = preprocess_batch(corpus)
+    seconds = time.perf_counter() - start
+    tokens = sum(len(doc.split()) for doc in output)
+
+    start = time.perf_counter()
+    reference_output = [reference_preprocess(doc) for doc in reference_corpus]
+    reference_seconds = time.perf_counter() - start
+    reference_tokens = sum(len(doc.split()) for doc in reference_output)
+
+    mismatches = sum(1 for ours, theirs in zip(output, reference_output) if ours != theirs)
+    print(json.dumps({
+        "text_processing": {"docs": len(corpus), "tokens_per_sec": round(tokens / seconds)},
+        "nltk_reference": {"docs": len(reference_corpus), "tokens_per_sec": round(reference_tokens / reference_seconds)},
+        "parity": {"docs_compared": len(reference_output), "mismatches": mismatches},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
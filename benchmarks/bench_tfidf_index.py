@@ -0,0 +1,65 @@
+"""
+Ingests synthetic documents one at a time into IncrementalTfidfIndex and,
+for comparison, into the previous refit-everything-per-document path.
+Also checks that the incremental scores match a single full refit.
+
+    python -m benchmarks.bench_tfidf_index --docs 10000 --refit-docs 500
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from tests.support import make_documents
+from utils.tfidf_index import IncrementalTfidfIndex
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--refit-docs", type=int, default=500, help="Documents ingested through the O(N^2) refit path")
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs)
+    queries = [" ".join(doc.split()[:8]) for doc in make_documents(args.queries, seed=1)]
+
+    start = time.perf_counter()
+    for i in range(args.refit_docs):
+        TfidfVectorizer().fit_transform(documents[:i + 1])
+    refit_seconds = time.perf_counter() - start
+
+    index = IncrementalTfidfIndex()
+    start = time.perf_counter()
+    for i, doc in enumerate(documents):
+        index.add(i, doc)
+    incremental_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.search(queries[0]) # First search after ingest builds the weighted matrix
+    first_search_seconds = time.perf_counter() - start
+
+    vectorizer = TfidfVectorizer()
+    reference = vectorizer.fit_transform(documents)
+    max_error = 0.0
+    start = time.perf_counter()
+    for query in queries:
+        scores = dict(index.search(query, top_n=len(documents)))
+        incremental_scores = np.array([scores[i] for i in range(len(documents))])
+        reference_scores = cosine_similarity(vectorizer.transform([query]), reference).ravel()
+        max_error = max(max_error, float(np.abs(incremental_scores - reference_scores).max()))
+    query_seconds = (time.perf_counter() - start) / len(queries)
+
+    print(json.dumps({
+        "refit_path": {"docs": args.refit_docs, "seconds": round(refit_seconds, 3), "docs_per_sec": round(args.refit_docs / refit_seconds, 1)},
+        "incremental_path": {"docs": args.docs, "seconds": round(incremental_seconds, 3), "docs_per_sec": round(args.docs / incremental_seconds, 1)},
+        "first_search_after_ingest_ms": round(first_search_seconds * 1000, 2),
+        "parity": {"queries": len(queries), "max_abs_score_difference": max_error, "seconds_per_query_incl_reference": round(query_seconds, 4)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import json
+import random
+import threading
+from collections import Counter
+from itertools import accumulate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+from tests.support import WORDS, alphabetic_word
+
+# Fixture page text: WORDS are the most frequent words, followed by a long Zipf tail
+PAGE_VOCABULARY = WORDS + [alphabetic_word(i) for i in range(5000)]
+PAGE_CUM_WEIGHTS = list(accumulate(1.0 / (rank + 1) for rank in range(len(PAGE_VOCABULARY))))
+
+
+def page_paragraphs(page_id: int, paragraphs: int = 20) -> list[str]:
+    """Text of fixture page `page_id`: 60-word paragraphs, the same every time, different for every page."""
+    rng = random.Random(page_id)
+    return [" ".join(rng.choices(PAGE_VOCABULARY, cum_weights=PAGE_CUM_WEIGHTS, k=60)) for _ in range(paragraphs)]
+
+
+def make_static_page(page_id: int, paragraphs: int = 20) -> str:
+    body = "".join(f"<p>{paragraph}</p>" for paragraph in page_paragraphs(page_id, paragraphs))
+    return (f"<html><head><title>Fixture page {page_id}</title></head>"
+            f"<body><h1>Page {page_id}</h1>{body}</body></html>")
+
+
+def make_spa_page(page_id: int, paragraphs: int = 20) -> str:
+    """Client-side rendered version of make_static_page: the served HTML has an empty #root."""
+    paragraphs_js = json.dumps(page_paragraphs(page_id, paragraphs))
+    return (f"<html><head><title>Fixture app {page_id}</title></head>"
+            f"<body><noscript>You need to enable JavaScript to run this app.</noscript><div id=\"root\"></div>"
+            f"<script>document.getElementById('root').innerHTML = '<h1>App {page_id}</h1>' + "
+            f"{paragraphs_js}.map(function (p) {{ return '<p>' + p + '</p>'; }}).join('');</script></body></html>")
+
+
+def make_site_page(page_id: int, version: int, children: list[int], paragraphs: int = 20) -> str:
+    """Page of a linked fixture site: its children, the home page (twice, once with a fragment) and its text."""
+    links = [f"<a href='/site/{child}'>Child {child}</a><a href='/site/{child}#top'>top</a>" for child in children]
+    links.append("<a href='/site/0'>Home</a><a href='http://{host}/site/0#main'>Home</a>")
+    body = []
+    for p in range(paragraphs):
+        words = [WORDS[(page_id * 7 + version * 11 + p * 3 + i) % len(WORDS)] for i in range(60)]
+        body.append(f"<p>{' '.join(words)}</p>")
+    return (f"<html><head><title>Site page {page_id}</title></head>"
+            f"<body><nav>{''.join(links)}</nav><h1>Site page {page_id} v{version}</h1>{''.join(body)}</body></html>")
+
+
+def make_nested_page(page_id: int, sections: int = 20, depth: int = 12, paragraphs: int = 5, form: bool = False) -> str:
+    """
+    Large page whose paragraphs sit `depth` <div>s deep, with nav/footer/script
+    boilerplate. With form, the body is wrapped in one <form> with a few
+    controls, the way ASP.NET WebForms and many CMS themes render pages.
+    """
+    parts = [f"<html><head><title>Nested page {page_id}</title><style>p {{ margin: 0 }}</style></head><body>"]
+    if form:
+        parts.append("<form method='post' action='./Default.aspx' id='form1'><input type='hidden' name='__VIEWSTATE' value='dDwtMTA4MTc5'>"
+                     "<select name='lang'><option>English</option><option>Deutsch</option></select>")
+    parts += ["<nav><ul>" + "".join(f"<li><a href='/s/{i}'>Section {i}</a></li>" for i in range(sections)) + "</ul></nav>",
+              f"<h1>Nested page {page_id}</h1>"]
+    for section in range(sections):
+        parts.append(f"<h2>Section {section}</h2>" + "<div><span>" * depth)
+        for p in range(paragraphs):
+            words = [WORDS[(page_id * 7 + section * 5 + p * 3 + i) % len(WORDS)] for i in range(40)]
+            parts.append(f"<p>{' '.join(words)}</p>")
+        parts.append("</span></div>" * depth)
+    parts.append("<script>var analytics = {};</script><footer>Copyright fixture site</footer>")
+    if form:
+        parts.append("<textarea name='comment'>Your comment</textarea><button type='submit'>Send</button></form>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+
+class FixtureServer:
+    """
+    Local HTTP server for benchmarks. Serves generated pages at /page/<n>,
+    and JavaScript-rendered versions of them at /spa/<n>, so crawls never
+    leave the machine.
+
+    With site_pages, /site/0 ... /site/<site_pages - 1> form a linked site:
+    page n links to pages n * site_fanout + 1 ... n * site_fanout +
+    site_fanout. Site pages carry an ETag and answer If-None-Match with 304;
+    bump site_versions[n] to change page n. `responses` counts the site
+    responses by status code.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, paragraphs: int = 20, site_pages: int = 0, site_fanout: int = 4):
+        paragraphs_per_page = paragraphs
+        server = self
+        self.site_versions = {page_id: 0 for page_id in range(site_pages)}
+        self.responses = Counter()
+        self.lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                try:
+                    page_id = int(path.rstrip('/').rsplit('/', 1)[-1])
+                except ValueError:
+                    self.send_error(404)
+                    return
+                if path.startswith("/site/"):
+                    self._site_page(page_id)
+                    return
+                make_page = make_spa_page if path.startswith("/spa/") else make_static_page
+                self._send_page(make_page(page_id, paragraphs_per_page).encode('utf-8'))
+
+            def _site_page(self, page_id: int):
+                if page_id not in server.site_versions:
+                    self.send_error(404)
+                    return
+                version = server.site_versions[page_id]
+                etag = f'"{page_id}-{version}"'
+                if self.headers.get("If-None-Match") == etag:
+                    with server.lock:
+                        server.responses[304] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                children = [child for child in range(page_id * site_fanout + 1, page_id * site_fanout + site_fanout + 1)
+                            if child in server.site_versions]
+                html = make_site_page(page_id, version, children, paragraphs_per_page).replace("{host}", self.headers.get("Host", ""))
+                with server.lock:
+                    server.responses[200] += 1
+                self._send_page(html.encode('utf-8'), etag)
+
+            def _send_page(self, body: bytes, etag: str = None):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                if etag:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
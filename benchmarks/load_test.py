@@ -0,0 +1,275 @@
+"""
+End-to-end load test of the API, fully offline: the app runs as its own
+uvicorn process against the local fixture site (static pages and
+JavaScript-rendered ones) and a mock LLM endpoint, and a client replays a
+scripted workload of ingest and query phases, each at a set concurrency.
+
+For every phase the report gives requests and URLs or queries per second,
+p50/p95/p99 request latency, failures and the server's peak RSS so far.
+The report is printed and appended as one JSON line to --output, along
+with the commit and workload, so runs can be compared over time.
+
+    python -m benchmarks.load_test --static 40 --js 5 --queries 200 --llm-latency 0.2
+    python -m benchmarks.load_test --workload my_workload.json
+
+A workload file holds {"phases": [...]}, run in order; see
+DEFAULT_WORKLOAD for the phase fields. JavaScript pages need a Playwright
+Chromium install; browser processes are not included in the peak RSS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fixtures import FixtureServer
+from tests.support import WORDS, MockLLMServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT = os.path.join(REPO_DIR, "benchmarks", "results", "load_test.jsonl")
+
+DEFAULT_WORKLOAD = {
+    "phases": [
+        # static/js: URLs of each kind, split into /scrap_and_store requests of urls_per_request URLs
+        {"type": "ingest", "static": 40, "js": 5, "urls_per_request": 5, "concurrency": 4, "agent_key": "loadtest"},
+        # queries: /query_search requests of query_words random fixture words each
+        {"type": "query", "queries": 200, "concurrency": 16, "query_words": 4, "top_k": 5, "agent_key": "loadtest"},
+    ]
+}
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))] if sorted_values else None
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+    return {f"p{p}_ms": round(percentile(latencies, p / 100) * 1000, 2) if latencies else None for p in (50, 95, 99)}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def peak_rss_mb(pid: int):
+    # High-water mark of the process's resident set; Linux only
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class AppProcess:
+    """
+    The API in its own uvicorn process, with its data directory in a
+    temporary working directory, or in `workdir` (which is left in place)
+    when several processes share one.
+    """
+    def __init__(self, env: dict, workdir: str = None):
+        self.port = free_port()
+        self.workdir = tempfile.TemporaryDirectory(prefix="load_test_") if workdir is None else None
+        self.cwd = workdir if workdir is not None else self.workdir.name
+        self.env = dict(os.environ, PYTHONPATH=REPO_DIR, **env)
+        self.process = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"],
+            cwd=self.cwd, env=self.env,
+        )
+        deadline = time.monotonic() + 120
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"App exited with code {self.process.returncode} during startup.")
+            try:
+                if httpx.get(f"{self.url}/ingest_stats", timeout=1).status_code == 200:
+                    return self
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("App did not start within 120 seconds.")
+            time.sleep(0.2)
+
+    def peak_rss_mb(self):
+        return peak_rss_mb(self.process.pid)
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        if self.workdir is not None:
+            self.workdir.cleanup()
+
+
+async def run_requests(client: httpx.AsyncClient, bodies: list[tuple[str, dict]], concurrency: int):
+    """Posts every (path, body) with at most `concurrency` in flight; returns (latencies, responses or exceptions, seconds)."""
+    latencies = [None] * len(bodies)
+    results = [None] * len(bodies)
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < len(bodies):
+            i = next_index
+            next_index += 1
+            path, body = bodies[i]
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                results[i] = response.json() if response.status_code == 200 else RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+            except Exception as e:
+                results[i] = e
+            latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return latencies, results, time.perf_counter() - start
+
+
+async def ingest_phase(client, phase: dict, fixture_port: int, first_page: int) -> dict:
+    # Static pages on 127.0.0.1, JavaScript pages on localhost, so the two sit on different domains
+    urls = ([f"http://127.0.0.1:{fixture_port}/page/{first_page + i}" for i in range(phase.get("static", 0))] +
+            [f"http://localhost:{fixture_port}/spa/{first_page + i}" for i in range(phase.get("js", 0))])
+    random.Random(first_page).shuffle(urls)
+    size = phase.get("urls_per_request", 5)
+    body = {"agent_key": phase.get("agent_key", "loadtest"), "include_content": False}
+    requests = [("/scrap_and_store", dict(body, urls=",".join(urls[i:i + size]))) for i in range(0, len(urls), size)]
+    latencies, results, elapsed = await run_requests(client, requests, phase.get("concurrency", 4))
+
+    statuses, fetches = {}, {}
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        for entry in result.get("urls", []):
+            statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+        for fetch, count in result.get("fetch_stats", {}).items():
+            fetches[fetch] = fetches.get(fetch, 0) + count
+    return {
+        "requests": len(requests),
+        "urls": len(urls),
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(requests) / elapsed, 2),
+        "urls_per_sec": round(len(urls) / elapsed, 2),
+        "failed_requests": sum(1 for result in results if isinstance(result, Exception)),
+        "url_statuses": statuses,
+        "fetch_stats": fetches,
+        **latency_summary(latencies),
+    }
+
+
+async def query_phase(client, phase: dict, seed: int) -> dict:
+    rng = random.Random(seed)
+    body = {"agent_key": phase.get("agent_key", "loadtest"), "top_k": phase.get("top_k", 5)}
+    requests = [("/query_search", dict(body, user_query=" ".join(rng.choices(WORDS, k=phase.get("query_words", 4)))))
+                for _ in range(phase.get("queries", 200))]
+    latencies, results, elapsed = await run_requests(client, requests, phase.get("concurrency", 16))
+    return {
+        "queries": len(requests),
+        "seconds": round(elapsed, 3),
+        "queries_per_sec": round(len(requests) / elapsed, 2),
+        "failed_requests": sum(1 for result in results if isinstance(result, Exception)),
+        "cached_answers": sum(1 for result in results if isinstance(result, dict) and result.get("cached")),
+        **latency_summary(latencies),
+    }
+
+
+async def run_workload(app: AppProcess, workload: dict, fixture_port: int) -> list[dict]:
+    reports = []
+    next_page = 0
+    async with httpx.AsyncClient(base_url=app.url, timeout=httpx.Timeout(600.0), limits=httpx.Limits(max_connections=1000)) as client:
+        for number, phase in enumerate(workload["phases"]):
+            if phase["type"] == "ingest":
+                report = await ingest_phase(client, phase, fixture_port, next_page)
+                next_page += phase.get("static", 0) + phase.get("js", 0)
+            elif phase["type"] == "query":
+                report = await query_phase(client, phase, number)
+            else:
+                raise ValueError(f"Unknown phase type: {phase['type']}")
+            report = {"phase": phase, **report, "peak_rss_mb": app.peak_rss_mb()}
+            print(json.dumps(report), file=sys.stderr)
+            reports.append(report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workload", help="JSON file with the phases to run; overrides the phase options below")
+    parser.add_argument("--static", type=int, default=40)
+    parser.add_argument("--js", type=int, default=5)
+    parser.add_argument("--urls-per-request", type=int, default=5)
+    parser.add_argument("--ingest-concurrency", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-concurrency", type=int, default=16)
+    parser.add_argument("--paragraphs", type=int, default=20, help="Paragraphs per fixture page (page size)")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache on (off by default, so every query reaches the LLM)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    if args.workload:
+        with open(args.workload) as f:
+            workload = json.load(f)
+    else:
+        ingest, query = (dict(phase) for phase in DEFAULT_WORKLOAD["phases"])
+        ingest.update(static=args.static, js=args.js, urls_per_request=args.urls_per_request, concurrency=args.ingest_concurrency)
+        query.update(queries=args.queries, concurrency=args.query_concurrency)
+        workload = {"phases": [ingest, query]}
+
+    with FixtureServer(paragraphs=args.paragraphs) as fixtures, MockLLMServer(latency=args.llm_latency) as llm:
+        env = {"LLM_BASE_URL": llm.url, "GROQ_API_KEY": "mock"}
+        if not args.answer_cache:
+            env["ANSWER_CACHE_SIZE"] = "0"
+        with AppProcess(env) as app:
+            phases = asyncio.run(run_workload(app, workload, fixtures.httpd.server_address[1]))
+            peak = app.peak_rss_mb()
+
+    report = {
+        "benchmark": "load_test",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"paragraphs": args.paragraphs, "llm_latency": args.llm_latency, "answer_cache": args.answer_cache},
+        "workload": workload,
+        "phases": phases,
+        "server_peak_rss_mb": peak,
+        "client_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "a") as f:
+            f.write(json.dumps(report) + "\n")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
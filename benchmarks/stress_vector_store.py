@@ -0,0 +1,119 @@
+"""
+Concurrency stress test of VectorStore: writer threads keep replacing pages
+of one agent with new versions while reader threads query it. Every page
+version carries its version tag between its words, so a chunk that mixes
+two versions, or whose text differs from its page at that version, shows a
+query saw a half-applied write. Reports ingests/second, queries/second and
+the number of inconsistent results and errors, then checks that a fresh
+VectorStore loaded from disk sees the same pages.
+
+    python -m benchmarks.stress_vector_store --writers 2 --readers 4 --seconds 10
+"""
+import argparse
+import itertools
+import json
+import random
+import tempfile
+import threading
+import time
+
+from tests.support import TAG_PATTERN, alphabetic_word, make_version
+from utils.vector_store import VectorStore
+
+AGENT_KEY = "stress"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--words", type=int, default=600)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    versions = {} # (page, tag) -> version, for every version that may be stored
+    version_counter = itertools.count()
+    counter_lock = threading.Lock()
+    stop = threading.Event()
+    counts = {"ingests": 0, "queries": 0, "chunks_checked": 0, "inconsistent": 0, "errors": 0}
+    counts_lock = threading.Lock()
+
+    def count(**increments):
+        with counts_lock:
+            for name, value in increments.items():
+                counts[name] += value
+
+    def check(chunks):
+        inconsistent = 0
+        for chunk in chunks:
+            page = int(chunk["url"].rsplit("/", 1)[1])
+            tags = set(TAG_PATTERN.findall(chunk["text"]))
+            version = versions.get((page, tags.pop())) if len(tags) == 1 else None
+            if version is None or make_version(page, version, args.words)[chunk["start"]:chunk["end"]] != chunk["text"]:
+                inconsistent += 1
+        count(chunks_checked=len(chunks), inconsistent=inconsistent)
+
+    def writer(store, seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            page = rng.randrange(args.pages)
+            with counter_lock:
+                version = next(version_counter)
+                versions[(page, alphabetic_word(version))] = version
+            try:
+                store.store_data(AGENT_KEY, f"https://example.com/{page}", make_version(page, version, args.words))
+                count(ingests=1)
+            except Exception as e:
+                print(f"Writer error: {e!r}")
+                count(errors=1)
+
+    def reader(store, seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            queries = [" ".join(alphabetic_word(rng.randrange(2000)) for _ in range(6)) for _ in range(rng.choice((1, 8)))]
+            try:
+                if len(queries) == 1:
+                    results = [store.retrieve_matched_chunks(AGENT_KEY, queries[0]) or []]
+                else:
+                    results = store.retrieve_matched_chunks_batch(AGENT_KEY, queries) or []
+                for chunks in results:
+                    check(chunks)
+                count(queries=len(queries))
+            except Exception as e:
+                print(f"Reader error: {e!r}")
+                count(errors=1)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = VectorStore(data_dir=data_dir)
+        for page in range(args.pages): # Every page exists before the readers start
+            version = next(version_counter)
+            versions[(page, alphabetic_word(version))] = version
+            store.store_data(AGENT_KEY, f"https://example.com/{page}", make_version(page, version, args.words))
+
+        threads = ([threading.Thread(target=writer, args=(store, i)) for i in range(args.writers)] +
+                   [threading.Thread(target=reader, args=(store, 1000 + i)) for i in range(args.readers)])
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        agent = store._get_agent(AGENT_KEY)
+        reloaded = VectorStore(data_dir=data_dir)._get_agent(AGENT_KEY)
+        results = dict(counts)
+        results["ingests_per_sec"] = round(counts["ingests"] / elapsed, 1)
+        results["queries_per_sec"] = round(counts["queries"] / elapsed, 1)
+        results["saved_version"] = reloaded.version
+        results["reload_matches"] = (sorted(reloaded.urls) == sorted(agent.urls) and
+                                     all(reloaded.get_text(url) == agent.get_text(url) for url in agent.urls) and
+                                     sorted(reloaded.index.keys()) == sorted(agent.index.keys()))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+
+class _PageSlot:
+    def __init__(self, context_index: int):
+        self.context_index = context_index
+        self.page = None
+        self.uses = 0
+        self.generation = -1 # Browser generation the page belongs to
+
+
+class BrowserPool:
+    """
+    Warm Playwright browser shared by every crawl in the process.
+
+    One Chromium instance holds `contexts` browser contexts with up to
+    `pages_per_context` pages each; a request leases a page, renders, and
+    hands it back. Pages are recycled after `page_max_uses` renders or any
+    error, and a crashed or disconnected browser is relaunched on the next
+    lease.
+    """
+    def __init__(self, launch_options: dict = None, contexts: int = 2, pages_per_context: int = 4,
+                 page_max_uses: int = 50, navigation_timeout: int = 30000):
+        self.launch_options = launch_options or {}
+        self.contexts = contexts
+        self.pages_per_context = pages_per_context
+        self.page_max_uses = page_max_uses
+        self.navigation_timeout = navigation_timeout
+        self._playwright = None
+        self._browser = None
+        self._browser_contexts = []
+        self._generation = 0 # Bumped on every (re)launch, stale pages are dropped on lease
+        self._launch_lock = None
+        self._idle = None
+
+    async def _ensure_browser(self):
+        if self._launch_lock is None:
+            self._launch_lock = asyncio.Lock()
+            self._idle = asyncio.Queue()
+            for slot in range(self.contexts * self.pages_per_context):
+                self._idle.put_nowait(_PageSlot(slot % self.contexts))
+
+        async with self._launch_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            if self._browser is not None:
+                print("Playwright browser disconnected, relaunching.")
+            self._browser = await self._playwright.chromium.launch(**self.launch_options)
+            self._browser_contexts = [await self._browser.new_context() for _ in range(self.contexts)]
+            self._generation += 1
+
+    @asynccontextmanager
+    async def page(self):
+        """Leases a page; the page is discarded instead of reused if the caller raises."""
+        await self._ensure_browser()
+        slot = await self._idle.get()
+        healthy = False
+        try:
+            if slot.page is None or slot.generation != self._generation or slot.page.is_closed():
+                slot.page = await self._browser_contexts[slot.context_index].new_page()
+                slot.page.set_default_navigation_timeout(self.navigation_timeout)
+                slot.generation = self._generation
+                slot.uses = 0
+            yield slot.page
+            healthy = True
+        finally:
+            slot.uses += 1
+            if not healthy or slot.uses >= self.page_max_uses:
+                await self._discard_page(slot)
+            self._idle.put_nowait(slot)
+
+    async def _discard_page(self, slot: _PageSlot):
+        page, slot.page = slot.page, None
+        if page is not None and slot.generation == self._generation:
+            try:
+                await page.close()
+            except Exception:
+                pass # The page or the whole browser is already gone
+
+    async def close(self):
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+_shared_pool = None
+
+
+def get_browser_pool(settings) -> BrowserPool:
+    """Returns the process-wide pool, creating it from the Scrapy settings on first use."""
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = BrowserPool(
+            launch_options=settings.getdict("PLAYWRIGHT_LAUNCH_OPTIONS"),
+            contexts=settings.getint("PLAYWRIGHT_POOL_CONTEXTS", 2),
+            pages_per_context=settings.getint("PLAYWRIGHT_POOL_PAGES_PER_CONTEXT", 4),
+            page_max_uses=settings.getint("PLAYWRIGHT_POOL_PAGE_MAX_USES", 50),
+            navigation_timeout=settings.getint("PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT", 30000),
+        )
+    return _shared_pool
+
+
+async def close_browser_pool():
+    global _shared_pool
+    if _shared_pool is not None:
+        await _shared_pool.close()
+        _shared_pool = None
@@ -0,0 +1,84 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+from scrapy.http import HtmlResponse
+from scrapy.linkextractors import IGNORED_EXTENSIONS
+from scrapy.utils.url import url_has_any_extension
+from w3lib.url import canonicalize_url
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonical_url(url: str) -> str:
+    """
+    The form of a URL used to tell pages apart: lowercase scheme and host,
+    no default port, no fragment, query arguments sorted and
+    percent-encoding normalized.
+    """
+    parts = urlsplit(canonicalize_url(url))
+    netloc = parts.netloc
+    if parts.port is not None and DEFAULT_PORTS.get(parts.scheme) == parts.port:
+        netloc = netloc.rsplit(":", 1)[0]
+    return urlunsplit((parts.scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def url_host(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+
+def host_in_domains(host: str, domains: list[str]) -> bool:
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def url_fingerprint(url: str) -> int:
+    """Signed 64-bit hash of the canonical URL (fits an SQLite INTEGER)."""
+    return int.from_bytes(hashlib.blake2b(canonical_url(url).encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def extract_links(response, root) -> list[str]:
+    """
+    Canonical absolute URLs of the <a href> links of a parsed HTML page,
+    in page order, without duplicates, non-HTTP schemes or links to
+    files that are not pages (images, archives, media, ...).
+    """
+    if not isinstance(response, HtmlResponse):
+        return []
+    links = {}
+    for element, attribute, link, _ in root.iterlinks():
+        if element.tag != "a" or attribute != "href":
+            continue
+        url = response.urljoin(link.strip()) # Honors <base href>
+        if urlsplit(url).scheme not in DEFAULT_PORTS or url_has_any_extension(url, IGNORED_EXTENSIONS):
+            continue
+        links.setdefault(canonical_url(url), None)
+    return list(links)
+
+
+class CrawlFrontier:
+    """
+    URLs a site crawl has scheduled, as a set of 64-bit fingerprints of
+    their canonical form (a few dozen bytes per URL, whatever its length),
+    so query-string reorderings, fragments and default ports do not fetch
+    the same page twice. add() refuses URLs outside `allowed_domains`
+    (subdomains included) and anything past `max_pages`.
+    """
+    def __init__(self, allowed_domains: list[str], max_pages: int = 100):
+        self.allowed_domains = [domain.lower() for domain in allowed_domains]
+        self.max_pages = max_pages
+        self._seen: set[int] = set()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, url: str):
+        return url_fingerprint(url) in self._seen
+
+    def add(self, url: str) -> bool:
+        """Schedules the URL; False if it was seen before, is out of scope or the page budget is used up."""
+        if len(self._seen) >= self.max_pages or not host_in_domains(url_host(url), self.allowed_domains):
+            return False
+        fingerprint = url_fingerprint(url)
+        if fingerprint in self._seen:
+            return False
+        self._seen.add(fingerprint)
+        return True
@@ -0,0 +1,83 @@
+import lxml.html
+
+# Subtrees that never hold page content. Not <form>: ASP.NET WebForms pages and many CMS
+# themes wrap the whole body in one, so only the controls inside forms are skipped
+SKIPPED_TAGS = frozenset({"script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "head",
+                          "nav", "footer", "aside", "button", "select", "textarea"})
+SKIPPED_ROLES = frozenset({"navigation", "contentinfo", "search"})
+HEADING_LEVELS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+
+
+def _clean(pieces: list[str]) -> str:
+    return " ".join(" ".join(pieces).split())
+
+
+def parse_html(html) -> lxml.html.HtmlElement:
+    return lxml.html.document_fromstring(html)
+
+
+def extract_content(root, default_title: str = 'No title found') -> dict:
+    """
+    Extracts the readable text of a parsed page in one walk over the tree.
+
+    Every text node is visited exactly once, boilerplate subtrees (scripts,
+    styles, navigation, footers, form controls, ...) are skipped whole, and the text
+    is split into blocks at each heading. Returns {'title', 'content',
+    'blocks'}, where each block is {'title', 'heading_path', 'content'}:
+    the nearest heading, the headings leading to it (h1 first) and the text
+    under it.
+    """
+    title_element = root.find(".//title")
+    title = " ".join(title_element.text_content().split()) if title_element is not None else ""
+    title = title or default_title
+
+    all_pieces = []
+    blocks = []
+    heading_path = [] # (level, text) of the open headings, outermost first
+    block_pieces = []
+    heading = None # (level, pieces) while inside a heading element
+
+    def flush_block():
+        text = _clean(block_pieces)
+        if text:
+            path = [text for _, text in heading_path]
+            blocks.append({'title': path[-1] if path else title, 'heading_path': path, 'content': text})
+        block_pieces.clear()
+
+    def add_text(text):
+        if text and not text.isspace():
+            all_pieces.append(text)
+            (heading[1] if heading is not None else block_pieces).append(text)
+
+    body = root.find("body")
+    stack = [(body if body is not None else root, False)]
+    while stack:
+        element, closing = stack.pop()
+        tag = element.tag
+        if closing:
+            level = HEADING_LEVELS.get(tag)
+            if level is not None and heading is not None and heading[0] == level:
+                heading_text = _clean(heading[1])
+                heading = None
+                if heading_text:
+                    while heading_path and heading_path[-1][0] >= level:
+                        heading_path.pop()
+                    heading_path.append((level, heading_text))
+            add_text(element.tail)
+            continue
+
+        if not isinstance(tag, str) or tag in SKIPPED_TAGS or element.get("role") in SKIPPED_ROLES:
+            # Comments, processing instructions and boilerplate: only the text after them counts
+            add_text(element.tail)
+            continue
+
+        level = HEADING_LEVELS.get(tag)
+        if level is not None and heading is None:
+            flush_block() # Text so far belongs to the previous heading
+            heading = (level, [])
+        add_text(element.text)
+        stack.append((element, True))
+        stack.extend((child, False) for child in reversed(element))
+
+    flush_block()
+    return {'title': title, 'content': _clean(all_pieces), 'blocks': blocks}
@@ -0,0 +1,61 @@
+import json
+import os
+import sqlite3
+import threading
+
+from scrapy_app.crawl_frontier import url_fingerprint
+
+
+class RevalidationCache:
+    """
+    Validators (ETag, Last-Modified) of the pages each agent has stored, and
+    the links found on them, in an SQLite file that survives restarts.
+
+    Entries are keyed by (namespace, URL fingerprint); the crawl engine uses
+    the agent key as namespace, so a 304 Not Modified always means "this
+    agent already has this version of the page". The links let a site
+    crawl go on past an unchanged page without downloading it.
+    """
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL") # A lost entry only costs one full download
+        self._db.execute("CREATE TABLE IF NOT EXISTS pages (namespace TEXT NOT NULL, fingerprint INTEGER NOT NULL, etag TEXT, "
+                         "last_modified TEXT, links TEXT, PRIMARY KEY (namespace, fingerprint)) WITHOUT ROWID")
+
+    def get(self, namespace: str, url: str):
+        """{'etag', 'last_modified', 'links'} for the page, or None. links is None if they were not recorded."""
+        with self._lock:
+            row = self._db.execute("SELECT etag, last_modified, links FROM pages WHERE namespace = ? AND fingerprint = ?",
+                                   (namespace, url_fingerprint(url))).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "links": json.loads(row[2]) if row[2] is not None else None}
+
+    def put(self, namespace: str, url: str, etag: str = None, last_modified: str = None, links: list[str] = None):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                             (namespace, url_fingerprint(url), etag, last_modified, json.dumps(links) if links is not None else None))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_shared_cache = None
+
+
+def get_revalidation_cache(settings) -> RevalidationCache:
+    """Returns the process-wide cache, opened on first use at HTTP_REVALIDATION_CACHE_PATH."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = RevalidationCache(settings.get("HTTP_REVALIDATION_CACHE_PATH", "http_cache/revalidation.sqlite3"))
+    return _shared_cache
@@ -1,40 +1,101 @@
+import asyncio
+import time
+
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
 from scrapy.http import HtmlResponse
-from playwright.sync_api import sync_playwright
-import time
+
+from scrapy_app.browser_pool import get_browser_pool, close_browser_pool
+from scrapy_app.http_cache import get_revalidation_cache
+
 
 class PlaywrightMiddleware:
-    def __init__(self):
-        self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch() # You can choose 'firefox' or 'webkit'
+    """
+    Renders requests with meta['playwright'] on a page leased from the shared
+    BrowserPool instead of launching a browser per crawl. Requires the
+    asyncio Twisted reactor (see TWISTED_REACTOR in settings).
+    """
+    def __init__(self, settings):
+        self.pool = get_browser_pool(settings)
+        self.render_timeout = settings.getint("PLAYWRIGHT_RENDER_TIMEOUT", 45000) / 1000
+        self.networkidle_timeout = settings.getint("PLAYWRIGHT_NETWORKIDLE_TIMEOUT", 10000)
+        # The in-process crawl engine keeps the pool warm across crawls; a
+        # standalone `scrapy crawl` closes it with the spider.
+        self.close_pool_on_spider_close = settings.getbool("PLAYWRIGHT_CLOSE_POOL_ON_SPIDER_CLOSE", True)
 
     @classmethod
     def from_crawler(cls, crawler):
-        o = cls()
+        o = cls(crawler.settings)
         crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
         return o
 
-    def process_request(self, request, spider):
+    async def process_request(self, request, spider):
         if 'playwright' in request.meta and request.meta['playwright']:
-            page = self.browser.new_page()
             try:
-                page.goto(request.url)
-                # You can add waits for specific elements or network idle
-                # For dynamic content, waiting for a selector to appear is often better
-                page.wait_for_load_state('networkidle') # Wait for network to be idle
-                # You can also add a small fixed delay if dynamic content loads slowly
-                # time.sleep(1)
-
-                content = page.content()
-                response = HtmlResponse(url=request.url, body=content, encoding='utf-8', request=request)
-                return response
+                start = time.perf_counter()
+                status, content = await asyncio.wait_for(self._render(request), timeout=self.render_timeout)
+                request.meta['render_seconds'] = time.perf_counter() - start
+                return HtmlResponse(url=request.url, status=status, body=content, encoding='utf-8', request=request)
             except Exception as e:
-                spider.logger.error(f"Playwright error for {request.url}: {e}")
+                spider.logger.error(f"Playwright error for {request.url}: {e!r}")
                 return None # Return None to fall back to default downloader or raise an error
-            finally:
-                page.close()
         return None # Let other middlewares or default downloader handle
 
-    def spider_closed(self, spider):
-        self.browser.close()
-        self.playwright.stop()
\ No newline at end of file
+    async def _render(self, request) -> tuple[int, str]:
+        # (HTTP status of the main document, rendered HTML)
+        async with self.pool.page() as page:
+            response = await page.goto(request.url)
+            status = response.status if response is not None else 200 # None: no network response, e.g. about:blank
+            # Extra waits requested by the spider, e.g. PageMethod('wait_for_selector', 'body')
+            for page_method in request.meta.get('playwright_page_methods', []):
+                await getattr(page, page_method.method)(*page_method.args, **page_method.kwargs)
+            try:
+                # Wait for network to be idle, but never longer than the idle timeout
+                await page.wait_for_load_state('networkidle', timeout=self.networkidle_timeout)
+            except Exception:
+                pass # Pages with long-polling or analytics beacons never go idle; use what has rendered
+            return status, await page.content()
+
+    async def spider_closed(self, spider):
+        if self.close_pool_on_spider_close:
+            await close_browser_pool()
+
+
+class RevalidationMiddleware:
+    """
+    Turns plain requests for pages the agent already stored into conditional
+    requests (If-None-Match / If-Modified-Since with the validators in the
+    RevalidationCache). A 304 answer reaches the spider with the cache entry
+    in meta['cached_page'], so it can skip extraction and storage. Requests
+    without meta['cache_namespace'] and rendered requests are left alone.
+    """
+    CONDITIONAL_HEADERS = (b'If-None-Match', b'If-Modified-Since')
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("HTTP_REVALIDATION_CACHE", True):
+            raise NotConfigured
+        return cls(get_revalidation_cache(crawler.settings))
+
+    def process_request(self, request, spider):
+        # A redirect copies meta and headers from the original request; they may not fit the new URL
+        request.meta.pop('cached_page', None)
+        for header in self.CONDITIONAL_HEADERS:
+            request.headers.pop(header, None)
+        namespace = request.meta.get('cache_namespace')
+        if not namespace or request.meta.get('playwright'):
+            return None
+        entry = self.cache.get(namespace, request.url)
+        # A site crawl needs the page's links, which older entries may not have
+        if entry is None or (request.meta.get('follow_links') and entry['links'] is None):
+            return None
+        if entry['etag']:
+            request.headers[b'If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            request.headers[b'If-Modified-Since'] = entry['last_modified']
+        request.meta['cached_page'] = entry
+        request.meta['handle_httpstatus_list'] = [304] # Let the 304 through to the spider
+        return None
@@ -0,0 +1,81 @@
+import re
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from scrapy.http import HtmlResponse
+
+# Visible body text, ignoring scripts, styles and <noscript> fallbacks
+VISIBLE_TEXT_XPATH = "//body//text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::noscript) and not(ancestor::template)]"
+
+# Mount points of client-side rendered apps (React, Vue, Next.js, Nuxt, Gatsby, Angular, Svelte)
+SPA_ROOT_XPATH = ("//body//*[@id='root' or @id='app' or @id='__next' or @id='__nuxt' or @id='___gatsby' or @id='svelte'"
+                  " or @data-reactroot or @ng-app or @ng-version]")
+
+JAVASCRIPT_REQUIRED = re.compile(r"(enable|turn on|activate)\s+javascript|javascript\s+(is\s+)?(required|disabled|must be enabled)|requires\s+javascript", re.IGNORECASE)
+
+
+def needs_javascript(response, min_text_chars: int = 200) -> bool:
+    """
+    Whether a plainly downloaded HTML page only renders its content in the
+    browser: almost no visible text, an empty SPA mount point, or a
+    <noscript> notice asking for JavaScript on a page with little text.
+    """
+    if not isinstance(response, HtmlResponse): # PDF, JSON, images...: a browser would not help
+        return False
+    text_length = len(" ".join(" ".join(response.xpath(VISIBLE_TEXT_XPATH).getall()).split()))
+    if text_length < min_text_chars:
+        return True
+    for root in response.xpath(SPA_ROOT_XPATH):
+        if not "".join(root.xpath(".//text()[not(ancestor::script) and not(ancestor::noscript)]").getall()).strip():
+            return True
+    notice = " ".join(response.xpath("//noscript//text()").getall())
+    return bool(JAVASCRIPT_REQUIRED.search(notice)) and text_length < min_text_chars * 5
+
+
+def url_domain(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+class DomainRenderMemory:
+    """
+    Remembers per domain whether plain downloads had to be re-fetched through
+    the browser. Once at least `min_samples` pages of a domain were fetched
+    and `render_ratio` of them needed JavaScript, further pages of that
+    domain go straight to the browser. Bounded to `max_domains`, least
+    recently used first out.
+    """
+    def __init__(self, max_domains: int = 10000, min_samples: int = 2, render_ratio: float = 0.8):
+        self.max_domains = max_domains
+        self.min_samples = min_samples
+        self.render_ratio = render_ratio
+        self._domains: OrderedDict[str, list] = OrderedDict() # domain -> [static pages, pages that needed rendering]
+
+    def should_render(self, domain: str) -> bool:
+        counts = self._domains.get(domain)
+        if counts is None:
+            return False
+        self._domains.move_to_end(domain)
+        total = counts[0] + counts[1]
+        return total >= self.min_samples and counts[1] >= self.render_ratio * total
+
+    def record(self, domain: str, needed_rendering: bool):
+        counts = self._domains.setdefault(domain, [0, 0])
+        counts[1 if needed_rendering else 0] += 1
+        self._domains.move_to_end(domain)
+        while len(self._domains) > self.max_domains:
+            self._domains.popitem(last=False)
+
+
+_shared_memory = None
+
+
+def get_domain_render_memory(settings) -> DomainRenderMemory:
+    """Returns the process-wide memory, so the in-process crawl engine keeps it across crawls."""
+    global _shared_memory
+    if _shared_memory is None:
+        _shared_memory = DomainRenderMemory(
+            max_domains=settings.getint("RENDER_MEMORY_MAX_DOMAINS", 10000),
+            min_samples=settings.getint("RENDER_MEMORY_MIN_SAMPLES", 2),
+            render_ratio=settings.getfloat("RENDER_MEMORY_RATIO", 0.8),
+        )
+    return _shared_memory
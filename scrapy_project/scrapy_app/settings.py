@@ -20,7 +20,10 @@ ROBOTSTXT_OBEY = False # Typically set to False when using Playwright for dynami
 CONCURRENT_REQUESTS = 4
 
 # Configure a delay for requests for the same website (default: 0)
-DOWNLOAD_DELAY = 1
+# Kept at 0: a crawl job now carries many start URLs, often on the same site,
+# and a fixed per-domain delay would serialize them. AutoThrottle (below)
+# paces each site by its own response times instead.
+DOWNLOAD_DELAY = 0
 
 # Disable cookies (enabled by default)
 # COOKIES_ENABLED = False
@@ -31,6 +34,7 @@ DOWNLOAD_DELAY = 1
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
+    "scrapy_app.middlewares.RevalidationMiddleware": 700, # Conditional requests for pages already stored
     "scrapy_app.middlewares.PlaywrightMiddleware": 800, # Higher priority
 }
 
@@ -53,6 +57,45 @@ PLAYWRIGHT_LAUNCH_OPTIONS = {
 # Default navigation timeout for Playwright pages
 PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT = 30000 # 30 seconds
 
+# Shared browser pool (scrapy_app.browser_pool): one Chromium with this many
+# contexts and pages per context. Pages are recycled after PAGE_MAX_USES renders.
+PLAYWRIGHT_POOL_CONTEXTS = 2
+PLAYWRIGHT_POOL_PAGES_PER_CONTEXT = 4
+PLAYWRIGHT_POOL_PAGE_MAX_USES = 50
+# Upper bound for rendering one request, and for waiting on network idle within it
+PLAYWRIGHT_RENDER_TIMEOUT = 45000 # 45 seconds
+PLAYWRIGHT_NETWORKIDLE_TIMEOUT = 10000 # 10 seconds
+
+# Static-first fetching (see scrapy_app.render_strategy): pages are downloaded
+# plainly and only re-fetched through Playwright when they need JavaScript
+# (under STATIC_MIN_TEXT_CHARS of visible text, an empty SPA root, a noscript
+# notice) or the plain request is refused with one of STATIC_FALLBACK_STATUSES
+# (bot protection, rate limits). Set STATIC_FIRST_FETCH = False to render
+# everything.
+STATIC_FIRST_FETCH = True
+STATIC_MIN_TEXT_CHARS = 200
+STATIC_FALLBACK_ON_ERROR = True
+STATIC_FALLBACK_STATUSES = [403, 429, 503]
+# Domains where at least RATIO of MIN_SAMPLES+ pages needed rendering skip the plain download
+RENDER_MEMORY_MAX_DOMAINS = 10000
+RENDER_MEMORY_MIN_SAMPLES = 2
+RENDER_MEMORY_RATIO = 0.8
+
+# Revalidation cache (scrapy_app.http_cache): ETag/Last-Modified of the pages
+# each agent stored, so refreshing an agent sends conditional requests and
+# pages answered with 304 Not Modified are neither extracted nor re-indexed.
+# Kept out of the vector store's data directory, whose files are all agents.
+HTTP_REVALIDATION_CACHE = True
+HTTP_REVALIDATION_CACHE_PATH = "http_cache/revalidation.sqlite3"
+
+# Site crawl mode (spider argument max_depth > 0): links are followed up to
+# max_depth hops from the start URL, within allowed_domains (default: the
+# start URL's host and its subdomains) and up to max_pages pages per start URL.
+SITE_CRAWL_MAX_PAGES = 100
+
+# The Playwright middleware is async and needs the asyncio reactor
+TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
+
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item_pipeline.html
 # ITEM_PIPELINES = {
@@ -61,10 +104,13 @@ PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT = 30000 # 30 seconds
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
-# AUTOTHROTTLE_ENABLED = True
-# AUTOTHROTTLE_START_DELAY = 5
-# AUTOTHROTTLE_MAX_DELAY = 60
-# AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
+# Site crawls follow links and can request hundreds of pages of one site in a
+# job; the delay per site follows its latency, aiming at about
+# TARGET_CONCURRENCY requests in flight to it, and backs off when it slows down.
+AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_START_DELAY = 0.1
+AUTOTHROTTLE_MAX_DELAY = 10
+AUTOTHROTTLE_TARGET_CONCURRENCY = 2.0
 # AUTOTHROTTLE_DEBUG = False
 
 # Enable and configure HTTP caching (disabled by default)
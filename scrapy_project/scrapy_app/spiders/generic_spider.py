@@ -1,64 +1,161 @@
+import time
+
 import scrapy
+from scrapy.spidermiddlewares.httperror import HttpError
 from scrapy_playwright.page import PageMethod
-import re
+
+from scrapy_app.crawl_frontier import CrawlFrontier, extract_links, url_host
+from scrapy_app.extraction import extract_content
+from scrapy_app.render_strategy import get_domain_render_memory, needs_javascript, url_domain
 
 class GenericSpider(scrapy.Spider):
     name = 'generic_spider'
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, start_url=None, start_urls=None, max_depth=0, max_pages=None, crawl_domains=None,
+                 cache_namespace=None, **kwargs):
         super(GenericSpider, self).__init__(*args, **kwargs)
-        self.start_urls = [kwargs.get('start_url')] # Get URL from argument
+        # URLs come either as a list (in-process crawl engine) or, from the
+        # command line, as `-a start_url=...` / a comma-separated `-a start_urls=...`
+        if isinstance(start_urls, str):
+            start_urls = [url.strip() for url in start_urls.split(',') if url.strip()]
+        self.start_urls = list(start_urls or [])
+        if start_url:
+            self.start_urls.append(start_url)
+        # Site crawl mode: follow links up to max_depth hops from the start URLs
+        self.max_depth = int(max_depth)
+        if isinstance(crawl_domains, str):
+            crawl_domains = [domain.strip() for domain in crawl_domains.split(',') if domain.strip()]
+        self.crawl_domains = list(crawl_domains or [])
+        self.max_pages = int(max_pages) if max_pages is not None else None
+        self.frontier = None
+        # Pages are revalidated against what this namespace (the agent) already stored
+        self.cache_namespace = cache_namespace
 
     def start_requests(self):
-        self.logger.info(f"Starting Playwright request for: {self.start_urls[0]}")
-        yield scrapy.Request(
-            url=self.start_urls[0],
-            meta=dict(
+        memory = self.render_memory()
+        self.frontier = CrawlFrontier(
+            self.crawl_domains or sorted({url_host(url) for url in self.start_urls}),
+            self.max_pages if self.max_pages is not None else self.settings.getint('SITE_CRAWL_MAX_PAGES', 100),
+        )
+        for url in self.start_urls:
+            self.frontier.add(url)
+            # Plain HTTP download first; pages that turn out to need JavaScript
+            # are re-queued through Playwright in parse(). Domains that keep
+            # needing it go to the browser straight away.
+            render = not self.settings.getbool('STATIC_FIRST_FETCH', True) or memory.should_render(url_domain(url))
+            self.logger.info(f"Starting {'Playwright' if render else 'static'} request for: {url}")
+            yield self.make_request(url, render=render)
+
+    def render_memory(self):
+        return get_domain_render_memory(self.settings)
+
+    def make_request(self, url, render, dont_filter=False, depth=0):
+        # start_url lets the caller map items back to the requested URL after redirects
+        meta = dict(start_url=url, link_depth=depth, follow_links=depth < self.max_depth)
+        if self.cache_namespace:
+            meta['cache_namespace'] = self.cache_namespace
+        if render:
+            meta.update(
                 playwright=True, # Enable Playwright for this request
                 playwright_page_methods=[
                     PageMethod('wait_for_selector', 'body'), # Wait for the body to be loaded
                 ],
-                errback=self.errback, # Error callback
-            ),
+            )
+        return scrapy.Request(
+            url=url,
+            meta=meta,
             callback=self.parse,
+            errback=self.errback, # Error callback
+            dont_filter=dont_filter,
         )
 
-    async def parse(self, response): # Use async def for Playwright responses
-        self.logger.info(f"Successfully scraped content from {response.url} using Playwright.")
+    def render_fallback(self, request, reason):
+        # Same URL again, this time through the browser
+        self.crawler.stats.inc_value('fetch/static_fallback')
+        self.logger.info(f"Re-fetching {request.url} with Playwright ({reason}).")
+        return self.make_request(request.meta.get('start_url', request.url), render=True, dont_filter=True,
+                                 depth=request.meta.get('link_depth', 0))
 
-        # Get the page content after JavaScript execution
-        page_content = await response.text() # This should be the rendered HTML
+    def follow_links(self, response, links):
+        # The frontier already dropped seen and out-of-scope URLs, so Scrapy's own duplicate filter is skipped
+        if not response.meta.get('follow_links'):
+            return
+        memory = self.render_memory()
+        depth = response.meta.get('link_depth', 0) + 1
+        for url in links:
+            if self.frontier.add(url):
+                render = not self.settings.getbool('STATIC_FIRST_FETCH', True) or memory.should_render(url_domain(url))
+                yield self.make_request(url, render=render, dont_filter=True, depth=depth)
 
-        # Use BeautifulSoup to parse the HTML content
-        from bs4 import BeautifulSoup # Import locally for async compatibility if needed
-        soup = BeautifulSoup(page_content, 'html.parser')
-
-        # Extract title
-        title_tag = soup.find('title')
-        title = title_tag.get_text(strip=True) if title_tag else 'No title found'
-
-        # Extract main content
-        content_elements = soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'span', 'div'])
-
-        content_parts = []
-        for element in content_elements:
-            text = element.get_text(separator=' ', strip=True)
-            if text:
-                content_parts.append(text)
+    async def parse(self, response): # Use async def for Playwright responses
+        start_url = response.meta.get('start_url', response.url)
+        if response.status == 304:
+            # Unchanged since the agent stored it: no extraction, no storage, links from the cache
+            self.crawler.stats.inc_value('fetch/not_modified')
+            yield {'start_url': start_url, 'url': response.url, 'fetch': 'not_modified', 'not_modified': True}
+            for request in self.follow_links(response, response.meta['cached_page']['links'] or []):
+                yield request
+            return
+        if not 200 <= response.status < 300:
+            # Error pages let through by handle_httpstatus_list are not content
+            self.crawler.stats.inc_value(f'fetch/skipped_status/{response.status}')
+            self.logger.warning(f"Skipping {response.url}: HTTP {response.status}")
+            return
 
-        full_content = " ".join(content_parts)
+        rendered = bool(response.meta.get('playwright'))
+        if not rendered:
+            needed_rendering = needs_javascript(response, self.settings.getint('STATIC_MIN_TEXT_CHARS', 200))
+            self.render_memory().record(url_domain(start_url), needed_rendering)
+            if needed_rendering:
+                yield self.render_fallback(response.request, "page needs JavaScript")
+                return
+        self.crawler.stats.inc_value('fetch/rendered' if rendered else 'fetch/static')
+        self.logger.info(f"Successfully scraped content from {response.url} {'using Playwright' if rendered else 'without rendering'}.")
 
-        # Further clean up content
-        full_content = re.sub(r'\s+', ' ', full_content).strip()
-        full_content = re.sub(r'[\n\t\r]', ' ', full_content).strip()
+        # One pass over the tree Scrapy already parsed (rendered HTML for Playwright responses)
+        start = time.perf_counter()
+        extracted = extract_content(response.selector.root)
+        links = extract_links(response, response.selector.root) if response.meta.get('follow_links') else None
+        response.meta['extract_seconds'] = time.perf_counter() - start # Parsing included; read by the crawl engine's metrics
 
-        yield {
+        item = {
+            'start_url': start_url,
             'url': response.url,
-            'title': title,
-            'content': full_content,
-            'beautified_content': [{'title': title, 'content': full_content}] # Or more detailed if needed
+            'title': extracted['title'],
+            'content': extracted['content'],
+            'beautified_content': extracted['blocks'], # Text per section: {'title', 'heading_path', 'content'}
+            'fetch': 'rendered' if rendered else 'static',
         }
+        validators = self.validators(response, links) if not rendered else None
+        if validators:
+            item['validators'] = validators
+        yield item
+        for request in self.follow_links(response, links or []):
+            yield request
+
+    def validators(self, response, links):
+        # Only plain downloads: for rendered pages the HTML shell can stay the same while the content changes.
+        # The caller puts them in the revalidation cache once the page is stored (CrawlEngine.remember_validators):
+        # a page that fails to store must be downloaded again next time, not answered with 304.
+        if not self.cache_namespace or not self.settings.getbool('HTTP_REVALIDATION_CACHE', True):
+            return None
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not (etag or last_modified):
+            return None
+        return {'etag': etag and etag.decode('latin-1'), 'last_modified': last_modified and last_modified.decode('latin-1'), 'links': links}
 
-    async def errback(self, failure): # Error handling for Playwright requests
-        self.logger.error(f"Playwright request failed: {failure.request.url} - {failure.value}")
-        # You can decide how to handle failures, e.g., retry or log more details
+    def errback(self, failure): # Error handling for static and Playwright requests
+        request = failure.request
+        if not request.meta.get('playwright'):
+            # Bot protection and rate limits often refuse plain clients (403, 429, 503); a browser may still get through.
+            # Other failures (404, DNS errors, timeouts) would fail the same way in the browser.
+            status = failure.value.response.status if failure.check(HttpError) else None
+            fallback_statuses = {int(code) for code in self.settings.getlist('STATIC_FALLBACK_STATUSES', [403, 429, 503])}
+            if self.settings.getbool('STATIC_FALLBACK_ON_ERROR', True) and status in fallback_statuses:
+                self.logger.warning(f"Static request refused: {request.url} - HTTP {status}")
+                yield self.render_fallback(request, f"static request got HTTP {status}")
+                return
+            self.logger.error(f"Static request failed: {request.url} - {failure.value}")
+            return
+        self.logger.error(f"Playwright request failed: {request.url} - {failure.value}")
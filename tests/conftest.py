@@ -0,0 +1,28 @@
+import importlib
+
+import pytest
+
+from tests.support import HashingEncoder
+from utils.answer_cache import AnswerCache
+from utils.vector_store import VectorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return VectorStore(data_dir=str(tmp_path / "data"))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """
+    The app module with its own VectorStore (with the HashingEncoder) and
+    AnswerCache in tmp_path; set `llm_interaction` per test.
+    """
+    monkeypatch.chdir(tmp_path) # The app creates data/ in the working directory when first imported
+    module = importlib.import_module("app")
+    vector_store = VectorStore(data_dir=str(tmp_path / "data"), encoder=HashingEncoder())
+    answer_cache = AnswerCache()
+    vector_store.add_change_listener(answer_cache.invalidate_agent)
+    monkeypatch.setattr(module, "vector_store", vector_store)
+    monkeypatch.setattr(module, "answer_cache", answer_cache)
+    return module
@@ -0,0 +1,191 @@
+"""
+Test data and test doubles shared by the tests and the benchmarks, so
+neither has to import the other's modules. Pytest fixtures built on them
+are in conftest.py.
+"""
+import functools
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+
+WORDS = ("crawler index vector query search agent content page document token "
+         "server python scrapy render browser network latency throughput cache").split()
+
+# Words that exercise the tokenizer's special cases: contractions, stopwords,
+# punctuation, digits, non-ASCII letters and unusual whitespace
+TRICKY = ["Cannot", "gonna", "WANNA", "gotta", "lemme", "gimme", "don't", "it's", "The", "and",
+          "U.S.A.", "3.14", "e-mail", "naïve", "Straße", "İstanbul", "(brackets)", "\"quoted\"",
+          "end.", "what?!", "\t", "\n", " ", " ", "C++", "#tag", "@user", "--", "...", "x"]
+
+# Version tag that make_version puts between the words of a page version
+TAG_PATTERN = re.compile(r"qqq([a-z]+)qqq")
+HASHING_TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def alphabetic_word(i: int) -> str:
+    # Letters only, so the word survives text preprocessing (which drops digits)
+    word = ""
+    i += 26 * 27 # At least three letters, never a stopword
+    while i:
+        i, letter = divmod(i, 26)
+        word += chr(ord('a') + letter)
+    return word
+
+
+def make_documents(count: int, words_per_doc: int = 300, vocabulary_size: int = 20000, seed: int = 0, alphabetic: bool = False) -> list[str]:
+    """Synthetic documents with a Zipf-like word distribution."""
+    rng = random.Random(seed)
+    vocabulary = [alphabetic_word(i) if alphabetic else f"term{i}" for i in range(vocabulary_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocabulary_size)]
+    return [" ".join(rng.choices(vocabulary, weights=weights, k=words_per_doc)) for _ in range(count)]
+
+
+@functools.lru_cache(maxsize=4096)
+def make_version(page: int, version: int, words: int) -> str:
+    """
+    Text of one version of a page, with the version's tag (TAG_PATTERN)
+    between every 8 words, so a query result that mixes two versions of a
+    page, or differs from its page at that version, can be told apart.
+    """
+    # Vocabulary words have at most three letters, so they never match TAG_PATTERN
+    body = make_documents(1, words, vocabulary_size=2000, seed=page * 1_000_003 + version, alphabetic=True)[0].split()
+    tag = f"qqq{alphabetic_word(version)}qqq"
+    for position in range(0, len(body) + 1, 8):
+        body.insert(position, tag)
+    return " ".join(body)
+
+
+def reference_preprocess(text):
+    # The NLTK pipeline utils.text_processing replaced: word_tokenize + stopwords.words('english') per token
+    text = text.lower()
+    text = re.sub(r'[^a-zA-Z\s]', '', text)
+    words = word_tokenize(text)
+    words = [word for word in words if word not in stopwords.words('english')]
+    return " ".join(words)
+
+
+def make_corpus(count, words_per_doc=400, seed=0):
+    """Documents of WORDS and TRICKY words, for comparing preprocessing with reference_preprocess."""
+    rng = random.Random(seed)
+    vocabulary = WORDS + TRICKY
+    return [" ".join(rng.choice(vocabulary) for _ in range(words_per_doc)) for _ in range(count)]
+
+
+class HashingEncoder:
+    """
+    Deterministic stand-in for SentenceTransformerEncoder: signed feature
+    hashing of the text's words into `dim` dimensions. Needs no model
+    download; it matches words, not meaning.
+    """
+    def __init__(self, dim: int = 384):
+        self.name = f"hashing-{dim}"
+        self.dim = dim
+        self._buckets: dict[str, tuple[int, float]] = {}
+
+    def _bucket(self, word: str) -> tuple[int, float]:
+        bucket = self._buckets.get(word)
+        if bucket is None:
+            digest = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+            bucket = self._buckets[word] = (digest % self.dim, 1.0 if digest >> 63 else -1.0)
+        return bucket
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in HASHING_TOKEN_PATTERN.findall(text.lower()):
+                column, sign = self._bucket(word)
+                embeddings[row, column] += sign
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+        return embeddings
+
+
+class _BacklogHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections when more clients connect at once,
+    # and a dropped connection is only retried after a second
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class MockLLMServer:
+    """
+    Local OpenAI-compatible chat completions endpoint with a fixed latency.
+    Supports "stream": true (server-sent events) and can fail the first
+    fail_first requests with 503 to exercise client retries, and drop the
+    connection of streamed answers after break_stream_after pieces.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2, answer: str = "This is a mock answer.", fail_first: int = 0,
+                 break_stream_after: int = None):
+        server = self
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, so client connection pooling is exercised
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server.lock:
+                    server.requests += 1
+                    failing = server.requests <= fail_first
+                if failing:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                time.sleep(latency)
+                if payload.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for sent, word in enumerate(answer.split(" ")):
+                        if sent == break_stream_after:
+                            self.close_connection = True # Without the last chunk: the client sees a broken stream
+                            return
+                        event = {"choices": [{"delta": {"content": word + " "}}]}
+                        self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                else:
+                    body = json.dumps({
+                        "choices": [{"message": {"role": "assistant", "content": answer}}],
+                        "usage": {"prompt_tokens": len(json.dumps(payload)) // 4, "completion_tokens": len(answer) // 4},
+                    }).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = _BacklogHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from tests.support import make_documents
+from utils.answer_cache import ANSWER_CACHE_EVENTS, AnswerCache
+from utils.llm_interaction import IncompleteAnswerError, LLMInteraction
+from utils.metrics import metrics
+
+AGENT_KEY = "test"
+
+
+def test_lookup_after_store():
+    cache = AnswerCache()
+    cache.store(AGENT_KEY, "What is a crawler?", (5, 1500), "context", "An answer.", [])
+    assert cache.lookup(AGENT_KEY, "what is a  crawler", (5, 1500))["response"] == "An answer."
+    assert cache.lookup(AGENT_KEY, "What is a crawler?", (3, 1500)) is None
+    assert cache.lookup("other", "What is a crawler?", (5, 1500)) is None
+
+
+def test_invalidate_agent_drops_only_its_answers():
+    cache = AnswerCache()
+    cache.store(AGENT_KEY, "query", (), "context", "answer", [])
+    cache.store("other", "query", (), "context", "other answer", [])
+    cache.invalidate_agent(AGENT_KEY)
+    assert cache.lookup(AGENT_KEY, "query") is None
+    assert cache.lookup("other", "query")["response"] == "other answer"
+
+
+def test_answer_generated_across_an_invalidation_is_not_stored():
+    cache = AnswerCache()
+    generation = cache.generation(AGENT_KEY) # Taken before retrieval
+    cache.invalidate_agent(AGENT_KEY) # The corpus changed while the answer was generated
+    cache.store(AGENT_KEY, "query", (), "context", "stale answer", [], generation=generation)
+    assert cache.lookup(AGENT_KEY, "query") is None
+
+    cache.store(AGENT_KEY, "query", (), "context", "answer", [], generation=cache.generation(AGENT_KEY))
+    assert cache.lookup(AGENT_KEY, "query")["response"] == "answer"
+
+
+def test_events_are_counted():
+    events = ("hit", "miss", "eviction", "invalidation")
+    before = {event: ANSWER_CACHE_EVENTS.value(event=event) for event in events}
+    cache = AnswerCache(max_entries=1)
+    cache.store(AGENT_KEY, "first", (), "context", "answer", [])
+    cache.store(AGENT_KEY, "second", (), "context", "answer", [])
+    cache.lookup(AGENT_KEY, "first")
+    cache.lookup(AGENT_KEY, "second")
+    cache.invalidate_agent(AGENT_KEY)
+    assert {event: ANSWER_CACHE_EVENTS.value(event=event) - before[event] for event in events} == dict.fromkeys(events, 1)
+    assert "# TYPE scrap_search_answer_cache_events_total counter" in metrics.render()
+
+
+def sse(*events) -> bytes:
+    return "".join(f"data: {json.dumps(event) if isinstance(event, dict) else event}\n\n" for event in events).encode()
+
+
+def piece(text: str) -> dict:
+    return {"choices": [{"delta": {"content": text}}]}
+
+
+async def collect_stream(body: bytes) -> list[str]:
+    llm = LLMInteraction(api_key="test", max_retries=0)
+    llm._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body)))
+    llm._semaphore = asyncio.Semaphore(1)
+    try:
+        return [piece async for piece in llm.stream_ai_response("query", "context")]
+    finally:
+        await llm.aclose()
+
+
+def test_stream_with_end_marker_is_complete():
+    assert asyncio.run(collect_stream(sse(piece("An "), piece("answer."), "[DONE]"))) == ["An ", "answer."]
+
+
+def test_stream_closed_before_end_marker_is_incomplete():
+    with pytest.raises(IncompleteAnswerError):
+        asyncio.run(collect_stream(sse(piece("An "), piece("ans"))))
+
+
+class FakeLLM:
+    """Stands in for LLMInteraction; `during` runs while the answer is being generated."""
+    def __init__(self, pieces=("An ", "answer."), complete: bool = True, during=None):
+        self.pieces = pieces
+        self.complete = complete
+        self.during = during
+
+    async def get_ai_response(self, user_query: str, context: str) -> str:
+        if self.during is not None:
+            await asyncio.to_thread(self.during)
+        return "".join(self.pieces)
+
+    async def stream_ai_response(self, user_query: str, context: str):
+        for text in self.pieces:
+            yield text
+            if self.during is not None:
+                await asyncio.to_thread(self.during)
+        if not self.complete:
+            raise IncompleteAnswerError("Stream closed before [DONE].")
+
+
+def ask(app, query: str, stream: bool = False):
+    async def run():
+        response = await app.query_search(app.QuerySearchRequest(user_query=query, agent_key=AGENT_KEY, stream=stream))
+        if stream:
+            return "".join([piece async for piece in response.body_iterator])
+        return response
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def documents(app):
+    documents = make_documents(3, 300, alphabetic=True)
+    app.vector_store.store_data(AGENT_KEY, "https://example.com/0", documents[0])
+    return documents
+
+
+def test_repeated_query_is_answered_from_cache(app, monkeypatch, documents):
+    monkeypatch.setattr(app, "llm_interaction", FakeLLM())
+    query = " ".join(documents[0].split()[:8])
+    assert ask(app, query)["cached"] is False
+    assert ask(app, query)["cached"] is True
+
+
+def test_store_during_answer_is_not_cached(app, monkeypatch, documents):
+    query = " ".join(documents[0].split()[:8])
+    change = lambda: app.vector_store.store_data(AGENT_KEY, "https://example.com/1", documents[1])
+    monkeypatch.setattr(app, "llm_interaction", FakeLLM(during=change))
+    assert ask(app, query)["cached"] is False
+    assert app.answer_cache.lookup(AGENT_KEY, query, (5, 1500)) is None
+
+
+def test_store_during_streamed_answer_is_not_cached(app, monkeypatch, documents):
+    query = " ".join(documents[0].split()[:8])
+    change = lambda: app.vector_store.store_data(AGENT_KEY, "https://example.com/1", documents[1])
+    monkeypatch.setattr(app, "llm_interaction", FakeLLM(during=change))
+    assert ask(app, query, stream=True) == "An answer."
+    assert app.answer_cache.lookup(AGENT_KEY, query, (5, 1500)) is None
+
+
+def test_truncated_stream_is_not_cached(app, monkeypatch, documents):
+    query = " ".join(documents[0].split()[:8])
+    monkeypatch.setattr(app, "llm_interaction", FakeLLM(pieces=("An ", "ans"), complete=False))
+    assert ask(app, query, stream=True) == "An ans"
+    assert app.answer_cache.lookup(AGENT_KEY, query, (5, 1500)) is None
+
+    monkeypatch.setattr(app, "llm_interaction", FakeLLM())
+    assert ask(app, query, stream=True) == "An answer."
+    assert app.answer_cache.lookup(AGENT_KEY, query, (5, 1500))["response"] == "An answer."
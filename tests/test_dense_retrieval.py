@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import threading
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from tests.support import HashingEncoder, make_documents
+from utils.embeddings import DenseIndex
+from utils.vector_store import VectorStore
+
+AGENT_KEY = "test"
+
+
+class CountingEncoder(HashingEncoder):
+    def __init__(self, dim: int = 384):
+        super().__init__(dim)
+        self.encoded = 0 # Texts encoded so far
+
+    def encode(self, texts):
+        self.encoded += len(texts)
+        return super().encode(texts)
+
+
+def page_url(page: int) -> str:
+    return f"https://example.com/{page}"
+
+
+def fill(store, documents):
+    store.store_pages(AGENT_KEY, [(page_url(i), document) for i, document in enumerate(documents)])
+
+
+def queries_of(documents):
+    # A run of words from the middle of each page, so the page's own chunks are the best match
+    return [" ".join(document.split()[100:130]) for document in documents]
+
+
+def chunk_keys(chunks) -> list:
+    return [(chunk["url"], chunk["start"], chunk["end"]) for chunk in chunks]
+
+
+def current_version_dir(data_dir: str) -> str:
+    agent_dir = os.path.join(data_dir, AGENT_KEY)
+    with open(os.path.join(agent_dir, "CURRENT")) as f:
+        return os.path.join(agent_dir, f.read().strip())
+
+
+@pytest.mark.parametrize("backend", ["dense", "hybrid"])
+def test_query_finds_its_page(tmp_path, backend):
+    store = VectorStore(data_dir=str(tmp_path / "data"), default_backend=backend, encoder=HashingEncoder())
+    documents = make_documents(20, 300, alphabetic=True)
+    fill(store, documents)
+    for i, query in enumerate(queries_of(documents)):
+        assert store.retrieve_matched_chunks(AGENT_KEY, query, top_k=3)[0]["url"] == page_url(i)
+
+
+def test_hybrid_weights_dense_and_tfidf_scores(tmp_path):
+    documents = make_documents(20, 300, alphabetic=True)
+    queries = queries_of(documents)
+    results = {}
+    for name, backend, alpha in [("tfidf", "tfidf", 0.5), ("dense", "dense", 0.5), ("hybrid", "hybrid", 0.3),
+                                 ("hybrid_dense", "hybrid", 1.0), ("hybrid_tfidf", "hybrid", 0.0)]:
+        store = VectorStore(data_dir=str(tmp_path / name), default_backend=backend, encoder=HashingEncoder(), hybrid_alpha=alpha)
+        fill(store, documents)
+        results[name] = store._search_batch(store._get_snapshot(AGENT_KEY), queries, top_k=5)
+
+    for name, reference in (("hybrid_dense", "dense"), ("hybrid_tfidf", "tfidf")):
+        for matches, expected in zip(results[name], results[reference]):
+            assert [key for key, _ in matches] == [key for key, _ in expected]
+            np.testing.assert_allclose([score for _, score in matches], [score for _, score in expected], atol=1e-6)
+
+    dense = [dict(matches) for matches in results["hybrid_dense"]]
+    tfidf = [dict(matches) for matches in results["hybrid_tfidf"]]
+    checked = 0
+    for i, matches in enumerate(results["hybrid"]):
+        key, score = matches[0]
+        if key in dense[i] and key in tfidf[i]: # Otherwise one of its two scores is not in the top 5
+            assert score == pytest.approx(0.3 * dense[i][key] + 0.7 * tfidf[i][key], abs=1e-6)
+            checked += 1
+    assert checked > len(queries) // 2
+
+
+def test_quantized_index_round_trip():
+    encoder = HashingEncoder(dim=128)
+    vectors = encoder.encode(make_documents(50, 100))
+    keys = [("page", i, i + 1) for i in range(len(vectors))]
+    exact, quantized = DenseIndex(128, encoder.name), DenseIndex(128, encoder.name, quantized=True)
+    exact.add(keys, vectors)
+    quantized.add(keys, vectors)
+    query = encoder.encode(["term1 term2 term3 term10"])[0]
+    np.testing.assert_allclose(quantized.scores(query), exact.scores(query), atol=0.01)
+
+    arrays = quantized.to_arrays(keys)
+    assert arrays["embeddings"].dtype == np.int8
+    loaded = DenseIndex.from_arrays(keys, model=encoder.name, **arrays)
+    assert loaded.quantized
+    np.testing.assert_array_equal(loaded.scores(query), quantized.scores(query))
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_embeddings_are_saved_and_loaded_without_encoding(tmp_path, quantize):
+    data_dir = str(tmp_path / "data")
+    store = VectorStore(data_dir=data_dir, default_backend="dense", encoder=HashingEncoder(), quantize_embeddings=quantize)
+    documents = make_documents(10, 300, alphabetic=True)
+    fill(store, documents)
+    embeddings = np.load(os.path.join(current_version_dir(data_dir), "embeddings.npy"))
+    assert embeddings.dtype == (np.int8 if quantize else np.float32)
+    assert len(embeddings) == len(store._get_agent(AGENT_KEY).index)
+
+    encoder = CountingEncoder()
+    reloaded = VectorStore(data_dir=data_dir, encoder=encoder)
+    agent = reloaded._get_agent(AGENT_KEY)
+    assert encoder.encoded == 0
+    assert agent.backend == "dense" and agent.dense.quantized == quantize
+    for query in queries_of(documents):
+        assert chunk_keys(reloaded.retrieve_matched_chunks(AGENT_KEY, query)) == chunk_keys(store.retrieve_matched_chunks(AGENT_KEY, query))
+
+
+def test_agent_is_reencoded_when_the_model_changes(tmp_path):
+    data_dir = str(tmp_path / "data")
+    documents = make_documents(10, 300, alphabetic=True)
+    fill(VectorStore(data_dir=data_dir, default_backend="hybrid", encoder=HashingEncoder()), documents)
+
+    encoder = CountingEncoder(dim=64)
+    agent = VectorStore(data_dir=data_dir, encoder=encoder)._get_agent(AGENT_KEY)
+    assert encoder.encoded == len(agent.index)
+    assert (agent.dense.model, agent.dense.dim) == ("hashing-64", 64)
+    with open(os.path.join(current_version_dir(data_dir), "meta.json")) as f:
+        assert json.load(f)["embedding_model"] == "hashing-64" # Saved, so the next load does not encode again
+
+    encoder = CountingEncoder(dim=64)
+    VectorStore(data_dir=data_dir, encoder=encoder)._get_agent(AGENT_KEY)
+    assert encoder.encoded == 0
+
+
+class FakeLLM:
+    async def get_ai_response(self, user_query: str, context: str) -> str:
+        return "An answer."
+
+
+def test_agent_backend_switching(app, monkeypatch):
+    monkeypatch.setattr(app, "llm_interaction", FakeLLM())
+    documents = make_documents(10, 300, alphabetic=True)
+    fill(app.vector_store, documents)
+    query = queries_of(documents)[3]
+
+    def switch(backend: str, agent_key: str = AGENT_KEY):
+        return asyncio.run(app.agent_backend(app.AgentBackendRequest(agent_key=agent_key, backend=backend)))
+
+    def ask():
+        return asyncio.run(app.query_search(app.QuerySearchRequest(user_query=query, agent_key=AGENT_KEY)))
+
+    assert ask()["sources"][0]["url"] == page_url(3)
+    for backend in ("hybrid", "dense"):
+        assert switch(backend) == {"agent_key": AGENT_KEY, "backend": backend}
+        agent = app.vector_store._get_agent(AGENT_KEY)
+        assert agent.backend == backend and len(agent.dense) == len(agent.index)
+        # The switch invalidated the cached answer: the new backend retrieves again
+        response = ask()
+        assert response["cached"] is False and response["sources"][0]["url"] == page_url(3)
+    switch("tfidf")
+    assert app.vector_store._get_agent(AGENT_KEY).dense is None
+    assert VectorStore(data_dir=app.vector_store.data_dir)._get_agent(AGENT_KEY).backend == "tfidf"
+
+    with pytest.raises(HTTPException) as error:
+        switch("bm25")
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException) as error:
+        switch("dense", agent_key="missing")
+    assert error.value.status_code == 404
+
+
+def test_dense_retrieval_runs_off_the_event_loop(app, monkeypatch):
+    monkeypatch.setattr(app, "llm_interaction", FakeLLM())
+    documents = make_documents(10, 300, alphabetic=True)
+    fill(app.vector_store, documents)
+    threads = []
+    retrieve = app.vector_store.retrieve_matched_chunks
+
+    def recording_retrieve(*args):
+        threads.append(threading.current_thread())
+        return retrieve(*args)
+
+    monkeypatch.setattr(app.vector_store, "retrieve_matched_chunks", recording_retrieve)
+
+    def ask(query: str):
+        return asyncio.run(app.query_search(app.QuerySearchRequest(user_query=query, agent_key=AGENT_KEY)))
+
+    queries = queries_of(documents)
+    ask(queries[0]) # Loaded TF-IDF agent: scored in place
+    app.vector_store.set_backend(AGENT_KEY, "dense")
+    ask(queries[1]) # The query is encoded in a worker thread
+    assert len(threads) == 2
+    assert threads[0] is threading.main_thread() and threads[1] is not threading.main_thread()
+
+
+def test_ingest_sets_backend_off_the_event_loop(app, monkeypatch):
+    threads = []
+    monkeypatch.setattr(app.vector_store, "set_backend", lambda agent_key, backend: threads.append(threading.current_thread()))
+    monkeypatch.setattr(app.ingest_jobs, "submit", lambda urls, agent_key, **options: (urls, agent_key))
+    request = app.ScrapAndStoreRequest(urls="https://example.com/a", agent_key=AGENT_KEY, backend="dense")
+    assert asyncio.run(app.submit_ingest_job(request)) == (["https://example.com/a"], AGENT_KEY)
+    assert len(threads) == 1 and threads[0] is not threading.main_thread()
@@ -0,0 +1,46 @@
+from tests.support import make_documents
+from utils.fingerprints import FingerprintIndex, content_fingerprint
+
+
+def test_exact_duplicate_found_after_the_first_copy_is_removed():
+    text, other = make_documents(2, 300, alphabetic=True)
+    index = FingerprintIndex()
+    index.add("a", content_fingerprint(text))
+    index.add("b", content_fingerprint(text.upper())) # Same words, other case: the same exact hash
+    index.add("c", content_fingerprint(other))
+    index.remove("a")
+    assert index.find(content_fingerprint(text)) == ("b", "exact")
+    index.remove("b")
+    assert index.find(content_fingerprint(text)) is None
+    assert index.find(content_fingerprint(other)) == ("c", "exact")
+
+
+def test_near_duplicate_found_after_a_similar_page_is_removed():
+    text = make_documents(1, 300, alphabetic=True)[0]
+    words = text.split()
+    near = " ".join(words[:-3] + ["changed", "footer", "words"])
+    index = FingerprintIndex()
+    index.add("a", content_fingerprint(text))
+    index.add("b", content_fingerprint(text + " extra"))
+    index.remove("a")
+    assert index.find(content_fingerprint(near), 0.8) == ("b", "near")
+
+
+def test_replaced_fingerprint_is_not_found_under_the_old_text():
+    text, other = make_documents(2, 300, alphabetic=True)
+    index = FingerprintIndex()
+    index.add("a", content_fingerprint(text))
+    index.add("a", content_fingerprint(other))
+    assert len(index) == 1
+    assert index.find(content_fingerprint(text)) is None
+    assert index.find(content_fingerprint(other)) == ("a", "exact")
+
+
+def test_array_round_trip_keeps_duplicate_hashes():
+    text, other = make_documents(2, 300, alphabetic=True)
+    index = FingerprintIndex()
+    for url, page in (("a", text), ("b", text), ("c", other)):
+        index.add(url, content_fingerprint(page))
+    loaded = FingerprintIndex.from_array(["a", "b", "c"], index.to_array(["a", "b", "c"]))
+    loaded.remove("a")
+    assert loaded.find(content_fingerprint(text)) == ("b", "exact")
@@ -0,0 +1,95 @@
+import asyncio
+
+from tests.support import make_documents
+from utils.ingest_jobs import IngestJobManager
+from utils.vector_store import VectorStore
+
+AGENT_KEY = "test"
+
+
+def run_job(manager: IngestJobManager, urls: list[str], **options):
+    async def main():
+        manager.start()
+        try:
+            job = manager.submit(urls, AGENT_KEY, **options)
+            await job.done.wait()
+            return job
+        finally:
+            await manager.stop()
+    return asyncio.run(main())
+
+
+def test_validators_are_not_remembered_for_near_duplicates(tmp_path):
+    store = VectorStore(data_dir=str(tmp_path / "data"), near_duplicate_similarity=0.8)
+    words = make_documents(1, 300, alphabetic=True, seed=6)[0].split()
+    pages = {"https://example.com/a": " ".join(words),
+             "https://example.com/a?ref=1": " ".join(words).upper(),
+             "https://example.com/b": " ".join(words[:-1] + ["zzzz"])}
+
+    async def crawl(urls, cache_namespace=None, **options):
+        return [{"start_url": url, "content": content, "validators": {"etag": url}} for url, content in pages.items()]
+
+    remembered = []
+    manager = IngestJobManager(crawl, store.store_pages, remember_validators=lambda key, validators: remembered.extend(validators),
+                               not_indexed=store.near_duplicate_aliases)
+    job = run_job(manager, ["https://example.com/a"], crawl_options={"max_depth": 1})
+    assert job.url_status["https://example.com/a"]["status"] == "succeeded"
+    assert store._get_agent(AGENT_KEY).aliases == {"https://example.com/a?ref=1": "https://example.com/a",
+                                                   "https://example.com/b": "https://example.com/a"}
+    # The exact duplicate's text is indexed, under the page it duplicates
+    assert sorted(url for url, _ in remembered) == ["https://example.com/a", "https://example.com/a?ref=1"]
+
+
+def test_finished_urls_are_yielded_in_completion_order_and_released():
+    urls = [f"https://{host}.example.com/" for host in ("a", "b", "c")] # One crawl each
+    order = [urls[2], urls[0], urls[1]]
+
+    async def main():
+        gates = {url: asyncio.Event() for url in urls}
+
+        async def crawl(urls, cache_namespace=None, **options):
+            await gates[urls[0]].wait()
+            return [{"start_url": urls[0], "content": f"text of {urls[0]}"}]
+
+        manager = IngestJobManager(crawl, lambda agent_key, pages: len(pages), workers=3)
+        manager.start()
+        try:
+            job = manager.submit(urls, AGENT_KEY)
+            finished, held = [], []
+            gates[order[0]].set()
+            async for url in job.iter_finished():
+                finished.append(url)
+                assert job.release_result(url)["content"] == f"text of {url}"
+                held.append((dict(job.results), job.result_chars))
+                if len(finished) < len(order):
+                    gates[order[len(finished)]].set()
+            await job.done.wait()
+            return finished, held
+        finally:
+            await manager.stop()
+
+    finished, held = asyncio.run(main())
+    assert finished == order
+    assert held == [({}, 0)] * 3
+
+
+def test_urls_of_a_host_are_crawled_together_within_its_limit():
+    urls = [f"https://x.example.com/{page}" for page in range(3)] + [f"https://y.example.com/{page}" for page in range(2)]
+    crawls, in_flight, most_in_flight, stored = [], {}, {}, []
+
+    async def crawl(batch, cache_namespace=None, **options):
+        host = batch[0].split("/")[2]
+        crawls.append(batch)
+        in_flight[host] = in_flight.get(host, 0) + len(batch)
+        most_in_flight[host] = max(most_in_flight.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.05)
+        in_flight[host] -= len(batch)
+        return [{"start_url": url, "content": f"text of {url}"} for url in batch if url != urls[2]] # Nothing scraped for urls[2]
+
+    manager = IngestJobManager(crawl, lambda agent_key, pages: stored.append(pages), workers=4, per_host_concurrency=2)
+    job = run_job(manager, urls)
+    assert sorted(crawls) == [urls[:2], urls[2:3], urls[3:]]
+    assert most_in_flight == {"x.example.com": 2, "y.example.com": 2}
+    assert sorted(len(pages) for pages in stored) == [2, 2] # One store per crawl that scraped something
+    assert [job.url_status[url]["status"] for url in urls] == ["succeeded", "succeeded", "empty", "succeeded", "succeeded"]
+    assert job.results[urls[3]]["content"] == f"text of {urls[3]}"
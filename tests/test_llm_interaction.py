@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import pytest
+
+from tests.support import MockLLMServer
+from utils.llm_interaction import IncompleteAnswerError, LLMInteraction
+
+ANSWER = "This is a mock answer."
+
+
+def ask(server: MockLLMServer, questions: int, max_concurrency: int = 16):
+    async def main():
+        client = LLMInteraction(api_key="mock", base_url=server.url, max_concurrency=max_concurrency, backoff_base=0.01)
+        try:
+            return await asyncio.gather(*(client.get_ai_response(f"question {i}", "context") for i in range(questions)))
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_overlap():
+    latency, questions = 0.2, 16
+    with MockLLMServer(latency=latency) as server:
+        start = time.perf_counter()
+        answers = ask(server, questions)
+        elapsed = time.perf_counter() - start
+    assert answers == [ANSWER] * questions
+    # One after the other would take questions * latency (3.2s)
+    assert elapsed < questions * latency / 4
+
+
+def test_unavailable_responses_are_retried():
+    with MockLLMServer(latency=0.0, fail_first=2) as server:
+        assert ask(server, 1) == [ANSWER]
+        assert server.requests == 3
+
+
+def test_stream_is_not_retried_after_the_first_piece():
+    with MockLLMServer(latency=0.0, fail_first=1, break_stream_after=2) as server:
+        pieces = []
+
+        async def main():
+            client = LLMInteraction(api_key="mock", base_url=server.url, backoff_base=0.01)
+            try:
+                async for piece in client.stream_ai_response("question", "context"):
+                    pieces.append(piece)
+            finally:
+                await client.aclose()
+
+        with pytest.raises(IncompleteAnswerError):
+            asyncio.run(main())
+        # The 503 before the first piece was retried, the broken stream after it was not
+        assert server.requests == 2
+    assert pieces == ["This ", "is "]
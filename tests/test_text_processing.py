@@ -0,0 +1,25 @@
+import pytest
+
+from tests.support import TRICKY, make_corpus, reference_preprocess
+from utils.text_processing import preprocess_batch, preprocess_text
+
+
+def test_matches_nltk_pipeline():
+    corpus = make_corpus(40, words_per_doc=200)
+    assert preprocess_batch(corpus) == [reference_preprocess(doc) for doc in corpus]
+
+
+@pytest.mark.parametrize("word", TRICKY)
+def test_special_case_matches_nltk_pipeline(word):
+    text = f"Crawler {word} index"
+    assert preprocess_text(text) == reference_preprocess(text)
+
+
+def test_batch_matches_single_documents():
+    corpus = make_corpus(10, words_per_doc=50, seed=1)
+    assert preprocess_batch(corpus) == [preprocess_text(doc) for doc in corpus]
+
+
+def test_empty_and_stopword_only_text():
+    assert preprocess_text("") == ""
+    assert preprocess_text("The and of, it's!") == reference_preprocess("The and of, it's!")
@@ -0,0 +1,65 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from tests.support import make_documents
+from utils.tfidf_index import IncrementalTfidfIndex
+
+
+def assert_matches_refit(index, documents: dict, queries: list[str]):
+    # Scores of every document against a TfidfVectorizer fitted on exactly these documents
+    keys = list(documents)
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform([documents[key] for key in keys])
+    for query in queries:
+        scores = dict(index.search(query, top_n=len(keys)))
+        reference = cosine_similarity(vectorizer.transform([query]), matrix).ravel()
+        np.testing.assert_allclose([scores.get(key, 0.0) for key in keys], reference, atol=1e-9)
+
+
+def test_incremental_adds_match_refit():
+    documents = dict(enumerate(make_documents(200, 80)))
+    index = IncrementalTfidfIndex()
+    for key, document in documents.items():
+        index.add(key, document)
+    queries = [" ".join(document.split()[:6]) for document in make_documents(20, seed=1)]
+    assert_matches_refit(index, documents, queries)
+
+
+def test_replace_and_remove_match_refit_of_remaining():
+    documents = dict(enumerate(make_documents(150, 80)))
+    index = IncrementalTfidfIndex()
+    for key, document in documents.items():
+        index.add(key, document)
+    for key in range(0, 150, 3):
+        index.remove(key)
+        del documents[key]
+    for key, document in zip(range(1, 150, 3), make_documents(50, 80, seed=2)):
+        index.add(key, document) # Replaces the previous document under the key
+        documents[key] = document
+
+    # Query words all occur in the remaining documents, like the words of a real query usually do
+    queries = [" ".join(document.split()[10:16]) for document in list(documents.values())[:20]]
+    assert_matches_refit(index, documents, queries)
+
+
+def test_arrays_round_trip():
+    index = IncrementalTfidfIndex()
+    for key, document in enumerate(make_documents(50, 60)):
+        index.add(key, document)
+    index.remove(7)
+    arrays = index.to_arrays()
+    loaded = IncrementalTfidfIndex.from_arrays(index.keys(), arrays.pop("terms"), **arrays)
+    query = "term1 term5 term30"
+    assert loaded.search(query, top_n=10) == index.search(query, top_n=10)
+
+
+def test_snapshot_does_not_see_later_changes():
+    index = IncrementalTfidfIndex()
+    index.add("a", "crawler index vector")
+    snapshot = index.snapshot()
+    before = snapshot.search("crawler", top_n=5)
+    index.add("b", "crawler crawler page")
+    index.remove("a")
+    assert snapshot.search("crawler", top_n=5) == before
+    assert [key for key, _ in index.search("crawler", top_n=5)] == ["b"]
@@ -0,0 +1,244 @@
+import json
+import os
+import random
+import threading
+
+import pytest
+
+from tests.support import TAG_PATTERN, HashingEncoder, alphabetic_word, make_documents, make_version
+from utils.answer_cache import AnswerCache
+from utils.vector_store import VectorStore, fcntl
+
+AGENT_KEY = "test"
+
+
+def page_url(page: int) -> str:
+    return f"https://example.com/{page}"
+
+
+def random_queries(documents: list[str], count: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = rng.choice(documents).split()
+        start = rng.randrange(len(words) - 8)
+        queries.append(" ".join(words[start:start + 8]))
+    return queries
+
+
+def chunk_keys(chunks) -> list:
+    return [(chunk["url"], chunk["start"], chunk["end"], chunk["score"]) for chunk in chunks]
+
+
+def test_batch_retrieval_matches_single(store):
+    documents = make_documents(60, 400, alphabetic=True)
+    store.store_pages(AGENT_KEY, [(page_url(i), document) for i, document in enumerate(documents)])
+    queries = random_queries(documents, 40)
+    batched = store.retrieve_matched_chunks_batch(AGENT_KEY, queries, top_k=5)
+    assert [chunk_keys(chunks) for chunks in batched] == \
+        [chunk_keys(store.retrieve_matched_chunks(AGENT_KEY, query, top_k=5)) for query in queries]
+
+
+def test_unknown_agent_has_no_matches(store):
+    assert store.retrieve_matched_chunks("missing", "crawler") is None
+    assert store.retrieve_matched_chunks_batch("missing", ["crawler"]) is None
+
+
+def test_snapshot_is_not_changed_by_later_writes(store):
+    documents = make_documents(3, 300, alphabetic=True)
+    store.store_pages(AGENT_KEY, [(page_url(0), documents[0]), (page_url(1), documents[1])])
+    snapshot = store._get_snapshot(AGENT_KEY)
+    query = " ".join(documents[0].split()[:8])
+    before = snapshot.index.search(store._preprocess_text(query), top_n=5)
+
+    store.store_data(AGENT_KEY, page_url(0), documents[2])
+    store.store_data(AGENT_KEY, page_url(3), documents[0])
+    assert snapshot.index.search(store._preprocess_text(query), top_n=5) == before
+    assert snapshot.get_text(page_url(0)) == documents[0]
+    assert page_url(3) not in snapshot.urls
+    assert store._get_snapshot(AGENT_KEY).get_text(page_url(0)) == documents[2]
+
+
+def test_concurrent_queries_never_see_half_applied_writes(store):
+    pages, words = 6, 300
+    versions = {} # (page, tag) -> version
+    for page in range(pages):
+        versions[(page, TAG_PATTERN.search(make_version(page, page, words)).group(1))] = page
+        store.store_data(AGENT_KEY, page_url(page), make_version(page, page, words))
+
+    stop = threading.Event()
+    problems = []
+
+    def writer():
+        rng = random.Random(0)
+        for version in range(pages, pages + 40):
+            page = rng.randrange(pages)
+            versions[(page, TAG_PATTERN.search(make_version(page, version, words)).group(1))] = version
+            store.store_data(AGENT_KEY, page_url(page), make_version(page, version, words))
+        stop.set()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            queries = [" ".join(alphabetic_word(rng.randrange(2000)) for _ in range(6)) for _ in range(4)]
+            for chunks in store.retrieve_matched_chunks_batch(AGENT_KEY, queries):
+                for chunk in chunks:
+                    page = int(chunk["url"].rsplit("/", 1)[1])
+                    tags = set(TAG_PATTERN.findall(chunk["text"]))
+                    version = versions.get((page, tags.pop())) if len(tags) == 1 else None
+                    if version is None or make_version(page, version, words)[chunk["start"]:chunk["end"]] != chunk["text"]:
+                        problems.append(chunk)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader, args=(seed,)) for seed in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert problems == []
+
+
+def test_query_loads_evicted_agent_while_ingest_runs(store):
+    documents = make_documents(3, 300, alphabetic=True)
+    store.store_pages(AGENT_KEY, [(page_url(0), documents[0]), (page_url(1), documents[1])])
+    query = " ".join(documents[1].split()[100:130])
+    locked, queried = threading.Event(), threading.Event()
+
+    def ingest():
+        with store._ingest_lock(AGENT_KEY):
+            locked.set()
+            queried.wait(10)
+            store.store_data(AGENT_KEY, page_url(2), documents[2])
+
+    writer = threading.Thread(target=ingest)
+    writer.start()
+    locked.wait(10)
+    store._evict(AGENT_KEY) # E.g. by the memory budget, while the ingest waits for its pages
+    results = []
+    reader = threading.Thread(target=lambda: results.append(store.retrieve_matched_chunks(AGENT_KEY, query)))
+    reader.start()
+    reader.join(10)
+    blocked = reader.is_alive()
+    queried.set()
+    writer.join()
+    reader.join()
+    assert not blocked
+    assert results[0][0]["url"] == page_url(1)
+    # The ingest went on with the agent the query loaded
+    assert store._get_agent(AGENT_KEY).get_text(page_url(2)) == documents[2]
+
+
+def test_reload_matches_saved_agent(tmp_path):
+    data_dir = str(tmp_path / "data")
+    store = VectorStore(data_dir=data_dir)
+    documents = make_documents(40, 200, alphabetic=True)
+    for i, document in enumerate(documents[:30]): # One save per page, so the agent is saved as a base and deltas
+        store.store_data(AGENT_KEY, page_url(i), document)
+    for i, document in enumerate(documents[30:]):
+        store.store_data(AGENT_KEY, page_url(i), document) # Changed pages
+
+    agent = store._get_agent(AGENT_KEY)
+    reloaded = VectorStore(data_dir=data_dir)._get_agent(AGENT_KEY)
+    assert sorted(reloaded.urls) == sorted(agent.urls)
+    assert all(reloaded.get_text(url) == agent.get_text(url) for url in agent.urls)
+    assert sorted(reloaded.index.keys()) == sorted(agent.index.keys())
+    query = " ".join(documents[35].split()[:8])
+    assert reloaded.current.index.search(query, top_n=5) == agent.current.index.search(query, top_n=5)
+
+
+@pytest.mark.parametrize("backend", ["tfidf", "hybrid"])
+def test_legacy_agent_is_migrated_with_the_default_backend(tmp_path, backend):
+    data_dir = str(tmp_path / "data")
+    os.makedirs(data_dir)
+    documents = make_documents(3, 300, alphabetic=True)
+    with open(os.path.join(data_dir, f"{AGENT_KEY}.json"), 'w', encoding='utf-8') as f:
+        json.dump({"url_map": {page_url(i): document for i, document in enumerate(documents)}}, f)
+
+    store = VectorStore(data_dir=data_dir, default_backend=backend, encoder=HashingEncoder())
+    agent = store._get_agent(AGENT_KEY)
+    assert agent.backend == backend
+    assert (agent.dense is not None and len(agent.dense) == len(agent.index)) == (backend != "tfidf")
+    assert os.path.exists(os.path.join(data_dir, f"{AGENT_KEY}.json.migrated"))
+    assert VectorStore(data_dir=data_dir, encoder=HashingEncoder())._get_agent(AGENT_KEY).backend == backend
+    query = " ".join(documents[1].split()[100:130])
+    assert store.retrieve_matched_chunks(AGENT_KEY, query)[0]["url"] == page_url(1)
+
+
+def test_aliases_of_a_changed_page_are_promoted(tmp_path):
+    data_dir = str(tmp_path / "data")
+    store = VectorStore(data_dir=data_dir)
+    documents = make_documents(3, 300, alphabetic=True, seed=3)
+    store.store_pages(AGENT_KEY, [("https://example.com/a", documents[0]),
+                                  ("https://example.com/a?ref=1", documents[0].upper()),
+                                  ("https://example.com/b", documents[1])])
+    assert store._get_agent(AGENT_KEY).aliases == {"https://example.com/a?ref=1": "https://example.com/a"}
+
+    store.store_data(AGENT_KEY, "https://example.com/a", documents[2])
+    for agent in (store._get_agent(AGENT_KEY), VectorStore(data_dir=data_dir)._get_agent(AGENT_KEY)):
+        assert agent.aliases == {}
+        assert agent.get_text("https://example.com/a?ref=1") == documents[0]
+        assert agent.get_text("https://example.com/a") == documents[2]
+
+
+def test_only_exact_duplicates_become_aliases_by_default(tmp_path):
+    store = VectorStore(data_dir=str(tmp_path / "data"))
+    words = make_documents(1, 300, alphabetic=True, seed=4)[0].split()
+    near_duplicate = " ".join(words[:-1] + ["zzzz"])
+    store.store_pages(AGENT_KEY, [("https://example.com/a", " ".join(words)),
+                                  ("https://example.com/b", near_duplicate)])
+    agent = store._get_agent(AGENT_KEY)
+    assert agent.aliases == {}
+    assert agent.get_text("https://example.com/b") == near_duplicate
+
+
+def test_alias_whose_text_changed_is_indexed(tmp_path):
+    data_dir = str(tmp_path / "data")
+    store = VectorStore(data_dir=data_dir, near_duplicate_similarity=0.8)
+    words = make_documents(1, 300, alphabetic=True, seed=5)[0].split()
+    original, near_duplicate = " ".join(words), " ".join(words[:-1] + ["zzzz"])
+    store.store_pages(AGENT_KEY, [("https://example.com/a", original),
+                                  ("https://example.com/b", near_duplicate)])
+    assert store._get_agent(AGENT_KEY).aliases == {"https://example.com/b": "https://example.com/a"}
+    # The same text again is no update, although the alias resolves to another text
+    assert store.store_pages(AGENT_KEY, [("https://example.com/b", near_duplicate)]) == 0
+
+    # Still similar to the same page, but changed: indexed with its own text
+    changed = " ".join(words[:-2] + ["yyyy", "zzzz"])
+    assert store.store_pages(AGENT_KEY, [("https://example.com/b", changed)]) == 1
+    for agent in (store._get_agent(AGENT_KEY), VectorStore(data_dir=data_dir)._get_agent(AGENT_KEY)):
+        assert agent.aliases == {}
+        assert agent.get_text("https://example.com/b") == changed
+
+
+@pytest.mark.skipif(fcntl is None, reason="Shared mode needs fcntl")
+def test_shared_mode_change_reaches_other_process_cache(tmp_path):
+    # Two stores on one data directory stand for two worker processes, each with its own answer cache
+    data_dir = str(tmp_path / "data")
+    writer, reader = VectorStore(data_dir=data_dir, shared=True), VectorStore(data_dir=data_dir, shared=True)
+    reader_cache = AnswerCache()
+    reader.add_change_listener(reader_cache.invalidate_agent)
+    documents = make_documents(3, 300, alphabetic=True)
+    writer.store_data(AGENT_KEY, page_url(0), documents[0])
+
+    query = " ".join(documents[1].split()[:8])
+    reader.refresh()
+    generation = reader_cache.generation(AGENT_KEY)
+    chunks = reader.retrieve_matched_chunks(AGENT_KEY, query)
+    assert all(chunk["url"] == page_url(0) for chunk in chunks)
+    reader_cache.store(AGENT_KEY, query, (), "context", "old answer", chunks, generation=generation)
+    assert reader_cache.lookup(AGENT_KEY, query)["response"] == "old answer"
+
+    writer.store_data(AGENT_KEY, page_url(1), documents[1])
+    reader.refresh()
+    assert reader_cache.lookup(AGENT_KEY, query) is None
+    assert reader.retrieve_matched_chunks(AGENT_KEY, query)[0]["url"] == page_url(1)
+
+
+@pytest.mark.skipif(fcntl is None, reason="Shared mode needs fcntl")
+def test_shared_mode_writes_from_both_processes_are_kept(tmp_path):
+    data_dir = str(tmp_path / "data")
+    first, second = VectorStore(data_dir=data_dir, shared=True), VectorStore(data_dir=data_dir, shared=True)
+    documents = make_documents(20, 100, alphabetic=True)
+    for i, document in enumerate(documents):
+        (first if i % 2 else second).store_data(AGENT_KEY, page_url(i), document)
+    assert sorted(VectorStore(data_dir=data_dir)._get_agent(AGENT_KEY).urls) == sorted(page_url(i) for i in range(20))
+    assert sorted(first._get_agent(AGENT_KEY).urls) == sorted(second._get_agent(AGENT_KEY).urls)
@@ -0,0 +1,502 @@
+import os
+import json
+import shutil
+from collections import namedtuple
+
+import numpy as np
+
+from utils.tfidf_index import IncrementalTfidfIndex, TfidfSnapshot
+from utils.embeddings import DenseIndex, DenseSnapshot
+from utils.fingerprints import FingerprintIndex, content_fingerprint
+
+# On-disk layout of an agent directory (data/<agent_key>/):
+#   CURRENT                         name of the version directory to load, e.g. "v12"
+#   LOCK                            shared mode only: locked by the process that is writing the agent
+#   v<N>/                           one immutable version of the agent, either a base (a complete copy) or a
+#                                   delta holding only the pages changed since the version it is based on:
+#     meta.json                       format version, the version a delta is based on ("parent"), the URLs of the pages
+#                                     in this directory, all aliases, vocabulary size, retrieval backend and embedding model
+#     vocabulary.txt                  one term per line, line number = term id (deltas: only the terms added since the parent)
+#     df.npy                          bases only: document frequency per term id
+#     indptr.npy/indices.npy/counts.npy   CSR matrix of raw term counts, one row per chunk
+#     chunk_url.npy/chunk_start.npy/chunk_end.npy   URL position and character span of each chunk row
+#     texts.bin/text_offsets.npy      original page texts, UTF-8, concatenated, in URL order
+#     embeddings.npy/embedding_scales.npy   dense or hybrid agents only: embedding row (float32 or int8) and scale per chunk row
+#     fingerprints.npy                exact hash and MinHash signature per URL, in URL order (agents stored with deduplication)
+#     alias_fingerprints.npy          the same for the text of each alias, in the order of the aliases in meta.json
+# Directories written before CURRENT existed hold the files of one version directly.
+FORMAT_VERSION = 3 # 3 added deltas; format 2 directories are bases
+CHUNK_ARRAYS = ("chunk_url", "chunk_start", "chunk_end")
+EMBEDDING_ARRAYS = ("embeddings", "embedding_scales")
+BACKENDS = ("tfidf", "dense", "hybrid")
+CURRENT_FILE = "CURRENT"
+# A saved version and the ones it builds on: urls is None for the base, else the delta's pages
+Segment = namedtuple("Segment", ("name", "urls", "pages", "vocabulary_size"))
+LOAD_ATTEMPTS = 3 # Loads that lose a race with another process's save start over this many times
+VERSION_FILES = ("meta.json", "vocabulary.txt", "df.npy", "indptr.npy", "indices.npy", "counts.npy", "texts.bin", "text_offsets.npy") + \
+    tuple(f"{name}.npy" for name in CHUNK_ARRAYS + EMBEDDING_ARRAYS + ("fingerprints",))
+
+
+def _write_file(path: str, write):
+    with open(path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _fsync_dir(path: str):
+    # Makes renames and new files in the directory durable
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return # Directories cannot be opened on every platform
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _read_current(agent_dir: str):
+    # Version directory name from CURRENT, or None for the flat pre-versioning layout
+    try:
+        with open(os.path.join(agent_dir, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _chain_names(agent_dir: str, current) -> set:
+    # Names of a version and of every version it is based on
+    names = set()
+    while current is not None and current not in names:
+        names.add(current)
+        try:
+            with open(os.path.join(agent_dir, current, "meta.json"), 'r', encoding='utf-8') as f:
+                current = json.load(f).get("parent")
+        except (OSError, ValueError):
+            break
+    return names
+
+
+class TextStore:
+    """
+    Original page texts by position. Texts loaded from disk stay in the
+    memory-mapped blob (of the base, or as a (blob, start, end) slice of a
+    delta's) and are only decoded when a query returns them; texts added or
+    changed since the last load are held as strings.
+    """
+    def __init__(self, blob: np.ndarray = None, offsets: np.ndarray = None):
+        self._blob = blob
+        self._offsets = offsets
+        self._texts: list = [None] * (len(offsets) - 1 if offsets is not None else 0) # None = read from the blob
+        self._string_bytes = 0 # Characters held as strings, kept up to date for memory_bytes
+
+    def __len__(self):
+        return len(self._texts)
+
+    def __getitem__(self, position: int) -> str:
+        text = self._texts[position]
+        if text is None:
+            start, end = self._offsets[position], self._offsets[position + 1]
+            text = bytes(self._blob[start:end]).decode('utf-8')
+        elif isinstance(text, tuple):
+            blob, start, end = text
+            text = bytes(blob[start:end]).decode('utf-8')
+        return text
+
+    def __setitem__(self, position: int, text):
+        # text: a string, or a (blob, start, end) slice of a memory-mapped blob
+        old = self._texts[position]
+        if isinstance(old, str):
+            self._string_bytes -= len(old)
+        self._texts[position] = text
+        if isinstance(text, str):
+            self._string_bytes += len(text)
+
+    def append(self, text):
+        self._texts.append(None)
+        self[len(self._texts) - 1] = text
+
+    def snapshot(self) -> "TextStore":
+        # Copies the position list only; strings and the read-only blobs are shared
+        snapshot = TextStore(self._blob, self._offsets)
+        snapshot._texts = list(self._texts)
+        snapshot._string_bytes = self._string_bytes
+        return snapshot
+
+    def memory_bytes(self) -> int:
+        return self._string_bytes + len(self._texts) * 8
+
+    def write(self, blob_file, offsets_file, positions: list[int] = None):
+        """Writes the texts at the given positions (default: all, in order) and their offsets."""
+        positions = range(len(self)) if positions is None else positions
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        for i, position in enumerate(positions):
+            encoded = self[position].encode('utf-8')
+            blob_file.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+        np.save(offsets_file, offsets)
+
+
+class AgentSnapshot:
+    """
+    Immutable view of an agent that queries read from. VectorStore builds a
+    new one after every change and swaps it in with a single reference
+    assignment, so readers need no lock and never see a half-applied
+    update.
+    """
+    def __init__(self, urls: dict, texts: TextStore, index: TfidfSnapshot, dense: DenseSnapshot, backend: str, aliases: dict = None):
+        self.urls = urls
+        self.texts = texts
+        self.index = index
+        self.dense = dense
+        self.backend = backend
+        self.aliases = aliases or {}
+
+    def get_text(self, url: str) -> str:
+        return self.texts[self.urls[self.aliases.get(url, url)]]
+
+
+class AgentData:
+    """
+    Everything VectorStore keeps for one agent: its URLs, page texts, a
+    TF-IDF index over page chunks and, for the dense and hybrid backends, an
+    embedding index over the same chunks. Index keys are (url, start, end)
+    tuples, the character span of the chunk within the page text.
+
+    URLs whose content duplicates a stored page are kept as aliases of that
+    page (alias -> URL) instead of being indexed again; `fingerprints` is
+    the FingerprintIndex VectorStore finds those duplicates with, or None
+    until it is first needed. `alias_fingerprints` holds the fingerprint of
+    each alias's own text, to tell whether it still matches the page when
+    the page changes.
+
+    AgentData is only changed by one writer at a time; readers use
+    `current`, the AgentSnapshot published by the last publish().
+    """
+    def __init__(self, urls: list[str] = None, texts: TextStore = None, index: IncrementalTfidfIndex = None,
+                 dense: DenseIndex = None, backend: str = "tfidf", aliases: dict = None, fingerprints: FingerprintIndex = None):
+        self.urls: dict[str, int] = {url: position for position, url in enumerate(urls or [])} # url -> text position
+        self.aliases: dict[str, str] = dict(aliases or {}) # duplicate url -> url of the stored page
+        self.alias_fingerprints: dict[str, tuple] = {} # duplicate url -> content_fingerprint of its text
+        self.fingerprints = fingerprints
+        self.texts = texts if texts is not None else TextStore()
+        self.index = index if index is not None else IncrementalTfidfIndex()
+        self.dense = dense
+        self.backend = backend
+        self.chunks: dict[str, list[tuple]] = {} # url -> index keys of its chunks
+        for key in self.index.keys():
+            self.chunks.setdefault(key[0], []).append(key)
+        self.needs_reindex = False # Set when loaded from an older format that has no chunk index
+        self.version = 0 # Number of the version directory last saved or loaded
+        self._segments: list[Segment] = [] # The saved chain of version `version`, base first; empty if there is none to extend
+        self._saved_settings = None # _settings() as of the last save or load
+        self._changed: set[str] = set() # URLs whose text or chunks changed since the last save or load
+        self.current = None # AgentSnapshot for readers
+        self.publish()
+
+    def publish(self) -> AgentSnapshot:
+        """Takes a snapshot of the current state and makes it the one readers see."""
+        dense = self.dense.snapshot() if self.dense is not None and self.backend != "tfidf" else None
+        self.current = AgentSnapshot(dict(self.urls), self.texts.snapshot(), self.index.snapshot(), dense, self.backend, dict(self.aliases))
+        return self.current
+
+    def get_text(self, url: str) -> str:
+        return self.texts[self.urls[self.aliases.get(url, url)]]
+
+    def set_text(self, url: str, text):
+        if url in self.urls:
+            self.texts[self.urls[url]] = text
+        else:
+            self.urls[url] = len(self.texts)
+            self.texts.append(text)
+        self._changed.add(url)
+
+    def _remove_chunks(self, url: str):
+        for key in self.chunks.pop(url, []):
+            self.index.remove(key)
+            if self.dense is not None and key in self.dense:
+                self.dense.remove(key)
+
+    def set_chunks(self, url: str, spans: list[tuple[int, int]], preprocessed_chunks: list[str], embeddings=None):
+        """Replaces the indexed chunks of a URL; embeddings (one row per chunk) go to the dense index if there is one."""
+        self._remove_chunks(url)
+        self._changed.add(url)
+        keys = []
+        for (start, end), preprocessed_chunk in zip(spans, preprocessed_chunks):
+            key = (url, start, end)
+            self.index.add(key, preprocessed_chunk)
+            keys.append(key)
+        if self.dense is not None and embeddings is not None:
+            self.dense.add(keys, embeddings)
+        self.chunks[url] = keys
+
+    def memory_bytes(self) -> int:
+        dense_bytes = self.dense.memory_bytes() if self.dense is not None else 0
+        fingerprint_bytes = self.fingerprints.memory_bytes() if self.fingerprints is not None else 0
+        return self.index.memory_bytes() + self.texts.memory_bytes() + dense_bytes + fingerprint_bytes + \
+            (len(self.urls) + len(self.aliases)) * 150 + len(self.index) * 100 + len(self.alias_fingerprints) * 400
+
+    @staticmethod
+    def exists(agent_dir: str) -> bool:
+        return os.path.exists(os.path.join(agent_dir, CURRENT_FILE)) or os.path.exists(os.path.join(agent_dir, "meta.json"))
+
+    @staticmethod
+    def current_version(agent_dir: str):
+        """Version number CURRENT points at: 0 for the flat layout, None if the agent was never saved."""
+        current = _read_current(agent_dir)
+        if current is not None:
+            return int(current[1:])
+        return 0 if os.path.exists(os.path.join(agent_dir, "meta.json")) else None
+
+    def _settings(self) -> tuple:
+        # What every chunk's stored data depends on; a change means a delta cannot carry it
+        dense = (self.dense.model, self.dense.quantized) if self.dense is not None else None
+        return self.backend, dense
+
+    def save(self, agent_dir: str):
+        """
+        Writes a new version directory, then points CURRENT at it with an
+        atomic rename. A crash at any point leaves either the old or the new
+        version loadable, never a mix of the two.
+
+        A version is a base, with everything, or a delta with only the
+        pages changed since the version it builds on, so a save costs about
+        the size of the change rather than of the agent. Deltas are
+        size-tiered: a new delta takes in the pages of the deltas before it
+        that hold no more pages than it does, which keeps the chain short
+        (logarithmic in the number of pages) and rewrites each page a
+        logarithmic number of times. A delta that would hold more than half
+        as many pages as the base becomes a new base instead.
+        """
+        os.makedirs(agent_dir, exist_ok=True)
+        version = self.version + 1
+        current = _read_current(agent_dir)
+        if current is not None:
+            version = max(version, int(current[1:]) + 1)
+        version_dir = os.path.join(agent_dir, f"v{version}")
+        if os.path.exists(version_dir): # Left over from a save that crashed before switching CURRENT
+            shutil.rmtree(version_dir)
+        os.makedirs(version_dir)
+
+        # The chain on disk is only extended if it is the one this object loaded or saved
+        previous = list(self._segments) if self._segments and current == self._segments[-1].name else None
+        delta = self._plan_delta(previous)
+        if delta is None:
+            segments = [self._write_base(version_dir)]
+        else:
+            chain, pages = delta
+            segments = chain + [self._write_delta(version_dir, chain[-1], pages)]
+
+        current_path = os.path.join(agent_dir, CURRENT_FILE)
+        _write_file(f"{current_path}.tmp", lambda f: f.write(f"v{version}".encode('utf-8')))
+        os.replace(f"{current_path}.tmp", current_path)
+        _fsync_dir(agent_dir)
+        self.version = version
+        self._segments = segments
+        self._saved_settings = self._settings()
+        self._changed = set()
+
+        # Versions outside the new chain are no longer reachable. Readers that
+        # still have their files memory-mapped keep the inodes until they let
+        # go. The previous chain stays, so a process that read CURRENT just
+        # before the switch can still load it.
+        keep = {segment.name for segment in segments} | \
+            ({segment.name for segment in previous} if previous is not None else _chain_names(agent_dir, current))
+        for name in os.listdir(agent_dir):
+            path = os.path.join(agent_dir, name)
+            if name.startswith("v") and name[1:].isdigit() and name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+            elif name in VERSION_FILES or name.endswith(".tmp"):
+                os.remove(path) # Flat pre-versioning layout
+
+    def _plan_delta(self, previous):
+        # (segments the delta builds on, URLs it holds), or None when a new base is due
+        if previous is None or self._saved_settings != self._settings():
+            return None
+        chain = list(previous)
+        pages = set(self._changed)
+        while len(chain) > 1 and len(chain[-1].urls) <= len(pages):
+            pages |= chain.pop().urls
+        if 2 * len(pages) > chain[0].pages:
+            return None
+        return chain, pages
+
+    def _write_arrays(self, version_dir: str, arrays: dict, urls: list[str], keys: list, terms: list[str]):
+        # Files shared by bases and deltas: chunk rows for `keys`, texts of `urls`, and the meta
+        position = {url: i for i, url in enumerate(urls)}
+        arrays["chunk_url"] = np.array([position[url] for url, _, _ in keys], dtype=np.int32)
+        arrays["chunk_start"] = np.array([start for _, start, _ in keys], dtype=np.int64)
+        arrays["chunk_end"] = np.array([end for _, _, end in keys], dtype=np.int64)
+        if self.dense is not None:
+            arrays.update(self.dense.to_arrays(keys))
+        if self.fingerprints is not None and len(self.fingerprints) == len(self.urls):
+            arrays["fingerprints"] = self.fingerprints.to_array(urls)
+        if self.aliases:
+            arrays["alias_fingerprints"] = self._alias_fingerprint_array()
+
+        _write_file(os.path.join(version_dir, "vocabulary.txt"), lambda f: f.write("\n".join(terms).encode('utf-8')))
+        for name in ("df", "indptr", "indices", "counts") + CHUNK_ARRAYS + EMBEDDING_ARRAYS + ("fingerprints", "alias_fingerprints"):
+            if name in arrays:
+                _write_file(os.path.join(version_dir, f"{name}.npy"), lambda f, name=name: np.save(f, arrays[name]))
+        with open(os.path.join(version_dir, "text_offsets.npy"), 'wb') as offsets_file:
+            _write_file(os.path.join(version_dir, "texts.bin"),
+                        lambda f: self.texts.write(f, offsets_file, [self.urls[url] for url in urls]))
+            offsets_file.flush()
+            os.fsync(offsets_file.fileno())
+
+    def _alias_fingerprint_array(self) -> np.ndarray:
+        # Aliases saved before they had fingerprints get the one of the text they resolve to, which they matched
+        for alias in self.aliases:
+            if alias not in self.alias_fingerprints:
+                self.alias_fingerprints[alias] = content_fingerprint(self.get_text(alias))
+        fingerprints = [self.alias_fingerprints[alias] for alias in self.aliases]
+        return np.column_stack([np.array([exact for exact, _ in fingerprints], dtype=np.uint64),
+                                np.array([signature for _, signature in fingerprints]).astype(np.uint64)])
+
+    def _write_meta(self, version_dir: str, meta: dict):
+        meta.update(format=FORMAT_VERSION, backend=self.backend, vocabulary_size=len(self.index.vocabulary))
+        if self.aliases:
+            meta["aliases"] = self.aliases
+        if self.dense is not None:
+            meta["embedding_model"] = self.dense.model
+        _write_file(os.path.join(version_dir, "meta.json"), lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode('utf-8')))
+        _fsync_dir(version_dir)
+
+    def _write_base(self, version_dir: str) -> Segment:
+        urls = list(self.urls)
+        keys = self.index.keys()
+        arrays = self.index.to_arrays(keys)
+        self._write_arrays(version_dir, arrays, urls, keys, arrays["terms"])
+        self._write_meta(version_dir, {"urls": urls})
+        return Segment(os.path.basename(version_dir), None, len(urls), len(self.index.vocabulary))
+
+    def _write_delta(self, version_dir: str, parent: Segment, pages: set) -> Segment:
+        urls = sorted(pages)
+        keys = [key for url in urls for key in self.chunks.get(url, [])]
+        arrays = self.index.to_arrays(keys)
+        del arrays["df"] # Recomputed from the chunks on load
+        self._write_arrays(version_dir, arrays, urls, keys, self.index.terms(parent.vocabulary_size))
+        self._write_meta(version_dir, {"parent": parent.name, "urls": urls})
+        return Segment(os.path.basename(version_dir), frozenset(urls), len(urls), len(self.index.vocabulary))
+
+    @classmethod
+    def load(cls, agent_dir: str) -> "AgentData":
+        # Another process may save the agent meanwhile and delete the version
+        # being read; the load then starts over from the new CURRENT
+        for attempt in range(LOAD_ATTEMPTS):
+            current = _read_current(agent_dir)
+            try:
+                return cls._load_version(agent_dir, current)
+            except FileNotFoundError:
+                if attempt == LOAD_ATTEMPTS - 1 or _read_current(agent_dir) == current:
+                    raise
+
+    @classmethod
+    def _load_version(cls, agent_dir: str, current) -> "AgentData":
+        # The chain from `current` back to its base, applied base first
+        chain = []
+        name = current
+        while True:
+            version_dir = os.path.join(agent_dir, name) if name is not None else agent_dir
+            with open(os.path.join(version_dir, "meta.json"), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("format") not in (1, 2, FORMAT_VERSION):
+                raise ValueError(f"Unsupported agent data format {meta.get('format')} in {agent_dir}")
+            chain.append((name, version_dir, meta))
+            if "parent" not in meta:
+                break
+            name = meta["parent"]
+        chain.reverse()
+
+        name, version_dir, meta = chain[0]
+        agent = cls._load_base(version_dir, meta)
+        if name is not None and meta["format"] != 1:
+            agent._segments = [Segment(name, None, len(meta["urls"]), len(agent.index.vocabulary))]
+        for name, version_dir, meta in chain[1:]:
+            agent._apply_delta(name, version_dir, meta)
+        agent.backend = meta.get("backend", "tfidf")
+        agent.aliases = dict(meta.get("aliases") or {})
+        alias_fingerprints_path = os.path.join(version_dir, "alias_fingerprints.npy")
+        if agent.aliases and os.path.exists(alias_fingerprints_path):
+            array = np.load(alias_fingerprints_path)
+            agent.alias_fingerprints = {alias: (int(array[row, 0]), array[row, 1:].astype(np.uint32)) for row, alias in enumerate(agent.aliases)}
+        agent._saved_settings = agent._settings()
+        agent._changed = set()
+        agent.version = int(current[1:]) if current is not None else 0
+        if len(chain) > 1:
+            agent.publish()
+        return agent
+
+    @staticmethod
+    def _load_texts(version_dir: str):
+        blob_path = os.path.join(version_dir, "texts.bin")
+        blob = np.memmap(blob_path, dtype=np.uint8, mode='r') if os.path.getsize(blob_path) else np.zeros(0, dtype=np.uint8)
+        return blob, np.load(os.path.join(version_dir, "text_offsets.npy"), mmap_mode='r')
+
+    @staticmethod
+    def _load_chunks(version_dir: str, urls: list[str]):
+        # Index keys of the chunk rows, the new vocabulary terms, and the CSR arrays
+        chunk_arrays = [np.load(os.path.join(version_dir, f"{name}.npy")).tolist() for name in CHUNK_ARRAYS]
+        keys = [(urls[u], start, end) for u, start, end in zip(*chunk_arrays)]
+        with open(os.path.join(version_dir, "vocabulary.txt"), 'r', encoding='utf-8') as f:
+            vocabulary_text = f.read()
+        terms = vocabulary_text.split("\n") if vocabulary_text else []
+        return keys, terms
+
+    @classmethod
+    def _load_base(cls, version_dir: str, meta: dict) -> "AgentData":
+        urls = meta["urls"]
+        texts = TextStore(*cls._load_texts(version_dir))
+
+        if meta["format"] == 1:
+            # Format 1 indexed whole pages; the caller re-chunks the texts
+            agent = cls(urls, texts, backend=meta.get("backend", "tfidf"))
+            agent.needs_reindex = True
+            return agent
+
+        keys, terms = cls._load_chunks(version_dir, urls)
+        arrays = {name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode='r') for name in ("df", "indptr", "indices", "counts")}
+        index = IncrementalTfidfIndex.from_arrays(keys, terms, **arrays)
+
+        dense = None
+        if meta.get("embedding_model"):
+            embedding_arrays = {name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode='r') for name in EMBEDDING_ARRAYS}
+            dense = DenseIndex.from_arrays(keys, model=meta["embedding_model"], **embedding_arrays)
+        fingerprints = None
+        fingerprints_path = os.path.join(version_dir, "fingerprints.npy")
+        if os.path.exists(fingerprints_path):
+            fingerprints = FingerprintIndex.from_array(urls, np.load(fingerprints_path))
+        return cls(urls, texts, index, dense, meta.get("backend", "tfidf"), meta.get("aliases"), fingerprints)
+
+    def _apply_delta(self, name: str, version_dir: str, meta: dict):
+        urls = meta["urls"]
+        keys, terms = self._load_chunks(version_dir, urls)
+        if len(self.index.vocabulary) + len(terms) != meta["vocabulary_size"]:
+            raise ValueError(f"Delta {version_dir} does not match the vocabulary of the versions before it")
+        self.index.extend_vocabulary(terms)
+        indptr, indices, counts = (np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode='r') for name in ("indptr", "indices", "counts"))
+        embeddings = scales = None
+        if self.dense is not None:
+            embeddings, scales = (np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode='r') for name in EMBEDDING_ARRAYS)
+
+        blob, offsets = self._load_texts(version_dir)
+        for position, url in enumerate(urls):
+            self.set_text(url, (blob, offsets[position], offsets[position + 1]))
+            self._remove_chunks(url)
+        for row, key in enumerate(keys):
+            self.index.add_counts(key, indices[indptr[row]:indptr[row + 1]], counts[indptr[row]:indptr[row + 1]])
+            self.chunks.setdefault(key[0], []).append(key)
+        if embeddings is not None and keys:
+            self.dense.add(keys, np.asarray(embeddings), np.asarray(scales))
+
+        fingerprints_path = os.path.join(version_dir, "fingerprints.npy")
+        if self.fingerprints is not None and os.path.exists(fingerprints_path):
+            array = np.load(fingerprints_path)
+            for row, url in enumerate(urls):
+                self.fingerprints.add(url, (int(array[row, 0]), array[row, 1:].astype(np.uint32)))
+        else:
+            self.fingerprints = None # Rebuilt from the texts when needed
+        self._segments.append(Segment(name, frozenset(urls), len(urls), meta["vocabulary_size"]))
@@ -0,0 +1,175 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from scipy.sparse import vstack
+
+from utils.metrics import metrics
+
+QUERY_WORDS = re.compile(r'\w+')
+
+ANSWER_CACHE_ENTRIES = metrics.gauge("scrap_search_answer_cache_entries", "Answers held in the answer cache.")
+ANSWER_CACHE_EVENTS = metrics.counter("scrap_search_answer_cache_events_total", "Answer cache hits, misses, evictions and invalidations, by event.", ("event",))
+
+
+def normalize_query(query: str) -> str:
+    # Case, punctuation and spacing differences do not change the question
+    return " ".join(QUERY_WORDS.findall(query.lower()))
+
+
+def hash_context(context: str) -> str:
+    return hashlib.blake2b(context.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class AnswerCache:
+    """
+    TTL + LRU cache of LLM answers for /query_search.
+
+    Answers are stored under (agent_key, normalized query, hash of the
+    matched context), so an answer is only reused for exactly the context it
+    was generated from. A second map remembers which context a query last
+    matched, so a repeated query can skip retrieval as well; both are
+    dropped for an agent as soon as its corpus changes. Each invalidation
+    also moves the agent to a new generation: callers take generation()
+    before retrieving, and store() drops answers of an older generation, so
+    an answer that was still being generated when the corpus changed is not
+    cached.
+
+    With near_duplicate_threshold set, a query whose TF-IDF vector has at
+    least that cosine similarity with a cached query of the same agent is
+    answered from that query's entry.
+
+    Safe to use from several threads: invalidate_agent runs in whichever
+    thread changed the agent (an ingest worker thread, usually).
+    """
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 3600, near_duplicate_threshold: float = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._entries: OrderedDict[tuple, dict] = OrderedDict() # (agent_key, query, context hash) -> entry, most recent last
+        self._latest: dict[tuple, tuple] = {} # (agent_key, query, retrieval params) -> entry key
+        self._query_vectors: dict[str, dict[tuple, object]] = {} # agent_key -> lookup key -> TF-IDF query vector
+        self._generations: dict[str, int] = {} # agent_key -> number of invalidations so far
+        self._lock = threading.Lock() # Guards every map above; query_vector_fn is called without it
+        self.hits = 0
+        self.near_duplicate_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _get_entry(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def lookup(self, agent_key: str, query: str, params: tuple = (), query_vector_fn=None):
+        """
+        Returns the cached entry ({"response", "sources", "context"}) for a
+        query before any retrieval is done, or None. query_vector_fn returns
+        the query's TF-IDF vector and is only called for near-duplicate
+        matching after an exact miss.
+        """
+        lookup_key = (agent_key, normalize_query(query), params)
+        with self._lock:
+            key = self._latest.get(lookup_key)
+            entry = self._get_entry(key) if key is not None else None
+            if entry is not None:
+                self.hits += 1
+                ANSWER_CACHE_EVENTS.inc(event="hit")
+                return entry
+            near_duplicates = self.near_duplicate_threshold is not None and query_vector_fn is not None and bool(self._query_vectors.get(agent_key))
+
+        if near_duplicates:
+            query_vector = query_vector_fn()
+            if query_vector is not None and query_vector.nnz:
+                with self._lock:
+                    entry = self._lookup_near_duplicate(agent_key, params, query_vector)
+                    if entry is not None:
+                        self.near_duplicate_hits += 1
+                        ANSWER_CACHE_EVENTS.inc(event="near_duplicate_hit")
+                        return entry
+
+        with self._lock:
+            self.misses += 1
+        ANSWER_CACHE_EVENTS.inc(event="miss")
+        return None
+
+    def _lookup_near_duplicate(self, agent_key: str, params: tuple, query_vector):
+        candidates = [(lookup_key, vector) for lookup_key, vector in self._query_vectors.get(agent_key, {}).items() if lookup_key[2] == params and vector.shape == query_vector.shape]
+        if not candidates:
+            return None
+        # Query vectors are l2-normalized, so the dot product is the cosine similarity
+        similarities = (vstack([vector for _, vector in candidates]) @ query_vector.T).toarray().ravel()
+        best = similarities.argmax()
+        if similarities[best] < self.near_duplicate_threshold:
+            return None
+        key = self._latest.get(candidates[best][0])
+        return self._get_entry(key) if key is not None else None
+
+    def generation(self, agent_key: str) -> int:
+        return self._generations.get(agent_key, 0)
+
+    def store(self, agent_key: str, query: str, params: tuple, context: str, response: str, sources: list, query_vector=None,
+              generation: int = None):
+        lookup_key = (agent_key, normalize_query(query), params)
+        key = (agent_key, lookup_key[1], hash_context(context))
+        with self._lock:
+            if generation is not None and generation != self.generation(agent_key):
+                return # The corpus changed after the context was retrieved
+            self._entries[key] = {
+                "response": response,
+                "sources": sources,
+                "context": context,
+                "expires_at": time.monotonic() + self.ttl_seconds,
+                "lookup_keys": self._entries.get(key, {}).get("lookup_keys", set()) | {lookup_key},
+            }
+            self._entries.move_to_end(key)
+            self._latest[lookup_key] = key
+            if self.near_duplicate_threshold is not None and query_vector is not None and query_vector.nnz:
+                self._query_vectors.setdefault(agent_key, {})[lookup_key] = query_vector
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+                ANSWER_CACHE_EVENTS.inc(event="eviction")
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key)
+        vectors = self._query_vectors.get(key[0], {})
+        for lookup_key in entry["lookup_keys"]:
+            if self._latest.get(lookup_key) == key:
+                del self._latest[lookup_key]
+                vectors.pop(lookup_key, None)
+
+    def invalidate_agent(self, agent_key: str):
+        """Drops every cached answer of an agent, e.g. after its corpus changed."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == agent_key]:
+                self._remove(key)
+            self._query_vectors.pop(agent_key, None)
+            self._generations[agent_key] = self.generation(agent_key) + 1
+            self.invalidations += 1
+        ANSWER_CACHE_EVENTS.inc(event="invalidation")
+
+    def update_metrics(self):
+        # Collector for /metrics; the event counters are counted as the events happen
+        with self._lock:
+            ANSWER_CACHE_ENTRIES.set(len(self._entries))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_duplicate_hits": self.near_duplicate_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
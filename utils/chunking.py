@@ -0,0 +1,28 @@
+import re
+
+WORD_PATTERN = re.compile(r'\S+')
+
+
+def split_into_chunks(text: str, chunk_words: int = 200, overlap_words: int = 50) -> list[tuple[int, int]]:
+    """
+    Splits text into windows of chunk_words words, each overlapping the
+    previous one by overlap_words words. Returns (start, end) character
+    offsets into text, so a chunk is always text[start:end].
+    """
+    words = [match.span() for match in WORD_PATTERN.finditer(text)]
+    if not words:
+        return []
+
+    step = max(1, chunk_words - overlap_words)
+    spans = []
+    for first in range(0, len(words), step):
+        last = min(first + chunk_words, len(words)) - 1
+        spans.append((words[first][0], words[last][1]))
+        if last == len(words) - 1:
+            break
+    return spans
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English text with LLaMA-style tokenizers
+    return len(text) // 4 + 1
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import sys
+import threading
+
+from utils.metrics import metrics
+
+# The Scrapy project lives next to the API code; make it importable so the
+# spider and its settings can be loaded without a `scrapy crawl` subprocess.
+SCRAPY_PROJECT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scrapy_project")
+
+PAGES_FETCHED = metrics.counter("scrap_search_pages_fetched_total", "Responses downloaded, by fetch path (static, rendered or not_modified).", ("fetch",))
+SCRAPED_BYTES = metrics.counter("scrap_search_scraped_bytes_total", "Bytes of HTML downloaded or rendered.", ("fetch",))
+
+
+class _ItemCollector:
+    # Scrapy signals hold weak references to receivers, so the receiver needs
+    # an owner that outlives the crawl (the crawl's deferred callback keeps it).
+    def __init__(self):
+        self.items = []
+        self.stages = [] # (stage, seconds), measured in the reactor thread and recorded by the caller of crawl()
+        self.responses = [] # (fetch path, body bytes)
+
+    def response_received(self, response, request):
+        rendered = bool(request.meta.get('playwright'))
+        # Set by the downloader for static fetches and by PlaywrightMiddleware for rendered ones
+        seconds = request.meta.get('render_seconds' if rendered else 'download_latency')
+        if seconds is not None:
+            self.stages.append(("render" if rendered else "fetch_static", seconds))
+        fetch = "not_modified" if response.status == 304 else "rendered" if rendered else "static"
+        self.responses.append((fetch, len(response.body)))
+
+    def item_scraped(self, item, response):
+        self.items.append(dict(item))
+        seconds = response.meta.get('extract_seconds')
+        if seconds is not None:
+            self.stages.append(("extract", seconds))
+
+    def record_metrics(self):
+        # Runs in the caller's context, so the stages also count towards its request timings
+        for stage, seconds in self.stages:
+            metrics.observe_stage(stage, seconds)
+        for fetch, size in self.responses:
+            PAGES_FETCHED.inc(fetch=fetch)
+            SCRAPED_BYTES.inc(size, fetch=fetch)
+
+
+class CrawlEngine:
+    """
+    Long-lived Scrapy engine that runs inside the API process.
+
+    The Twisted reactor runs in a background thread and every crawl job is
+    scheduled on it, so Python startup, Scrapy imports and middleware set-up
+    are paid once instead of once per URL. A job takes a whole list of start
+    URLs and Scrapy fetches them concurrently within CONCURRENT_REQUESTS.
+    The Playwright browser pool lives on the reactor's event loop and stays
+    warm across jobs until the engine stops.
+    """
+    def __init__(self, settings_module: str = "scrapy_app.settings", settings: dict = None):
+        self.settings_module = settings_module
+        self.settings_overrides = settings or {}
+        self.settings = None # Scrapy Settings, once started
+        self._thread = None
+        self._reactor = None
+        self._runner = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        if SCRAPY_PROJECT_DIR not in sys.path:
+            sys.path.insert(0, SCRAPY_PROJECT_DIR)
+
+        from scrapy.crawler import CrawlerRunner
+        from scrapy.utils.log import configure_logging
+        from scrapy.settings import Settings
+
+        settings = Settings()
+        settings.setmodule(self.settings_module, priority="project")
+        settings.set("PLAYWRIGHT_CLOSE_POOL_ON_SPIDER_CLOSE", False, priority="project") # Closed in stop()
+        settings.setdict(self.settings_overrides, priority="cmdline")
+        # Leave the root logger to the API server; Scrapy logs still propagate to it.
+        configure_logging(settings, install_root_handler=False)
+        self.settings = settings
+
+        ready = threading.Event()
+
+        def run_reactor():
+            if settings.get("TWISTED_REACTOR"):
+                # The asyncio reactor runs on its own event loop in this thread,
+                # separate from the API server's loop
+                from scrapy.utils.reactor import install_reactor
+                asyncio.set_event_loop(asyncio.new_event_loop())
+                install_reactor(settings.get("TWISTED_REACTOR"), settings.get("ASYNCIO_EVENT_LOOP"))
+            from twisted.internet import reactor
+            self._reactor = reactor
+            self._runner = CrawlerRunner(settings)
+            reactor.callWhenRunning(ready.set)
+            reactor.run(installSignalHandlers=False) # Signals can only be installed from the main thread
+
+        self._thread = threading.Thread(target=run_reactor, name="crawl-engine", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._reactor.callFromThread(self._stop_reactor)
+        self._thread.join(timeout=30)
+        self._thread = None
+
+    def _stop_reactor(self):
+        from scrapy.utils.defer import deferred_from_coro
+        from scrapy_app.browser_pool import close_browser_pool
+
+        d = self._runner.stop()
+        d.addBoth(lambda _: deferred_from_coro(close_browser_pool()))
+        d.addBoth(lambda _: self._reactor.stop())
+
+    async def crawl(self, urls: list[str], **spider_kwargs) -> list[dict]:
+        """
+        Crawls all the given URLs in a single Scrapy job and returns the scraped
+        items. Each item carries the 'start_url' it was requested for.
+        spider_kwargs go to GenericSpider: max_depth, max_pages and
+        crawl_domains for a site crawl, cache_namespace for revalidation.
+        With a cache_namespace, items of plain downloads that came with
+        validators carry them as 'validators'; see remember_validators().
+        """
+        if self._thread is None:
+            raise RuntimeError("Crawl engine is not running.")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._reactor.callFromThread(self._schedule_crawl, list(urls), spider_kwargs, loop, future)
+        collector = await future
+        collector.record_metrics()
+        return collector.items
+
+    def remember_validators(self, namespace: str, pages: list):
+        """
+        Puts the validators of stored pages, [(start_url, item['validators']), ...],
+        in the revalidation cache, so later crawls for `namespace` ask for them
+        conditionally. Only for pages the agent has stored: a 304 answer
+        means "the agent already has this version".
+        """
+        from scrapy_app.http_cache import get_revalidation_cache
+
+        cache = get_revalidation_cache(self.settings)
+        for url, validators in pages:
+            cache.put(namespace, url, validators['etag'], validators['last_modified'], validators['links'])
+
+    def _schedule_crawl(self, urls, spider_kwargs, loop, future):
+        # Runs in the reactor thread.
+        from scrapy import signals
+        from scrapy_app.spiders.generic_spider import GenericSpider
+
+        collector = _ItemCollector()
+        try:
+            crawler = self._runner.create_crawler(GenericSpider)
+            crawler.signals.connect(collector.item_scraped, signal=signals.item_scraped)
+            crawler.signals.connect(collector.response_received, signal=signals.response_received)
+            d = self._runner.crawl(crawler, start_urls=urls, **spider_kwargs)
+        except Exception as e:
+            loop.call_soon_threadsafe(_resolve_future, future, None, e)
+            return
+
+        def on_success(_):
+            loop.call_soon_threadsafe(_resolve_future, future, collector, None)
+
+        def on_failure(failure):
+            loop.call_soon_threadsafe(_resolve_future, future, None, failure.value)
+
+        d.addCallbacks(on_success, on_failure)
+
+
+def _resolve_future(future, result, error):
+    if future.done(): # The awaiting request may have been cancelled
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
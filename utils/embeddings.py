@@ -0,0 +1,196 @@
+import numpy as np
+
+from utils.tfidf_index import top_indices
+
+
+class SentenceTransformerEncoder:
+    """
+    Batched CPU encoder around a sentence-transformers model. The model is
+    loaded on first use, so agents that only use TF-IDF never import torch.
+    Embeddings are l2-normalized float32 rows.
+    """
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", batch_size: int = 64, device: str = "cpu"):
+        self.name = model_name
+        self.batch_size = batch_size
+        self.device = device
+        self._model = None
+
+    def _get_model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.name, device=self.device)
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return self._get_model().get_sentence_embedding_dimension()
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        embeddings = self._get_model().encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                              normalize_embeddings=True, show_progress_bar=False)
+        return embeddings.astype(np.float32, copy=False)
+
+
+def quantize_rows(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization: vectors ~= rows * scales[:, None]."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    rows = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return rows, scales.astype(np.float32)
+
+
+class DenseSnapshot:
+    """
+    Read-only view of a DenseIndex at one point in time. It shares the
+    index's buffers until the index next changes, at which point the index
+    copies them before writing (copy-on-write), so the view never changes.
+    """
+    def __init__(self, keys: list, matrix: np.ndarray, scales: np.ndarray, model: str, quantized: bool):
+        self._keys = keys
+        self._matrix = matrix
+        self._scales = scales
+        self.model = model
+        self.quantized = quantized
+        self._aligned = None # (keys list, rows) cached for scores(keys=...)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def scores(self, query_vector: np.ndarray, keys: list = None) -> np.ndarray:
+        """
+        Cosine similarity of every row with the query, in the order of `keys`
+        (default: keys()). A 2-d array of query vectors (one per row) gives
+        one column per query from a single matrix product.
+        """
+        similarities = self._matrix @ query_vector.astype(np.float32).T
+        if self.quantized:
+            similarities *= self._scales[:, None] if similarities.ndim == 2 else self._scales
+        if keys is None:
+            return similarities
+        aligned = self._aligned
+        if aligned is None or aligned[0] is not keys:
+            rows = {key: row for row, key in enumerate(self._keys)}
+            aligned = self._aligned = (keys, np.fromiter((rows[key] for key in keys), dtype=np.int64, count=len(keys)))
+        return similarities[aligned[1]]
+
+    def search(self, query_vector: np.ndarray, top_n: int = 1) -> list:
+        """Returns up to top_n (key, cosine similarity) pairs, best first."""
+        similarities = self.scores(query_vector)
+        return [(self._keys[i], float(similarities[i])) for i in top_indices(similarities, top_n)]
+
+    def search_batch(self, query_vectors: np.ndarray, top_n: int = 1) -> list[list]:
+        """search() for a 2-d array of query vectors. Returns one result list per query."""
+        similarities = self.scores(query_vectors)
+        return [[(self._keys[i], float(column[i])) for i in top_indices(column, top_n)] for column in similarities.T]
+
+
+class DenseIndex:
+    """
+    Embedding matrix of an agent's chunks, one row per index key.
+
+    Rows are float32, or int8 with a float32 scale per row when quantized
+    (4x smaller, scores within about 1% of float32). Search is one
+    matrix-vector product plus argpartition for the top k, on a
+    DenseSnapshot. Removing a key moves the last row into its place, so
+    updates never rebuild the matrix.
+    """
+    def __init__(self, dim: int, model: str, quantized: bool = False):
+        self.dim = dim
+        self.model = model
+        self.quantized = quantized
+        self._keys: list = []
+        self._rows: dict = {} # key -> row
+        self._matrix = np.zeros((0, dim), dtype=np.int8 if quantized else np.float32) # Capacity may exceed len(keys)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._snapshot = None # Cached DenseSnapshot; while set, its buffers must not be written
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def keys(self) -> list:
+        return list(self._keys)
+
+    def _reserve(self, rows: int):
+        # Copy before writing when the buffers are too small, memory-mapped or seen by a snapshot
+        if rows <= len(self._matrix) and self._matrix.flags.writeable and self._snapshot is None:
+            return
+        capacity = max(rows, 2 * len(self._matrix), 64) if rows > len(self._matrix) else len(self._matrix)
+        matrix = np.zeros((capacity, self.dim), dtype=self._matrix.dtype)
+        matrix[:len(self._keys)] = self._matrix[:len(self._keys)]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[:len(self._keys)] = self._scales[:len(self._keys)]
+        self._matrix, self._scales = matrix, scales
+        self._snapshot = None
+
+    def add(self, keys: list, vectors: np.ndarray, scales: np.ndarray = None):
+        """
+        Adds or replaces the rows of the given keys. With scales, `vectors`
+        are rows as stored (int8 when quantized) and their scales, e.g. from
+        to_arrays.
+        """
+        for key in keys:
+            if key in self._rows:
+                self.remove(key)
+        start = len(self._keys)
+        self._reserve(start + len(keys))
+        if self.quantized:
+            rows, scales = quantize_rows(vectors) if scales is None else (vectors, scales)
+            self._matrix[start:start + len(keys)] = rows
+            self._scales[start:start + len(keys)] = scales
+        else:
+            self._matrix[start:start + len(keys)] = vectors
+        for offset, key in enumerate(keys):
+            self._rows[key] = start + offset
+        self._keys.extend(keys)
+
+    def remove(self, key):
+        self._reserve(len(self._keys))
+        row = self._rows.pop(key)
+        last = len(self._keys) - 1
+        if row != last:
+            moved = self._keys[last]
+            self._matrix[row] = self._matrix[last]
+            self._scales[row] = self._scales[last]
+            self._keys[row] = moved
+            self._rows[moved] = row
+        self._keys.pop()
+
+    def snapshot(self) -> DenseSnapshot:
+        """The current rows as an immutable DenseSnapshot; repeated calls share one until the next change."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            n = len(self._keys)
+            snapshot = self._snapshot = DenseSnapshot(list(self._keys), self._matrix[:n], self._scales[:n], self.model, self.quantized)
+        return snapshot
+
+    def scores(self, query_vector: np.ndarray, keys: list = None) -> np.ndarray:
+        return self.snapshot().scores(query_vector, keys)
+
+    def search(self, query_vector: np.ndarray, top_n: int = 1) -> list:
+        return self.snapshot().search(query_vector, top_n)
+
+    def search_batch(self, query_vectors: np.ndarray, top_n: int = 1) -> list[list]:
+        return self.snapshot().search_batch(query_vectors, top_n)
+
+    def memory_bytes(self) -> int:
+        return self._matrix.nbytes + self._scales.nbytes + len(self._keys) * 100
+
+    def to_arrays(self, keys: list) -> dict:
+        """Embedding rows (and scales) in the given key order."""
+        rows = np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        return {"embeddings": self._matrix[rows], "embedding_scales": self._scales[rows]}
+
+    @classmethod
+    def from_arrays(cls, keys: list, embeddings: np.ndarray, embedding_scales: np.ndarray, model: str):
+        """Rebuilds an index saved with to_arrays; memory-mapped arrays stay mapped until the first change."""
+        index = cls(embeddings.shape[1], model, quantized=embeddings.dtype == np.int8)
+        index._matrix = embeddings
+        index._scales = embedding_scales
+        index._keys = list(keys)
+        index._rows = {key: row for row, key in enumerate(keys)}
+        return index
@@ -0,0 +1,199 @@
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+SHINGLE_WORDS = 3 # MinHash features are runs of this many words
+NUM_HASHES = 64 # MinHash signature length
+BANDS = 16 # LSH bands of NUM_HASHES // BANDS signature values each
+
+# Random odd multipliers and offsets; fixed, so signatures stay comparable across restarts
+_rng = np.random.default_rng(20240611)
+_SHINGLE_MULTIPLIERS = _rng.integers(1, 2**63, size=SHINGLE_WORDS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_MULTIPLIERS = _rng.integers(1, 2**63, size=NUM_HASHES, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_OFFSETS = _rng.integers(0, 2**63, size=NUM_HASHES, dtype=np.uint64)
+_MIX = np.uint64(0xBF58476D1CE4E5B9)
+_BAND_SALTS = _rng.integers(0, 2**63, size=BANDS, dtype=np.uint64)
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+@lru_cache(maxsize=2**16)
+def _word_hash(word: str) -> int:
+    return _hash64(word.encode("utf-8"))
+
+
+def _shingle_hashes(words: list[str]) -> np.ndarray:
+    # Word hashes combined per shingle with numpy instead of hashing every shingle string
+    hashes = np.fromiter(map(_word_hash, words), dtype=np.uint64, count=len(words))
+    count = max(len(words) - SHINGLE_WORDS + 1, 1)
+    shingles = np.zeros(count, dtype=np.uint64)
+    for position, multiplier in enumerate(_SHINGLE_MULTIPLIERS[:len(words)]):
+        shingles += hashes[position:position + count] * multiplier
+    shingles ^= shingles >> np.uint64(31) # Mixes the sum so the MinHash functions below do not see a linear combination
+    shingles *= _MIX
+    return np.unique(shingles)
+
+
+def exact_hash(text: str) -> int:
+    """The exact hash of content_fingerprint(text), without the signature."""
+    return _hash64(" ".join(text.lower().split()).encode("utf-8"))
+
+
+def content_fingerprint(text: str) -> tuple[int, np.ndarray]:
+    """
+    (exact hash, MinHash signature) of a page text.
+
+    The exact hash covers the lowercased, whitespace-separated words, so
+    whitespace and case changes do not matter. The signature holds the
+    minimum of each of NUM_HASHES hash functions over the page's
+    overlapping word shingles; the share of positions two signatures agree
+    on estimates the Jaccard similarity of the two pages' shingle sets.
+    """
+    words = text.lower().split()
+    exact = _hash64(" ".join(words).encode("utf-8"))
+    if not words:
+        return exact, np.zeros(NUM_HASHES, dtype=np.uint32)
+    # a * h + b wraps around modulo 2**64, which is what makes it a permutation of the hash values;
+    # the top 32 bits of each minimum are kept
+    hashes = _MULTIPLIERS[:, None] * _shingle_hashes(words)
+    hashes += _OFFSETS[:, None]
+    signature = (hashes.min(axis=1) >> np.uint64(32)).astype(np.uint32)
+    return exact, signature
+
+
+def similarity(a: tuple[int, np.ndarray], b: tuple[int, np.ndarray]) -> float:
+    """Estimated similarity of the texts of two fingerprints: 1.0 for the same text, else the share of signature values they agree on."""
+    if a[0] == b[0]:
+        return 1.0
+    return float((a[1] == b[1]).mean())
+
+
+class FingerprintIndex:
+    """
+    Content fingerprints of an agent's pages, for finding the page a new
+    text duplicates without comparing it against every page.
+
+    Exact duplicates are a dict lookup. Near-duplicates use locality
+    sensitive hashing: the signature is cut into BANDS bands, and a table
+    maps each band's values to the pages that have them, so only pages that
+    agree on a whole band are compared. Pages with a Jaccard similarity of
+    0.8 share a band with probability above 0.999; unrelated pages almost
+    never do. Signatures sit in one matrix, a row per page.
+    """
+    def __init__(self):
+        self._rows: dict[str, int] = {} # url -> row
+        self._urls: list = [] # row -> url, None for free rows
+        self._free_rows: list[int] = []
+        self._exact = np.zeros(0, dtype=np.uint64)
+        self._signatures = np.zeros((0, NUM_HASHES), dtype=np.uint32)
+        self._exact_rows: dict[int, object] = {} # exact hash -> row, or list of rows when several pages have the same text
+        self._band_rows: dict[int, object] = {} # band key -> row, or list of rows when several pages share it
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, url: str):
+        return url in self._rows
+
+    @staticmethod
+    def _band_keys(signature: np.ndarray) -> list[int]:
+        # Each band's values folded into one integer, with the band number mixed in; collisions only add candidates
+        words = np.ascontiguousarray(signature).view(np.uint64).reshape(BANDS, -1) # Two signature values per uint64
+        keys = words[:, 0] + _BAND_SALTS
+        for column in range(1, words.shape[1]):
+            keys = keys * _MIX + words[:, column]
+        return keys.tolist()
+
+    def add(self, url: str, fingerprint: tuple[int, np.ndarray]):
+        self.remove(url)
+        exact, signature = fingerprint
+        if self._free_rows:
+            row = self._free_rows.pop()
+            self._urls[row] = url
+        else:
+            row = len(self._urls)
+            self._urls.append(url)
+            if row == len(self._exact): # Grow the arrays by doubling
+                size = max(16, 2 * row)
+                self._exact = np.resize(self._exact, size)
+                self._signatures = np.resize(self._signatures, (size, NUM_HASHES))
+        self._rows[url] = row
+        self._exact[row] = exact
+        self._signatures[row] = signature
+        self._add_row(self._exact_rows, exact, row)
+        for key in self._band_keys(signature):
+            self._add_row(self._band_rows, key, row)
+
+    def remove(self, url: str):
+        row = self._rows.pop(url, None)
+        if row is None:
+            return
+        self._remove_row(self._exact_rows, int(self._exact[row]), row)
+        for key in self._band_keys(self._signatures[row]):
+            self._remove_row(self._band_rows, key, row)
+        self._urls[row] = None
+        self._free_rows.append(row)
+
+    @staticmethod
+    def _add_row(table: dict, key: int, row: int):
+        rows = table.get(key)
+        if rows is None:
+            table[key] = row
+        elif isinstance(rows, list):
+            rows.append(row)
+        else:
+            table[key] = [rows, row]
+
+    @staticmethod
+    def _remove_row(table: dict, key: int, row: int):
+        rows = table[key]
+        if isinstance(rows, list):
+            rows.remove(row)
+            if len(rows) == 1:
+                table[key] = rows[0]
+        else:
+            del table[key]
+
+    def find(self, fingerprint: tuple[int, np.ndarray], min_similarity: float = None):
+        """
+        URL of a page with the same text, or else of the most similar page
+        whose estimated similarity is at least min_similarity (None: exact
+        only). Returns (url, "exact" or "near"), or None.
+        """
+        exact, signature = fingerprint
+        rows = self._exact_rows.get(exact)
+        if rows is not None:
+            return self._urls[rows[0] if isinstance(rows, list) else rows], "exact"
+        if min_similarity is None:
+            return None
+        candidates = set()
+        for key in self._band_keys(signature):
+            rows = self._band_rows.get(key)
+            if rows is not None:
+                candidates.update(rows if isinstance(rows, list) else (rows,))
+        if not candidates:
+            return None
+        rows = np.array(sorted(candidates))
+        similarities = (self._signatures[rows] == signature).mean(axis=1)
+        best = int(np.argmax(similarities))
+        return (self._urls[rows[best]], "near") if similarities[best] >= min_similarity else None
+
+    def memory_bytes(self) -> int:
+        return self._signatures.nbytes + self._exact.nbytes + len(self._rows) * (250 + BANDS * 75)
+
+    def to_array(self, urls: list[str]) -> np.ndarray:
+        """One row per URL, in the order of `urls` (which must all have a fingerprint): exact hash, then the signature."""
+        rows = np.array([self._rows[url] for url in urls], dtype=np.int64)
+        return np.column_stack([self._exact[rows], self._signatures[rows].astype(np.uint64)])
+
+    @classmethod
+    def from_array(cls, urls: list[str], array: np.ndarray) -> "FingerprintIndex":
+        index = cls()
+        exact = array[:, 0].tolist()
+        signatures = array[:, 1:].astype(np.uint32)
+        for row, url in enumerate(urls):
+            index.add(url, (exact[row], signatures[row]))
+        return index
@@ -0,0 +1,390 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from utils.metrics import format_timings, metrics
+
+# Status of a single URL within a job
+URL_QUEUED = "queued"
+URL_RUNNING = "running"
+URL_SUCCEEDED = "succeeded"
+URL_EMPTY = "empty" # Crawled, but nothing was scraped
+URL_UNCHANGED = "unchanged" # Every page answered 304 Not Modified: the agent already has it
+URL_FAILED = "failed"
+
+INGESTED_URLS = metrics.counter("scrap_search_ingested_urls_total", "URLs processed by ingest workers, by outcome.", ("status",))
+INGEST_PENDING_URLS = metrics.gauge("scrap_search_ingest_pending_urls", "URLs queued and not yet picked up by a worker.")
+INGEST_RUNNING_JOBS = metrics.gauge("scrap_search_ingest_running_jobs", "Ingest jobs not finished yet.")
+INGEST_REJECTED_JOBS = metrics.counter("scrap_search_ingest_rejected_jobs_total", "Jobs refused because the ingest queue was full.")
+
+# Status of a job
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed" # Every URL succeeded (or was unchanged)
+JOB_PARTIAL = "partial" # Some URLs succeeded
+JOB_FAILED = "failed" # No URL succeeded
+
+URL_DONE = (URL_SUCCEEDED, URL_UNCHANGED, URL_EMPTY, URL_FAILED)
+
+
+class IngestQueueFull(Exception):
+    """Raised by submit() when the queue has no room for all URLs of a job."""
+
+
+def result_chars(result: dict) -> int:
+    # Characters of page text a result holds: its content, and the content and sections of each scraped item
+    items = result.get("beautified_content") or []
+    return len(result.get("content") or "") + sum(
+        len(item.get("content") or "") + sum(len(block.get("content") or "") for block in item.get("beautified_content") or [])
+        for item in items)
+
+
+class IngestJob:
+    """
+    One scrape-and-store request. Without keep_content, results only record
+    each URL's content length, so a large job holds no page text once the
+    text is stored.
+
+    crawl_options (max_depth, max_pages, crawl_domains) turn each URL into
+    the start of a site crawl; every page found is stored under its own URL.
+
+    Results can be dropped once passed on (release_result, drop_results);
+    a job whose results were dropped still reports its status and progress.
+    """
+    def __init__(self, urls: list[str], agent_key: str, keep_content: bool = True, crawl_options: dict = None):
+        self.job_id = str(uuid.uuid4())
+        self.agent_key = agent_key
+        self.urls = urls
+        self.keep_content = keep_content
+        self.crawl_options = crawl_options or {}
+        self.url_status = {url: {"url": url, "status": URL_QUEUED, "error": None} for url in urls}
+        self.results = {} # url -> {"url", "content", "beautified_content"}, or {"url", "content_length"}
+        self.result_chars = 0 # Page text held in results
+        self.results_dropped = False
+        self.finished_urls = [] # In the order they finished
+        self._url_finished = asyncio.Event() # Replaced by a fresh event every time a URL finishes
+        self.fetch_stats = {"static": 0, "rendered": 0, "not_modified": 0}
+        self.timings = {} # stage -> seconds, summed over the job's URLs
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    @property
+    def status(self) -> str:
+        if not self.done.is_set():
+            return JOB_RUNNING if self.started_at is not None else JOB_QUEUED
+        succeeded = sum(1 for entry in self.url_status.values() if entry["status"] in (URL_SUCCEEDED, URL_UNCHANGED))
+        if succeeded == len(self.urls):
+            return JOB_COMPLETED
+        return JOB_PARTIAL if succeeded else JOB_FAILED
+
+    def make_result(self, url: str, content: str = None, items: list = None) -> dict:
+        if not self.keep_content:
+            return {"url": url, "content_length": len(content) if items else 0}
+        if not items:
+            return {"url": url, "content": "No content scraped.", "beautified_content": []}
+        return {"url": url, "content": content, "beautified_content": items}
+
+    def add_result(self, url: str, result: dict):
+        if self.results_dropped:
+            return
+        self.results[url] = result
+        self.result_chars += result_chars(result)
+
+    def finish_url(self, url: str):
+        self.finished_urls.append(url)
+        event, self._url_finished = self._url_finished, asyncio.Event()
+        event.set()
+
+    async def iter_finished(self):
+        """Yields the job's URLs as they finish (succeed, come back empty or fail), until all have."""
+        sent = 0
+        while True:
+            while sent < len(self.finished_urls):
+                yield self.finished_urls[sent]
+                sent += 1
+            if sent == len(self.urls):
+                return
+            await self._url_finished.wait()
+
+    def release_result(self, url: str) -> dict:
+        # For callers that pass each result on as it arrives; the job no longer keeps it
+        result = self.results.pop(url, {})
+        self.result_chars -= result_chars(result)
+        return result
+
+    def drop_results(self):
+        # For callers that have passed all results on, and to keep retained jobs within the manager's budget.
+        # Results of URLs that finish later are not kept either.
+        self.results = {}
+        self.result_chars = 0
+        self.results_dropped = True
+
+    def progress(self) -> dict:
+        counts = {"total": len(self.urls), URL_QUEUED: 0, URL_RUNNING: 0, URL_SUCCEEDED: 0, URL_UNCHANGED: 0, URL_EMPTY: 0, URL_FAILED: 0}
+        for entry in self.url_status.values():
+            counts[entry["status"]] += 1
+        return counts
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        job = {
+            "job_id": self.job_id,
+            "agent_key": self.agent_key,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress(),
+            "urls": list(self.url_status.values()),
+            "fetch_stats": self.fetch_stats,
+            "timings": format_timings(self.timings),
+        }
+        if include_results:
+            # Same shape as the scrapped_content of /scrap_and_store, for the URLs finished so far
+            job["scrapped_content"] = [self.results[url] for url in self.urls if url in self.results]
+        if self.results_dropped:
+            job["results_dropped"] = True
+        return job
+
+
+class IngestJobManager:
+    """
+    Runs scrape-and-store jobs in the background.
+
+    submit() queues every URL of a job and returns at once. A fixed pool of
+    `workers` tasks takes URLs off a queue bounded to `queue_depth` URLs and
+    crawls and stores them, with at most `per_host_concurrency` URLs of the
+    same host in flight. A job's URLs are grouped by host into batches of up
+    to `per_host_concurrency` URLs, and each batch is one crawl and one
+    store; site crawls (crawl_options) get a crawl per start URL. A failing URL is recorded on its job
+    and does not affect the job's other URLs. The last `retention` jobs stay
+    available for status queries; their results are kept while the page text
+    of all jobs' results stays within `max_result_chars`, beyond that the
+    results of the oldest finished jobs are dropped.
+
+    `crawl` is an async function taking a list of URLs and spider arguments
+    and returning scraped items (CrawlEngine.crawl); `store` is called with
+    (agent_key, [(url, content), ...]) for the new or changed pages of every
+    URL (VectorStore.store_pages), in a thread so that tokenizing, encoding
+    and saving do not hold up the event loop; it must be thread-safe. Pages that answer 304 Not Modified to the
+    agent's cached validators are neither extracted nor stored again.
+    `remember_validators` (CrawlEngine.remember_validators) is called with
+    (agent_key, [(url, validators), ...]) for the items that carry
+    validators, only once their pages are stored, and not for the URLs that
+    `not_indexed` (VectorStore.near_duplicate_aliases), called with
+    (agent_key, urls), returns: pages whose own text the store did not
+    index are downloaded in full again next time.
+    """
+    def __init__(self, crawl, store, workers: int = 4, queue_depth: int = 1000, per_host_concurrency: int = 2, retention: int = 1000,
+                 remember_validators=None, max_result_chars: int = 100_000_000, not_indexed=None):
+        self.crawl = crawl
+        self.store = store
+        self.remember_validators = remember_validators
+        self.not_indexed = not_indexed
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.per_host_concurrency = per_host_concurrency
+        self.retention = retention
+        self.max_result_chars = max_result_chars
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict() # Oldest first
+        self._queue = None
+        self._pending = 0 # URLs submitted but not picked up by a worker yet
+        self._host_slots: dict[str, list] = {} # host -> [condition, free slots, batches holding or waiting for slots]
+        self._worker_tasks = []
+        self.jobs_submitted = 0
+        self.jobs_rejected = 0
+        self.urls_processed = 0
+
+    def start(self):
+        """Starts the workers; must be called from the running event loop."""
+        if self._worker_tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._worker(), name=f"ingest-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, urls: list[str], agent_key: str = None, keep_content: bool = True, crawl_options: dict = None) -> IngestJob:
+        if self._queue is None:
+            raise RuntimeError("Ingest job manager is not running.")
+        urls = list(dict.fromkeys(urls)) # Each URL once, in order
+        if self._pending + len(urls) > self.queue_depth:
+            self.jobs_rejected += 1
+            INGEST_REJECTED_JOBS.inc()
+            raise IngestQueueFull(f"Ingest queue is full ({self._pending} of {self.queue_depth} URLs pending).")
+
+        job = IngestJob(urls, agent_key or str(uuid.uuid4()), keep_content, crawl_options)
+        self._jobs[job.job_id] = job
+        self._trim_jobs()
+        self.jobs_submitted += 1
+        if not urls:
+            job.finished_at = time.time()
+            job.done.set()
+            return job
+        for batch in self._batches(urls, job.crawl_options):
+            self._queue.put_nowait((job, batch))
+        self._pending += len(urls)
+        return job
+
+    def _batches(self, urls: list[str], crawl_options: dict) -> list[list[str]]:
+        # Pages found by a site crawl carry their own URL as start_url, so they could not be told apart by start URL
+        if crawl_options:
+            return [[url] for url in urls]
+        by_host: dict[str, list[str]] = {}
+        for url in urls:
+            by_host.setdefault(urlsplit(url).netloc.lower(), []).append(url)
+        size = max(self.per_host_concurrency, 1)
+        return [host_urls[i:i + size] for host_urls in by_host.values() for i in range(0, len(host_urls), size)]
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def _trim_jobs(self):
+        # Forget the oldest finished jobs; unfinished ones are always kept
+        excess = len(self._jobs) - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done.is_set()][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    def _trim_results(self):
+        # Drop the results of the oldest finished jobs until the rest fit the budget; running jobs keep theirs
+        excess = self.retained_result_chars() - self.max_result_chars
+        for job in list(self._jobs.values()):
+            if excess <= 0:
+                break
+            if job.done.is_set() and job.result_chars:
+                excess -= job.result_chars
+                job.drop_results()
+
+    def retained_result_chars(self) -> int:
+        return sum(job.result_chars for job in self._jobs.values())
+
+    async def _worker(self):
+        while True:
+            job, urls = await self._queue.get()
+            self._pending -= len(urls)
+            try:
+                with metrics.request_timings(job.timings):
+                    await self._process(job, urls)
+            except Exception as e: # Never let one batch take the worker down
+                print(f"Ingest worker error for {', '.join(urls)}: {e}")
+            finally:
+                self._queue.task_done()
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str, count: int = 1):
+        # Holds `count` of the host's slots, taken all at once so that two batches never hold part of theirs each
+        host = urlsplit(url).netloc.lower()
+        slot = self._host_slots.setdefault(host, [asyncio.Condition(), self.per_host_concurrency, 0])
+        condition = slot[0]
+        slot[2] += 1
+        try:
+            async with condition:
+                await condition.wait_for(lambda: slot[1] >= count)
+                slot[1] -= count
+            try:
+                yield
+            finally:
+                async with condition:
+                    slot[1] += count
+                    condition.notify_all()
+        finally:
+            slot[2] -= 1
+            if not slot[2]:
+                del self._host_slots[host]
+
+    def _remember_validators(self, agent_key: str, validators: list):
+        if self.not_indexed is not None:
+            skipped = set(self.not_indexed(agent_key, [url for url, _ in validators]))
+            validators = [(url, value) for url, value in validators if url not in skipped]
+        if validators:
+            self.remember_validators(agent_key, validators)
+
+    async def _process(self, job: IngestJob, urls: list[str]):
+        # One crawl and one store for a batch of URLs (see _batches); every URL still gets its own status and result
+        async with self._host_slot(urls[0], len(urls)):
+            for url in urls:
+                job.url_status[url]["status"] = URL_RUNNING
+            if job.started_at is None:
+                job.started_at = time.time()
+            crawled = {} # url -> (items, changed items, content, pages)
+            try:
+                with metrics.stage("crawl"):
+                    items = await self.crawl(urls, cache_namespace=job.agent_key, **job.crawl_options)
+                # Items carry the start URL they were scraped for; all items of a one-URL batch are that URL's
+                items_of = {url: [] for url in urls}
+                for item in items:
+                    url_items = items_of[urls[0]] if len(urls) == 1 else items_of.get(item.get('start_url'))
+                    if url_items is not None:
+                        url_items.append(item)
+                validators = []
+                for url, url_items in items_of.items():
+                    changed = [item for item in url_items if not item.get('not_modified')]
+                    validators += [(item['start_url'], item.pop('validators')) for item in changed if 'validators' in item]
+                    content = " ".join(item.get('content', '') for item in changed)
+                    if job.crawl_options:
+                        pages = [(item['start_url'], item.get('content', '')) for item in changed]
+                    else:
+                        pages = [(url, content)] if changed else []
+                    crawled[url] = (url_items, changed, content, pages)
+                pages = [page for _, _, _, url_pages in crawled.values() for page in url_pages]
+                if pages:
+                    with metrics.stage("store"):
+                        await asyncio.to_thread(self.store, job.agent_key, pages)
+                if validators and self.remember_validators is not None:
+                    try:
+                        await asyncio.to_thread(self._remember_validators, job.agent_key, validators)
+                    except Exception as e: # The pages are stored; they are only downloaded in full next time
+                        print(f"Could not record validators of {', '.join(urls)} for job {job.job_id}: {e}")
+            except Exception as e:
+                print(f"Error ingesting {', '.join(urls)} for job {job.job_id}: {e}")
+                for url in urls:
+                    job.url_status[url].update(status=URL_FAILED, error=str(e) or type(e).__name__)
+                crawled = {}
+
+        for url in urls:
+            entry = job.url_status[url]
+            if url in crawled:
+                items, changed, content, pages = crawled[url]
+                for item in items:
+                    job.fetch_stats[item.get('fetch', 'rendered')] += 1
+                entry["pages"] = {"stored": len(pages), "unchanged": len(items) - len(changed)}
+                entry["status"] = URL_SUCCEEDED if changed else URL_UNCHANGED if items else URL_EMPTY
+                result = job.make_result(url, content, changed)
+                if entry["status"] == URL_UNCHANGED:
+                    result["not_modified"] = True
+                job.add_result(url, result)
+
+            self.urls_processed += 1
+            INGESTED_URLS.inc(status=entry["status"])
+            job.finish_url(url)
+        self._trim_results() # Before this job counts as finished, so a caller waiting for it still finds its results
+        if all(e["status"] in URL_DONE for e in job.url_status.values()):
+            job.finished_at = time.time()
+            job.done.set()
+
+    def update_metrics(self):
+        # Collector for /metrics
+        stats = self.stats()
+        INGEST_PENDING_URLS.set(stats["pending_urls"])
+        INGEST_RUNNING_JOBS.set(stats["jobs_running"])
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "pending_urls": self._pending,
+            "active_hosts": len(self._host_slots),
+            "jobs_submitted": self.jobs_submitted,
+            "jobs_rejected": self.jobs_rejected,
+            "jobs_running": sum(1 for job in self._jobs.values() if not job.done.is_set()),
+            "urls_processed": self.urls_processed,
+            "retained_result_chars": self.retained_result_chars(),
+        }
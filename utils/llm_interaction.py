@@ -1,8 +1,49 @@
-import requests
+import asyncio
 import json
+import random
+import time
+
+import httpx
+
+from utils.metrics import metrics
+
+# Rate limiting and transient server errors are worth another attempt
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Answers returned in place of a model response; callers should not cache these
+NO_RESPONSE = "No response from AI."
+COMMUNICATION_ERROR = "Error communicating with AI service."
+PROCESSING_ERROR = "Error processing AI response."
+UNEXPECTED_ERROR = "An unexpected error occurred with AI interaction."
+ERROR_RESPONSES = frozenset({NO_RESPONSE, COMMUNICATION_ERROR, PROCESSING_ERROR, UNEXPECTED_ERROR})
+
+
+class IncompleteAnswerError(Exception):
+    """A streamed answer broke off after part of it was sent; the pieces sent so far are not the whole answer."""
+
+LLM_REQUESTS = metrics.counter("scrap_search_llm_requests_total", "LLM answers, by whether a model response or an error answer was returned.", ("outcome",))
+LLM_RETRIES = metrics.counter("scrap_search_llm_retries_total", "LLM API attempts that were retried.")
+LLM_TOKENS = metrics.counter("scrap_search_llm_tokens_total", "Tokens reported by the LLM API, by kind (prompt or completion).", ("kind",))
+
+
+def record_usage(usage):
+    # `usage` of a chat completion, or of the last streamed chunk (Groq sends it under x_groq)
+    if usage:
+        LLM_TOKENS.inc(usage.get("prompt_tokens", 0), kind="prompt")
+        LLM_TOKENS.inc(usage.get("completion_tokens", 0), kind="completion")
+
 
 class LLMInteraction:
-    def __init__(self, api_key: str, model: str = "llama3-70b-8192", base_url: str = "https://api.groq.com/openai/v1/chat/completions"):
+    """
+    Async client for an OpenAI-compatible chat completions API (Groq by default).
+
+    Requests share one pooled httpx.AsyncClient, so they do not block the
+    event loop and reuse connections. At most max_concurrency requests are
+    in flight at once, and 429/5xx responses and connection errors are
+    retried with exponential backoff.
+    """
+    def __init__(self, api_key: str, model: str = "llama3-70b-8192", base_url: str = "https://api.groq.com/openai/v1/chat/completions",
+                 timeout: float = 30.0, max_concurrency: int = 16, max_retries: int = 3, backoff_base: float = 0.5):
         self.api_key = api_key
         self.model = model
         self.base_url = base_url
@@ -10,12 +51,26 @@ class LLMInteraction:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self.timeout = httpx.Timeout(timeout, connect=5.0)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._client = None # Created on first use, inside the running event loop
+        self._semaphore = None
 
-    def get_ai_response(self, user_query: str, context: str):
-        """
-        Sends the user query and matched context to the LLAMA API
-        and returns the beautified response.
-        """
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.AsyncClient(headers=self.headers, timeout=self.timeout, limits=limits)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _build_payload(self, user_query: str, context: str, stream: bool = False) -> dict:
         # Construct the prompt to ensure the AI strictly uses the provided context
         prompt = f"""
 You are an AI assistant. Your task is to answer the user's query STRICTLY based on the provided context.
@@ -29,31 +84,147 @@ User Query:
 
 Answer:
 """
-        payload = {
+        return {
             "model": self.model,
             "messages": [
                 {"role": "user", "content": prompt}
             ],
             "temperature": 0.1, # Keep temperature low for factual responses based on context
-            "max_tokens": 500 # Adjust as needed
+            "max_tokens": 500, # Adjust as needed
+            "stream": stream
         }
 
+    def _retry_delay(self, attempt: int, response: httpx.Response = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass # HTTP-date form, fall back to backoff
+        return self.backoff_base * (2 ** attempt) * (1 + random.random() * 0.25)
+
+    async def get_ai_response(self, user_query: str, context: str):
+        """
+        Sends the user query and matched context to the LLAMA API
+        and returns the beautified response.
+        """
+        with metrics.stage("llm"):
+            answer = await self._request_answer(user_query, context)
+        LLM_REQUESTS.inc(outcome="error" if answer in ERROR_RESPONSES else "ok")
+        return answer
+
+    async def _request_answer(self, user_query: str, context: str):
+        client = self._get_client()
+        payload = self._build_payload(user_query, context)
+
         try:
-            response = requests.post(self.base_url, headers=self.headers, data=json.dumps(payload))
+            async with self._semaphore:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        response = await client.post(self.base_url, json=payload)
+                    except httpx.TransportError as e:
+                        if attempt == self.max_retries:
+                            raise
+                        print(f"Groq API request failed ({e!r}), retrying.")
+                        LLM_RETRIES.inc()
+                        await asyncio.sleep(self._retry_delay(attempt))
+                        continue
+                    if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                        print(f"Groq API returned {response.status_code}, retrying.")
+                        LLM_RETRIES.inc()
+                        await asyncio.sleep(self._retry_delay(attempt, response))
+                        continue
+                    break
+
             response.raise_for_status() # Raise an exception for HTTP errors
-            
             response_json = response.json()
+            record_usage(response_json.get("usage"))
             if "choices" in response_json and len(response_json["choices"]) > 0:
                 return response_json["choices"][0]["message"]["content"].strip()
             else:
-                return "No response from AI."
+                return NO_RESPONSE
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Error communicating with Groq API: {e}")
-            return "Error communicating with AI service."
+            return COMMUNICATION_ERROR
         except json.JSONDecodeError:
             print(f"Failed to decode JSON response from Groq API: {response.text}")
-            return "Error processing AI response."
+            return PROCESSING_ERROR
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
-            return "An unexpected error occurred with AI interaction."
\ No newline at end of file
+            return UNEXPECTED_ERROR
+
+    async def stream_ai_response(self, user_query: str, context: str):
+        """
+        Same as get_ai_response, but yields the answer in pieces as the API
+        streams them. Retries only happen before the first piece is sent;
+        a stream that fails after that, or ends without the API's end
+        marker, raises IncompleteAnswerError once the received pieces are
+        yielded.
+        """
+        start = time.perf_counter()
+        failed = False
+        try:
+            async for piece in self._stream_answer(user_query, context):
+                if piece in ERROR_RESPONSES:
+                    failed = True
+                yield piece
+        except IncompleteAnswerError:
+            failed = True
+            raise
+        finally:
+            metrics.observe_stage("llm", time.perf_counter() - start)
+            LLM_REQUESTS.inc(outcome="error" if failed else "ok")
+
+    async def _stream_answer(self, user_query: str, context: str):
+        client = self._get_client()
+        payload = self._build_payload(user_query, context, stream=True)
+        start = time.perf_counter()
+        sent_anything = False
+
+        try:
+            async with self._semaphore:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        async with client.stream("POST", self.base_url, json=payload) as response:
+                            if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                                print(f"Groq API returned {response.status_code}, retrying.")
+                                LLM_RETRIES.inc()
+                                delay = self._retry_delay(attempt, response)
+                            else:
+                                response.raise_for_status()
+                                # Server-sent events: "data: {json}" lines, terminated by "data: [DONE]"
+                                async for line in response.aiter_lines():
+                                    if not line.startswith("data:"):
+                                        continue
+                                    data = line[len("data:"):].strip()
+                                    if data == "[DONE]":
+                                        return
+                                    event = json.loads(data)
+                                    record_usage(event.get("usage") or event.get("x_groq", {}).get("usage"))
+                                    choices = event.get("choices") or [{}]
+                                    piece = choices[0].get("delta", {}).get("content")
+                                    if piece:
+                                        if not sent_anything:
+                                            metrics.observe_stage("llm_first_token", time.perf_counter() - start)
+                                        sent_anything = True
+                                        yield piece
+                                raise IncompleteAnswerError("Stream closed before [DONE].")
+                    except httpx.TransportError as e:
+                        if sent_anything or attempt == self.max_retries:
+                            raise
+                        print(f"Groq API request failed ({e!r}), retrying.")
+                        LLM_RETRIES.inc()
+                        delay = self._retry_delay(attempt)
+                    await asyncio.sleep(delay)
+
+        except httpx.HTTPError as e:
+            print(f"Error communicating with Groq API: {e}")
+            if sent_anything:
+                raise IncompleteAnswerError(str(e)) from e
+            yield COMMUNICATION_ERROR
+        except json.JSONDecodeError as e:
+            print(f"Failed to decode streamed response from Groq API: {e}")
+            if sent_anything:
+                raise IncompleteAnswerError(str(e)) from e
+            yield PROCESSING_ERROR
@@ -0,0 +1,309 @@
+import bisect
+import contextvars
+import cProfile
+import io
+import math
+import os
+import pstats
+import random
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond scoring up to slow renders and LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage timings of the request (or ingest job) the current task works for: stage -> seconds
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {} # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        self.observe_key(self._key(labels), value)
+
+    def observe_key(self, key: tuple, value: float):
+        """observe() with the label values already in labelnames order."""
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0] # per-bucket counts, sum, count
+            state[0][bucket] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_sample(self, key: tuple, state) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state[0]):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state[1])}")
+        lines.append(f"{self.name}_count{labels} {state[2]}")
+        return lines
+
+
+class _Stage:
+    # Context manager timing one stage; a class rather than @contextmanager, as it runs on every hot path
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class _RequestTimings:
+    __slots__ = ("timings", "token")
+
+    def __init__(self, timings: dict):
+        self.timings = timings
+
+    def __enter__(self) -> dict:
+        self.token = _request_timings.set(self.timings)
+        return self.timings
+
+    def __exit__(self, *exc_info):
+        _request_timings.reset(self.token)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters, gauges and histograms in the Prometheus text
+    format, without a client library.
+
+    stage(name) times a block into the scrap_search_stage_seconds histogram
+    and, inside request_timings(), also adds it to that request's timing
+    breakdown. Collectors registered with add_collector() run before every
+    render() to refresh gauges that mirror state kept elsewhere. With
+    `enabled` off, stage() does nothing.
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors = []
+        self.stage_seconds = self.histogram("scrap_search_stage_seconds", "Time spent in each scrape, index and query stage.", ("stage",))
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing # Module reloads and repeated set-up share the first definition
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def stage(self, name: str):
+        return _Stage(self, name) if self.enabled else _NO_STAGE
+
+    def observe_stage(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        self.stage_seconds.observe_key((name,), seconds)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + seconds
+
+    def request_timings(self, timings: dict = None) -> _RequestTimings:
+        """Collects the stages timed in this context (and tasks started from it) into `timings`."""
+        return _RequestTimings(timings if timings is not None else {})
+
+    def current_timings(self):
+        return _request_timings.get()
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e: # A broken collector must not take /metrics down
+                print(f"Metrics collector failed: {e}")
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(enabled=os.getenv("METRICS_ENABLED", "true").lower() == "true")
+
+HTTP_REQUEST_SECONDS = metrics.histogram("scrap_search_http_request_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+PROFILED_REQUESTS = metrics.counter("scrap_search_profiled_requests_total", "Requests run under cProfile, by whether they were slow enough to be saved.", ("saved",))
+
+
+def format_timings(timings: dict) -> dict:
+    """Stage timings in milliseconds, rounded for responses."""
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every HTTP request and
+    collecting its stage timings (see MetricsRegistry.request_timings).
+
+    With slow_request_ms set, a `profile_sample_rate` share of requests runs
+    under cProfile; the profile of any sampled request that takes at least
+    slow_request_ms is written to profile_dir as <time>-<route>.prof and its
+    top functions are printed. Only one request is profiled at a time, and
+    the profile also covers whatever else the event loop ran meanwhile.
+    """
+    def __init__(self, app, registry: MetricsRegistry = metrics, slow_request_ms: float = None, profile_sample_rate: float = 1.0,
+                 profile_dir: str = "profiles"):
+        self.app = app
+        self.registry = registry
+        self.slow_request_ms = slow_request_ms
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_dir = profile_dir
+        self._profiling = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        profiler = None
+        if self.slow_request_ms is not None and not self._profiling and random.random() < self.profile_sample_rate:
+            self._profiling = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            with self.registry.request_timings():
+                await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            # The route template, never the raw path, so ids in URLs do not create new series
+            route_path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=route_path, status=status[0])
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                self._save_profile(profiler, route_path, elapsed)
+
+    def _save_profile(self, profiler: cProfile.Profile, route_path: str, elapsed: float):
+        slow = elapsed * 1000 >= self.slow_request_ms
+        PROFILED_REQUESTS.inc(saved=str(slow).lower())
+        if not slow:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = route_path.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        now = time.time()
+        path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}-{name}.prof")
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+        print(f"Slow request {route_path} took {elapsed * 1000:.0f} ms; profile saved to {path}\n{summary.getvalue()}")
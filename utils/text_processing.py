@@ -0,0 +1,50 @@
+import re
+from nltk.corpus import stopwords
+import nltk
+
+# Download NLTK data if not already present
+try:
+    nltk.data.find('corpora/stopwords')
+except LookupError:
+    nltk.download('stopwords')
+
+NON_LETTERS = re.compile(r'[^a-zA-Z\s]')
+STOPWORDS = frozenset(stopwords.words('english'))
+
+# After NON_LETTERS is applied only letters and whitespace remain, so NLTK's
+# word_tokenize reduces to a whitespace split plus its contraction rules,
+# which on such text always match whole words.
+CONTRACTIONS = {
+    "cannot": ("can", "not"),
+    "gimme": ("gim", "me"),
+    "gonna": ("gon", "na"),
+    "gotta": ("got", "ta"),
+    "lemme": ("lem", "me"),
+    "wanna": ("wan", "na"),
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercases, strips everything but ASCII letters and whitespace, splits
+    into words and drops English stopwords. Produces the same tokens as the
+    previous word_tokenize + stopwords.words('english') pipeline.
+    """
+    tokens = []
+    for word in NON_LETTERS.sub('', text.lower()).split():
+        parts = CONTRACTIONS.get(word)
+        if parts is None:
+            if word not in STOPWORDS:
+                tokens.append(word)
+        else:
+            tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+
+def preprocess_text(text: str) -> str:
+    return " ".join(tokenize(text))
+
+
+def preprocess_batch(texts: list[str]) -> list[str]:
+    """Preprocesses many documents (e.g. all chunks of a page) in one call."""
+    return [" ".join(tokenize(text)) for text in texts]
@@ -0,0 +1,274 @@
+import re
+from collections import Counter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# Same analyzer as sklearn's TfidfVectorizer defaults (lowercase, 2+ word characters)
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def top_indices(scores: np.ndarray, top_n: int) -> np.ndarray:
+    """Indices of the top_n highest scores, best first, without sorting all of them."""
+    top_n = min(top_n, len(scores))
+    if top_n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    indices = np.argpartition(-scores, top_n - 1)[:top_n]
+    return indices[np.argsort(-scores[indices], kind='stable')]
+
+
+class TfidfSnapshot:
+    """
+    Read-only view of an IncrementalTfidfIndex at one point in time.
+
+    It holds its own copy of the document table and document frequencies,
+    so later adds and removes on the index never show through; a search
+    that runs while the index is updated sees either the old or the new
+    corpus, never a mix. The weighted matrix is built on first search.
+    """
+    def __init__(self, docs: dict, df: np.ndarray, vocabulary: dict):
+        self._docs = docs # key -> (term ids, term counts); arrays are never modified in place
+        self._df = df
+        self._vocabulary = vocabulary # Shared with the index, which only ever adds terms
+        self._vocabulary_size = len(df)
+        self._idf = np.log((1 + len(docs)) / (1 + df)) + 1
+        self._matrix = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, key):
+        return key in self._docs
+
+    def keys(self) -> list:
+        return list(self._docs)
+
+    def idf(self) -> np.ndarray:
+        return self._idf
+
+    def memory_bytes(self) -> int:
+        return self._matrix[1].data.nbytes + self._matrix[1].indices.nbytes if self._matrix is not None else 0
+
+    def _get_matrix(self):
+        if self._matrix is None:
+            # Two threads may build it at the same time; both results are identical
+            keys = list(self._docs)
+            indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+            indices, data = [], []
+            for row, key in enumerate(keys):
+                term_ids, term_counts = self._docs[key]
+                weights = term_counts * self._idf[term_ids]
+                norm = np.sqrt(np.dot(weights, weights))
+                indices.append(term_ids)
+                data.append(weights / norm if norm else weights)
+                indptr[row + 1] = indptr[row] + len(term_ids)
+            matrix = csr_matrix(
+                (np.concatenate(data) if data else np.zeros(0), np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32), indptr),
+                shape=(len(keys), self._vocabulary_size),
+            )
+            self._matrix = (keys, matrix)
+        return self._matrix
+
+    def transform(self, text: str) -> csr_matrix:
+        """Returns the l2-normalized tf-idf vector of a query as a 1 x vocabulary matrix."""
+        return self.transform_batch([text])
+
+    def transform_batch(self, texts: list[str]) -> csr_matrix:
+        """Returns the l2-normalized tf-idf vectors of several queries, one row per query."""
+        df = self._df
+        indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+        indices, data = [], []
+        for row, text in enumerate(texts):
+            counts = Counter(TOKEN_PATTERN.findall(text.lower()))
+            known = []
+            for term, count in counts.items():
+                term_id = self._vocabulary.get(term)
+                # Terms added after the snapshot, or that no stored document contains
+                # anymore, would not be in a refitted vocabulary
+                if term_id is not None and term_id < self._vocabulary_size and df[term_id] > 0:
+                    known.append((term_id, count))
+            term_ids = np.array([t for t, _ in known], dtype=np.int32)
+            weights = np.array([c for _, c in known], dtype=np.float64) * self._idf[term_ids]
+            norm = np.sqrt(np.dot(weights, weights))
+            if norm:
+                weights /= norm
+            indices.append(term_ids)
+            data.append(weights)
+            indptr[row + 1] = indptr[row] + len(term_ids)
+        return csr_matrix((np.concatenate(data) if data else np.zeros(0), np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32), indptr),
+                          shape=(len(texts), self._vocabulary_size))
+
+    def scores(self, text: str) -> tuple[list, np.ndarray]:
+        """Returns (keys, cosine similarity of every document with the query). The keys list is the same object for every call."""
+        keys, matrix = self._get_matrix()
+        if not keys:
+            return keys, np.zeros(0)
+        return keys, (matrix @ self.transform(text).T).toarray().ravel()
+
+    def scores_batch(self, texts: list[str]) -> tuple[list, np.ndarray]:
+        """
+        Like scores() for several queries at once: one sparse documents x
+        queries product, returned as a dense array with a column per query.
+        Each column equals what scores() returns for that query.
+        """
+        keys, matrix = self._get_matrix()
+        if not keys:
+            return keys, np.zeros((0, len(texts)))
+        return keys, (matrix @ self.transform_batch(texts).T).toarray()
+
+    def search(self, text: str, top_n: int = 1) -> list:
+        """Returns up to top_n (key, cosine similarity) pairs, best first."""
+        keys, similarities = self.scores(text)
+        return [(keys[i], float(similarities[i])) for i in top_indices(similarities, top_n)]
+
+    def search_batch(self, texts: list[str], top_n: int = 1) -> list[list]:
+        """search() for several queries, scored in one matrix product. Returns one result list per query."""
+        keys, similarities = self.scores_batch(texts)
+        return [[(keys[i], float(column[i])) for i in top_indices(column, top_n)] for column in similarities.T]
+
+
+class IncrementalTfidfIndex:
+    """
+    TF-IDF index that is updated one document at a time.
+
+    Every document keeps its term ids and raw term counts, and the index keeps
+    document frequencies for the whole vocabulary. Adding, replacing or
+    removing a document only tokenizes that document. Searches run on a
+    TfidfSnapshot, taken on the first search after a change, whose weighted
+    matrix is rebuilt from the stored counts. Scores match a fresh
+    TfidfVectorizer().fit_transform over the same documents (smooth idf,
+    raw tf, l2 norm) up to floating point error.
+    """
+    def __init__(self):
+        self.vocabulary: dict[str, int] = {}
+        self._terms: list[str] = [] # term id -> term
+        self._df = np.zeros(1024, dtype=np.int64) # Grown on demand, only the first len(vocabulary) entries are used
+        self._docs: dict = {} # key -> (term ids, term counts)
+        self._nnz = 0 # Stored (term id, count) pairs over all documents
+        self._snapshot = None # Cached TfidfSnapshot, dropped on every change
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, key):
+        return key in self._docs
+
+    def keys(self) -> list:
+        return list(self._docs)
+
+    def _analyze(self, text: str) -> Counter:
+        return Counter(TOKEN_PATTERN.findall(text.lower()))
+
+    def _term_ids(self, terms) -> np.ndarray:
+        ids = np.empty(len(terms), dtype=np.int32)
+        for i, term in enumerate(terms):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                term_id = len(self.vocabulary)
+                self.vocabulary[term] = term_id
+                self._terms.append(term)
+            ids[i] = term_id
+        if len(self.vocabulary) > len(self._df):
+            grown = np.zeros(max(len(self.vocabulary), 2 * len(self._df)), dtype=np.int64)
+            grown[:len(self._df)] = self._df
+            self._df = grown
+        return ids
+
+    def add(self, key, text: str):
+        """Adds a document, replacing any previous document with the same key."""
+        if key in self._docs:
+            self.remove(key)
+
+        counts = self._analyze(text)
+        term_ids = self._term_ids(list(counts))
+        term_counts = np.fromiter(counts.values(), dtype=np.int32, count=len(counts))
+        self.add_counts(key, term_ids, term_counts)
+
+    def add_counts(self, key, term_ids: np.ndarray, term_counts: np.ndarray):
+        """Adds an already analyzed document: the ids of its distinct terms and their raw counts."""
+        if key in self._docs:
+            self.remove(key)
+        self._df[term_ids] += 1 # Term ids are unique within a document
+        self._docs[key] = (term_ids, term_counts)
+        self._nnz += len(term_ids)
+        self._snapshot = None
+
+    def remove(self, key):
+        term_ids, _ = self._docs.pop(key)
+        self._df[term_ids] -= 1
+        self._nnz -= len(term_ids)
+        self._snapshot = None
+
+    def terms(self, start: int = 0) -> list[str]:
+        """Vocabulary terms from term id `start` on, in term id order."""
+        return self._terms[start:]
+
+    def extend_vocabulary(self, terms: list[str]):
+        """Appends terms saved with terms(start), start being the current vocabulary size, under the same ids."""
+        self._term_ids(terms)
+
+    def snapshot(self) -> TfidfSnapshot:
+        """The current state as an immutable TfidfSnapshot; repeated calls share one until the next change."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._snapshot = TfidfSnapshot(dict(self._docs), self._df[:len(self.vocabulary)].copy(), self.vocabulary)
+        return snapshot
+
+    @classmethod
+    def from_arrays(cls, keys: list, terms: list[str], df: np.ndarray, indptr: np.ndarray, indices: np.ndarray, counts: np.ndarray):
+        """
+        Rebuilds an index saved with to_arrays. Rows are slices of the given
+        arrays, so memory-mapped arrays are only paged in when searched.
+        """
+        index = cls()
+        index.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        index._terms = list(terms)
+        index._df = np.array(df, dtype=np.int64) # Writable copy, document frequencies change on add/remove
+        for row, key in enumerate(keys):
+            start, end = indptr[row], indptr[row + 1]
+            index._docs[key] = (indices[start:end], counts[start:end])
+        index._nnz = len(indices)
+        return index
+
+    def to_arrays(self, keys: list = None) -> dict:
+        """Flattens the index into CSR arrays of raw term counts, rows in the given key order."""
+        keys = self.keys() if keys is None else keys
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        for row, key in enumerate(keys):
+            indptr[row + 1] = indptr[row] + len(self._docs[key][0])
+        return {
+            "terms": self.terms(),
+            "df": self._df[:len(self.vocabulary)].astype(np.int32),
+            "indptr": indptr,
+            "indices": np.concatenate([self._docs[key][0] for key in keys]) if keys else np.zeros(0, dtype=np.int32),
+            "counts": np.concatenate([self._docs[key][1] for key in keys]) if keys else np.zeros(0, dtype=np.int32),
+        }
+
+    def memory_bytes(self) -> int:
+        """Rough resident size, used for the VectorStore memory budget."""
+        size = self._nnz * 8 + len(self.vocabulary) * 100 + len(self._docs) * 200 + self._df.nbytes
+        if self._snapshot is not None:
+            size += self._snapshot.memory_bytes()
+        return size
+
+    def idf(self) -> np.ndarray:
+        return self.snapshot().idf()
+
+    # Reads go through the current snapshot
+    def transform(self, text: str) -> csr_matrix:
+        return self.snapshot().transform(text)
+
+    def transform_batch(self, texts: list[str]) -> csr_matrix:
+        return self.snapshot().transform_batch(texts)
+
+    def scores(self, text: str) -> tuple[list, np.ndarray]:
+        return self.snapshot().scores(text)
+
+    def scores_batch(self, texts: list[str]) -> tuple[list, np.ndarray]:
+        return self.snapshot().scores_batch(texts)
+
+    def search(self, text: str, top_n: int = 1) -> list:
+        return self.snapshot().search(text, top_n)
+
+    def search_batch(self, texts: list[str], top_n: int = 1) -> list[list]:
+        return self.snapshot().search_batch(texts, top_n)
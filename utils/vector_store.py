@@ -1,133 +1,621 @@
 import os
 import json
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import re
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-import nltk
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
-# Download NLTK data if not already present
 try:
-    nltk.data.find('corpora/stopwords')
-except nltk.downloader.DownloadError:
-    nltk.download('stopwords')
-try:
-    nltk.data.find('tokenizers/punkt')
-except nltk.downloader.DownloadError:
-    nltk.download('punkt')
+    import fcntl
+except ImportError: # Windows: no shared mode
+    fcntl = None
+
+from utils.agent_data import AgentData, AgentSnapshot, BACKENDS
+from utils.embeddings import DenseIndex, SentenceTransformerEncoder
+from utils.fingerprints import FingerprintIndex, content_fingerprint, exact_hash, similarity
+from utils.metrics import metrics
+from utils.tfidf_index import top_indices
+from utils.chunking import split_into_chunks, estimate_tokens
+from utils.text_processing import preprocess_text, preprocess_batch
+
+AGENT_KEY_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+# Shared mode files in the data directory; the leading dot keeps them apart from agent keys
+CHANGE_LOG_FILE = ".changes" # One "<agent_key> <version>" line per save, appended by every process
+CHANGE_LOG_LOCK_FILE = ".changes.lock"
+CHANGE_LOG_MAX_BYTES = 1 << 20 # Beyond this the log is rewritten with the latest line per agent only
+AGENT_LOCK_FILE = "LOCK"
+
+PAGES_STORED = metrics.counter("scrap_search_pages_stored_total", "Pages added to or changed in an agent.")
+PAGES_DEDUPLICATED = metrics.counter("scrap_search_pages_deduplicated_total", "Pages stored as aliases of a page with the same (exact) or nearly the same (near) content.", ("match",))
+ALIASES_PROMOTED = metrics.counter("scrap_search_aliases_promoted_total", "Aliases indexed as pages of their own because the page they duplicated changed.")
+AGENTS_LOADED = metrics.gauge("scrap_search_agents_loaded", "Agents held in memory.")
+AGENT_DOCUMENTS = metrics.gauge("scrap_search_agent_documents", "Pages stored per loaded agent.", ("agent",))
+AGENT_CHUNKS = metrics.gauge("scrap_search_agent_chunks", "Indexed chunks per loaded agent.", ("agent",))
+AGENT_INDEX_BYTES = metrics.gauge("scrap_search_agent_index_bytes", "Approximate memory of each loaded agent's texts and indexes.", ("agent",))
+AGENTS_RELOADED = metrics.counter("scrap_search_agents_reloaded_total", "Loaded agents dropped because another process saved a newer version (shared mode).")
 
 
 class VectorStore:
-    def __init__(self, data_dir="data"):
+    """
+    Per-agent TF-IDF stores over overlapping page chunks. Agents live on disk
+    under data/<agent_key>/ and are loaded lazily on first use, then kept in
+    an LRU that is trimmed to a memory budget. Startup does not touch the
+    data directory at all.
+
+    Each agent has a retrieval backend: "tfidf" (default), "dense"
+    (embedding cosine similarity) or "hybrid" (hybrid_alpha * dense +
+    (1 - hybrid_alpha) * TF-IDF). Dense and hybrid agents keep an
+    embedding matrix next to their TF-IDF index; `encoder` produces the
+    embeddings (a SentenceTransformerEncoder unless given).
+
+    With deduplicate on, a new URL whose text is the same as a stored
+    page's (up to case and whitespace) becomes an alias of that page: it is
+    not indexed, queries find the page under its first URL, and the alias
+    resolves to its text. With near_duplicate_similarity set, so does a new
+    URL whose MinHash-estimated shingle similarity to a page is at least
+    that; its own text is then lost, which is why it is off by default.
+    Pages already indexed stay indexed when they change. An alias whose own
+    text changes is indexed as a page of its own, unless its new text is
+    the same as a stored page's. Aliases of a page that changes are checked
+    against its new text, and those that no longer match it are indexed as
+    pages of their own, with the text they resolved to so far.
+
+    Safe to use from several threads. Writes to an agent are serialized by
+    a per-agent lock; queries read the agent's current AgentSnapshot, which
+    a write replaces in one step once it is complete, so queries take no
+    lock and never see a partly applied write.
+
+    With shared on, several processes (e.g. uvicorn workers) can serve the
+    same data directory. Writes to an agent are also serialized between
+    processes, by a file lock in the agent's directory. Every save appends
+    the agent's new version to a change log; before using an agent, a
+    process checks whether the log grew (one stat call) and, if so, reads
+    only the new lines and drops the agents it holds an older version of,
+    so they are loaded again on next use. Other agents stay as they are.
+    Page texts and term counts are memory-mapped, so the processes share
+    them through the page cache. Needs fcntl (POSIX).
+    """
+    def __init__(self, data_dir="data", memory_budget_mb: int = 512, chunk_words: int = 200, chunk_overlap: int = 50,
+                 default_backend: str = "tfidf", encoder=None, hybrid_alpha: float = 0.5, quantize_embeddings: bool = False,
+                 deduplicate: bool = True, near_duplicate_similarity: float = None, shared: bool = False):
         self.data_dir = data_dir
         os.makedirs(self.data_dir, exist_ok=True)
-        self.vectorizers: dict[str, TfidfVectorizer] = {}
-        self.corpus: dict[str, list[str]] = {}
-        self.vectors: dict[str, Any] = {} # Storing numpy arrays
-        self.url_map: dict[str, dict[str, str]] = {} # agent_key -> url -> content
-        self.load_all_data()
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.chunk_words = chunk_words
+        self.chunk_overlap = chunk_overlap
+        self._agents: OrderedDict[str, AgentData] = OrderedDict() # LRU of loaded agents, most recent last
+        self._lock = threading.Lock() # Guards LRU changes other than reordering, _write_locks and _load_locks
+        self._write_locks: dict[str, threading.RLock] = {} # agent_key -> lock held while changing the agent
+        # agent_key -> lock held while loading the agent, so a query that loads an evicted agent does
+        # not wait for an ingest to finish. Taken after the write lock when both are held.
+        self._load_locks: dict[str, threading.Lock] = {}
+        self._change_listeners = [] # Called with the agent key whenever an agent's corpus changes
+        if default_backend not in BACKENDS:
+            raise ValueError(f"Unknown retrieval backend: {default_backend}")
+        self.default_backend = default_backend
+        self.encoder = encoder if encoder is not None else SentenceTransformerEncoder()
+        self.hybrid_alpha = hybrid_alpha
+        self.quantize_embeddings = quantize_embeddings
+        self.deduplicate = deduplicate
+        self.near_duplicate_similarity = near_duplicate_similarity
+        if shared and fcntl is None:
+            raise RuntimeError("Shared mode needs file locks (fcntl), which this platform does not have.")
+        self.shared = shared
+        self._known_versions: dict[str, int] = {} # agent_key -> latest version this process loaded, saved or was told of
+        self._change_log_lock = threading.Lock() # One thread at a time reads the change log
+        self._change_log_inode = None
+        self._change_log_offset = 0 # Bytes of the change log already read
 
     def _preprocess_text(self, text):
-        # Convert to lowercase
-        text = text.lower()
-        # Remove special characters and numbers
-        text = re.sub(r'[^a-zA-Z\s]', '', text)
-        # Tokenize and remove stopwords
-        words = word_tokenize(text)
-        words = [word for word in words if word not in stopwords.words('english')]
-        return " ".join(words)
+        # Lowercase, keep letters only, drop stopwords (shared by ingest and query)
+        return preprocess_text(text)
+
+    def add_change_listener(self, listener):
+        self._change_listeners.append(listener)
+
+    def _agent_dir(self, agent_key: str) -> str:
+        return os.path.join(self.data_dir, agent_key)
+
+    def _write_lock(self, agent_key: str) -> threading.RLock:
+        with self._lock:
+            return self._write_locks.setdefault(agent_key, threading.RLock())
+
+    def _load_lock(self, agent_key: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(agent_key, threading.Lock())
+
+    @contextmanager
+    def _ingest_lock(self, agent_key: str):
+        """Held while changing an agent: a thread lock, plus a file lock on the agent directory in shared mode."""
+        if not AGENT_KEY_PATTERN.fullmatch(agent_key):
+            raise ValueError(f"Invalid agent key: {agent_key}")
+        with self._write_lock(agent_key):
+            if not self.shared:
+                yield
+                return
+            agent_dir = self._agent_dir(agent_key)
+            os.makedirs(agent_dir, exist_ok=True)
+            with open(os.path.join(agent_dir, AGENT_LOCK_FILE), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # Another process may have saved the agent after this one loaded it and
+                    # before the change log was read; the write must start from that version
+                    agent = self._agents.get(agent_key)
+                    if agent is not None and agent.version != AgentData.current_version(agent_dir):
+                        self._evict(agent_key)
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _evict(self, agent_key: str):
+        with self._lock:
+            self._agents.pop(agent_key, None)
+
+    def _log_change(self, agent_key: str, version: int):
+        # Called after a save, with the agent's ingest lock held, so lines of one agent are in version order
+        self._known_versions[agent_key] = version
+        if not self.shared:
+            return
+        path = os.path.join(self.data_dir, CHANGE_LOG_FILE)
+        with open(os.path.join(self.data_dir, CHANGE_LOG_LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    size = os.path.getsize(path)
+                except FileNotFoundError:
+                    size = 0
+                if size < CHANGE_LOG_MAX_BYTES:
+                    with open(path, 'a', encoding='utf-8') as f:
+                        f.write(f"{agent_key} {version}\n")
+                    return
+                # Compaction: readers see a new inode and read the whole (short) log again
+                latest = self._parse_change_log(open(path, 'rb').read())
+                latest[agent_key] = version
+                with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+                    f.write("".join(f"{key} {latest_version}\n" for key, latest_version in latest.items()))
+                os.replace(f"{path}.tmp", path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _parse_change_log(data: bytes) -> dict[str, int]:
+        latest = {}
+        for line in data.decode('utf-8').splitlines():
+            key, version = line.split()
+            latest[key] = max(int(version), latest.get(key, -1))
+        return latest
+
+    def refresh(self):
+        """
+        Shared mode: drops loaded agents that another process saved a newer
+        version of since, and tells the change listeners about them. Runs on
+        every agent access; callers that answer from state kept outside the
+        store (the answer cache) call it first. No-op otherwise.
+        """
+        if not self.shared:
+            return
+        path = os.path.join(self.data_dir, CHANGE_LOG_FILE)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino == self._change_log_inode and stat.st_size == self._change_log_offset:
+            return # Nothing new; the common case costs this one stat call
+
+        with self._change_log_lock:
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                return
+            with f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self._change_log_inode: # First read, or the log was compacted
+                    self._change_log_inode, self._change_log_offset = inode, 0
+                f.seek(self._change_log_offset)
+                data = f.read()
+            data = data[:data.rfind(b"\n") + 1] # A line still being appended is read next time
+            self._change_log_offset += len(data)
+
+            changed = []
+            for agent_key, version in self._parse_change_log(data).items():
+                if version <= self._known_versions.get(agent_key, version):
+                    continue # Not newer, or an agent this process never used
+                self._known_versions[agent_key] = version
+                agent = self._agents.get(agent_key)
+                if agent is not None and agent.version < version:
+                    self._evict(agent_key)
+                    AGENTS_RELOADED.inc()
+                changed.append(agent_key)
+        for agent_key in changed:
+            for listener in self._change_listeners:
+                listener(agent_key)
+
+    def _get_agent(self, agent_key: str, create: bool = False):
+        self.refresh()
+        agent = self._loaded_agent(agent_key)
+        if agent is not None:
+            try:
+                self._agents.move_to_end(agent_key)
+            except KeyError:
+                pass # Evicted by another thread in the meantime; the caller still gets a consistent agent
+            return agent
+
+        # Agent keys end up in file paths
+        if not AGENT_KEY_PATTERN.fullmatch(agent_key):
+            return None
+
+        with self._load_lock(agent_key):
+            agent = self._loaded_agent(agent_key) # Loaded by another thread while this one waited
+            if agent is None:
+                agent = self._load_agent(agent_key, create)
+            if agent is not None:
+                agent = self._add_to_lru(agent_key, agent)
+            return agent
+
+    def _loaded_agent(self, agent_key: str):
+        agent = self._agents.get(agent_key)
+        if agent is not None and agent.version < self._known_versions.get(agent_key, 0):
+            return None # Load that read CURRENT just before another process saved; load again
+        return agent
+
+    def _add_to_lru(self, agent_key: str, agent: AgentData) -> AgentData:
+        # Returns the agent now in the LRU: a load that read the agent before a write saved
+        # a newer version does not replace the writer's agent
+        with self._lock:
+            current = self._agents.get(agent_key)
+            if current is not None and current.version > agent.version:
+                agent = current
+            self._agents[agent_key] = agent
+            self._agents.move_to_end(agent_key)
+            self._enforce_memory_budget()
+            return agent
+
+    def _load_agent(self, agent_key: str, create: bool):
+        agent_dir = self._agent_dir(agent_key)
+        legacy_path = os.path.join(self.data_dir, f"{agent_key}.json")
+        agent = None
+        try:
+            if AgentData.exists(agent_dir):
+                agent = AgentData.load(agent_dir)
+            elif os.path.exists(legacy_path):
+                agent = self._migrate_legacy_agent(agent_key, legacy_path)
+        except Exception as e:
+            print(f"An unexpected error occurred while loading agent {agent_key}: {e}")
+            return None
+
+        if agent is None:
+            if not create:
+                return None
+            agent = AgentData(backend=self.default_backend)
+        elif agent.needs_reindex:
+            for url in agent.urls:
+                self._index_chunks(agent, url, agent.get_text(url))
+            agent.needs_reindex = False
+            self._save_loaded_agent(agent_key, agent)
+        elif agent.backend != "tfidf" and (agent.dense is None or agent.dense.model != self.encoder.name):
+            # Embeddings missing or made by another model than the configured one
+            self._encode_agent(agent)
+            self._save_loaded_agent(agent_key, agent)
+
+        agent.publish()
+        self._known_versions[agent_key] = max(agent.version, self._known_versions.get(agent_key, 0))
+        return agent
+
+    def _save_loaded_agent(self, agent_key: str, agent: AgentData):
+        # Saves what a load rebuilt, so the next load does not rebuild it again. Loads do not wait
+        # for writes, so this is skipped while a write runs or after one saved a newer version.
+        lock = self._write_lock(agent_key)
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            agent_dir = self._agent_dir(agent_key)
+            if AgentData.current_version(agent_dir) == agent.version:
+                agent.save(agent_dir)
+        finally:
+            lock.release()
+
+    def _migrate_legacy_agent(self, agent_key: str, legacy_path: str) -> AgentData:
+        # One-time conversion of the old data/<agent_key>.json files
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Only the original texts are kept; the stored corpus indexed whole pages, not chunks.
+        # Legacy agents had no backend setting, so they get the one new agents get.
+        agent = AgentData(backend=self.default_backend)
+        for url, content in data.get("url_map", {}).items():
+            agent.set_text(url, content)
+            self._index_chunks(agent, url, content)
+        agent.save(self._agent_dir(agent_key))
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        print(f"Migrated agent {agent_key} to the binary index format.")
+        return agent
+
+    def _enforce_memory_budget(self):
+        # Evict least recently used agents; the most recent one always stays. Called with _lock held.
+        total = sum(agent.memory_bytes() for agent in self._agents.values())
+        while total > self.memory_budget and len(self._agents) > 1:
+            _, evicted = self._agents.popitem(last=False)
+            total -= evicted.memory_bytes()
+
+    def _index_chunks(self, agent: AgentData, url: str, content: str):
+        spans = split_into_chunks(content, self.chunk_words, self.chunk_overlap)
+        chunk_texts = [content[start:end] for start, end in spans]
+        embeddings = None
+        if agent.backend != "tfidf":
+            if agent.dense is None:
+                agent.dense = DenseIndex(self.encoder.dim, self.encoder.name, self.quantize_embeddings)
+            # The model sees the original chunk text; stopword removal only helps TF-IDF
+            with metrics.stage("index_embed"):
+                embeddings = self.encoder.encode(chunk_texts)
+        with metrics.stage("index_preprocess"):
+            preprocessed_chunks = preprocess_batch(chunk_texts)
+        with metrics.stage("index_update"):
+            agent.set_chunks(url, spans, preprocessed_chunks, embeddings)
+
+    def _fingerprints(self, agent: AgentData) -> FingerprintIndex:
+        # Agents saved without fingerprints get them from their stored texts on first use
+        if agent.fingerprints is None:
+            agent.fingerprints = FingerprintIndex()
+            for url in agent.urls:
+                agent.fingerprints.add(url, content_fingerprint(agent.get_text(url)))
+        return agent.fingerprints
+
+    def _encode_agent(self, agent: AgentData):
+        # (Re)builds the embedding index of all chunks in one batched pass
+        agent.dense = DenseIndex(self.encoder.dim, self.encoder.name, self.quantize_embeddings)
+        keys = agent.index.keys()
+        if keys:
+            page_texts = {url: agent.get_text(url) for url in agent.urls}
+            with metrics.stage("index_embed"):
+                embeddings = self.encoder.encode([page_texts[url][start:end] for url, start, end in keys])
+            agent.dense.add(keys, embeddings)
+
+    def set_backend(self, agent_key: str, backend: str):
+        """Selects an agent's retrieval backend, creating the agent or encoding its chunks as needed."""
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown retrieval backend: {backend}")
+        with self._ingest_lock(agent_key):
+            agent = self._get_agent(agent_key, create=True)
+            if agent is None:
+                raise ValueError(f"Invalid agent key: {agent_key}")
+            if AgentData.exists(self._agent_dir(agent_key)) and agent.backend == backend and (backend == "tfidf" or agent.dense is not None):
+                return
+            agent.backend = backend
+            if backend == "tfidf":
+                agent.dense = None
+            elif agent.dense is None or agent.dense.model != self.encoder.name:
+                self._encode_agent(agent)
+            agent.save(self._agent_dir(agent_key))
+            agent.publish()
+            self._log_change(agent_key, agent.version)
+            self._add_to_lru(agent_key, agent) # In case it was evicted while this write ran
+        for listener in self._change_listeners:
+            listener(agent_key)
 
     def store_data(self, agent_key: str, url: str, content: str):
-        preprocessed_content = self._preprocess_text(content)
-
-        if agent_key not in self.corpus:
-            self.corpus[agent_key] = []
-            self.url_map[agent_key] = {}
-
-        # Append new content if it's not already there for this URL
-        if url not in self.url_map[agent_key]:
-            self.corpus[agent_key].append(preprocessed_content)
-            self.url_map[agent_key][url] = content # Store original content
-            self._revectorize(agent_key)
-            self._save_agent_data(agent_key)
-        else:
-            # If URL already exists, update content and re-vectorize
-            old_content_idx = -1
-            for i, c in enumerate(self.corpus[agent_key]):
-                # This is a bit tricky, ideally we'd map back to original URL
-                # For simplicity, we'll re-add and re-vectorize entire corpus
-                # A more robust solution might involve mapping indices to URLs
-                # For now, if the original content of the URL changes, we update
-                if self.url_map[agent_key][url] == content: # Check if content has actually changed
-                    return # No update needed
-                
-                # If content changes, find and replace or just re-add and re-vectorize
-                # For simplicity, we'll re-add and update original content
-                self.url_map[agent_key][url] = content # Update original content
-
-                # Rebuilding corpus based on url_map to avoid duplicates and keep order
-                self.corpus[agent_key] = [self._preprocess_text(self.url_map[agent_key][u]) for u in self.url_map[agent_key]]
-                self._revectorize(agent_key)
-                self._save_agent_data(agent_key)
-                break
+        self.store_pages(agent_key, [(url, content)])
+
+    def store_pages(self, agent_key: str, pages: list[tuple[str, str]]) -> int:
+        """
+        store_data for several (url, content) pages, saved and published once.
+        Returns the number of pages that were new or changed, aliases
+        included.
+        """
+        with self._ingest_lock(agent_key):
+            agent = self._get_agent(agent_key, create=True)
+            if agent is None:
+                raise ValueError(f"Invalid agent key: {agent_key}")
+
+            changed = 0
+            aliases_of = None # url -> its aliases, built when a page with aliases first changes
+            for url, content in pages:
+                if url in agent.urls and agent.get_text(url) == content:
+                    continue # No update needed
+                fingerprint = None
+                if url in agent.aliases:
+                    # An alias resolves to the page it duplicates, so its own text is compared by fingerprint
+                    fingerprint = content_fingerprint(content)
+                    if fingerprint[0] == self._alias_fingerprint(agent, url)[0]:
+                        continue # No update needed
+
+                if self.deduplicate:
+                    with metrics.stage("index_dedup"):
+                        fingerprint = fingerprint or content_fingerprint(content)
+                        duplicate = None
+                        if url not in agent.urls:
+                            # An alias whose text changed only stays one if its new text is the same as a page's
+                            min_similarity = self.near_duplicate_similarity if url not in agent.aliases else None
+                            duplicate = self._fingerprints(agent).find(fingerprint, min_similarity)
+                    if duplicate is not None:
+                        original, match = duplicate
+                        agent.alias_fingerprints[url] = fingerprint
+                        if agent.aliases.get(url) != original:
+                            agent.aliases[url] = original
+                            if aliases_of is not None:
+                                aliases_of.setdefault(original, []).append(url)
+                            PAGES_DEDUPLICATED.inc(match=match)
+                        changed += 1
+                        continue
+                elif agent.fingerprints is not None:
+                    agent.fingerprints = None # Out of date from here on; rebuilt if deduplication is turned back on
+                agent.aliases.pop(url, None) # No longer a duplicate
+                agent.alias_fingerprints.pop(url, None)
+
+                if url in agent.urls and agent.aliases:
+                    if aliases_of is None:
+                        aliases_of = {}
+                        for alias, original in agent.aliases.items():
+                            aliases_of.setdefault(original, []).append(alias)
+                    changed += self._promote_aliases(agent, url, aliases_of.get(url, []), fingerprint or content_fingerprint(content))
+
+                agent.set_text(url, content) # Store original content
+                # Only this page's chunks are tokenized; the index updates its term statistics in place
+                self._index_chunks(agent, url, content)
+                if self.deduplicate:
+                    agent.fingerprints.add(url, fingerprint)
+                changed += 1
+            if not changed:
+                return 0
+            with metrics.stage("index_save"):
+                agent.save(self._agent_dir(agent_key))
+            agent.publish() # Queries switch to the new state only now, all at once
+            self._log_change(agent_key, agent.version)
+            PAGES_STORED.inc(changed)
+            self._add_to_lru(agent_key, agent) # In case it was evicted while this write ran
+        for listener in self._change_listeners:
+            listener(agent_key)
+        return changed
+
+    @staticmethod
+    def _alias_fingerprint(agent: AgentData, alias: str):
+        # Aliased before aliases had fingerprints: its text was the same as the page's
+        fingerprint = agent.alias_fingerprints.get(alias)
+        return fingerprint if fingerprint is not None else content_fingerprint(agent.get_text(alias))
 
-    def _revectorize(self, agent_key: str):
-        if self.corpus[agent_key]:
-            self.vectorizers[agent_key] = TfidfVectorizer()
-            self.vectors[agent_key] = self.vectorizers[agent_key].fit_transform(self.corpus[agent_key])
-        else:
-            self.vectorizers.pop(agent_key, None)
-            self.vectors.pop(agent_key, None)
+    def _promote_aliases(self, agent: AgentData, url: str, aliases: list[str], fingerprint) -> int:
+        # `url` is about to get the text of `fingerprint`. Its aliases that do not match that text get
+        # the page's current text, the one they resolved to so far, as their own. Returns how many did.
+        old_text = old_fingerprint = None
+        promoted = 0
+        for alias in aliases:
+            if agent.aliases.get(alias) != url: # Changed earlier in the same store
+                continue
+            if old_text is None:
+                old_text = agent.get_text(url)
+                old_fingerprint = content_fingerprint(old_text)
+            # Aliased before aliases had fingerprints: it matched the current text
+            alias_fingerprint = agent.alias_fingerprints.get(alias, old_fingerprint)
+            if alias_fingerprint[0] == fingerprint[0] or (self.near_duplicate_similarity is not None and
+                                                          similarity(alias_fingerprint, fingerprint) >= self.near_duplicate_similarity):
+                continue # Still a duplicate of the page
+            del agent.aliases[alias]
+            agent.alias_fingerprints.pop(alias, None)
+            agent.set_text(alias, old_text)
+            self._index_chunks(agent, alias, old_text)
+            if agent.fingerprints is not None:
+                agent.fingerprints.add(alias, old_fingerprint)
+            promoted += 1
+        if promoted:
+            ALIASES_PROMOTED.inc(promoted)
+        return promoted
 
-    def retrieve_matched_content(self, agent_key: str, query: str, top_n: int = 1):
-        if agent_key not in self.vectorizers or not self.corpus[agent_key]:
+    def near_duplicate_aliases(self, agent_key: str, urls: list[str]) -> list[str]:
+        """
+        The URLs among `urls` that are aliases of a page whose text is not
+        the same as theirs: near-duplicates, whose own text is not indexed.
+        """
+        with self._write_lock(agent_key):
+            agent = self._get_agent(agent_key)
+            if agent is None:
+                return []
+            return [url for url in urls if url in agent.aliases and url in agent.alias_fingerprints
+                    and agent.alias_fingerprints[url][0] != exact_hash(agent.get_text(agent.aliases[url]))]
+
+    def retrieval_may_block(self, agent_key: str) -> bool:
+        """
+        Whether querying the agent can take long enough to belong off the event
+        loop: dense and hybrid agents encode every query, and an agent that is
+        not loaded is read from disk first, and re-encoded if its embeddings
+        are missing or were made by another model.
+        """
+        agent = self._loaded_agent(agent_key)
+        return agent is None or agent.backend != "tfidf"
+
+    def has_agent(self, agent_key: str) -> bool:
+        return self._get_agent(agent_key) is not None
+
+    def agent_stats(self) -> list[dict]:
+        """Size of every agent currently in memory."""
+        with self._lock:
+            agents = list(self._agents.items())
+        return [{"agent_key": key, "backend": agent.backend, "documents": len(agent.urls), "aliases": len(agent.aliases),
+                 "chunks": len(agent.index), "memory_bytes": agent.memory_bytes()} for key, agent in agents]
+
+    def update_metrics(self):
+        # Collector for /metrics: gauges for the loaded agents only, so evicted agents drop out
+        stats = self.agent_stats()
+        for gauge in (AGENT_DOCUMENTS, AGENT_CHUNKS, AGENT_INDEX_BYTES):
+            gauge.clear()
+        AGENTS_LOADED.set(len(stats))
+        for agent in stats:
+            AGENT_DOCUMENTS.set(agent["documents"], agent=agent["agent_key"])
+            AGENT_CHUNKS.set(agent["chunks"], agent=agent["agent_key"])
+            AGENT_INDEX_BYTES.set(agent["memory_bytes"], agent=agent["agent_key"])
+
+    def _get_snapshot(self, agent_key: str):
+        agent = self._get_agent(agent_key)
+        return agent.current if agent is not None else None
+
+    def query_vector(self, agent_key: str, query: str):
+        """The query's l2-normalized TF-IDF vector in the agent's index, or None for unknown agents."""
+        snapshot = self._get_snapshot(agent_key)
+        if snapshot is None:
             return None
+        return snapshot.index.transform(self._preprocess_text(query))
 
-        vectorizer = self.vectorizers[agent_key]
-        corpus_vectors = self.vectors[agent_key]
-
-        preprocessed_query = self._preprocess_text(query)
-        query_vector = vectorizer.transform([preprocessed_query])
-
-        similarities = cosine_similarity(query_vector, corpus_vectors).flatten()
-        
-        # Get indices of top_n most similar documents
-        # We need to make sure we don't ask for more than available
-        top_indices = similarities.argsort()[-min(top_n, len(similarities)):][::-1]
-
-        matched_content = []
-        # Reconstruct the original content based on the order of url_map
-        original_contents = list(self.url_map[agent_key].values())
-        for idx in top_indices:
-            if idx < len(original_contents):
-                matched_content.append(original_contents[idx])
-        
-        return " ".join(matched_content) if matched_content else None
-
-    def _save_agent_data(self, agent_key: str):
-        # Save corpus and URL map. Vectorizers and vectors are regenerated on load.
-        file_path = os.path.join(self.data_dir, f"{agent_key}.json")
-        data_to_save = {
-            "corpus": self.corpus.get(agent_key, []),
-            "url_map": self.url_map.get(agent_key, {})
-        }
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data_to_save, f, ensure_ascii=False, indent=2)
-
-    def load_all_data(self):
-        for filename in os.listdir(self.data_dir):
-            if filename.endswith(".json"):
-                agent_key = filename.replace(".json", "")
-                file_path = os.path.join(self.data_dir, filename)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        self.corpus[agent_key] = data.get("corpus", [])
-                        self.url_map[agent_key] = data.get("url_map", {})
-                        self._revectorize(agent_key) # Re-vectorize on load
-                except json.JSONDecodeError as e:
-                    print(f"Error loading JSON from {file_path}: {e}")
-                except Exception as e:
-                    print(f"An unexpected error occurred while loading {file_path}: {e}")
+    def retrieve_matched_chunks(self, agent_key: str, query: str, top_k: int = 5, token_budget: int = 1500):
+        """
+        Returns the best matching chunks, best first, as dicts with the chunk
+        text, its URL, its [start, end) character span in the page and its
+        score. Chunks are added while they fit in token_budget (the best chunk
+        is always kept), and chunks overlapping an already selected one are
+        skipped so the overlap is not sent twice.
+        """
+        snapshot = self._get_snapshot(agent_key)
+        if snapshot is None or not len(snapshot.index):
+            return None
+        return self._select_chunks(snapshot, self._search_batch(snapshot, [query], top_k)[0], token_budget)
+
+    def retrieve_matched_chunks_batch(self, agent_key: str, queries: list[str], top_k: int = 5, token_budget: int = 1500):
+        """
+        retrieve_matched_chunks for many queries of one agent. The queries are
+        preprocessed together and scored with one documents x queries matrix
+        product; each result equals the single-query result. Returns None
+        for unknown or empty agents, else one chunk list per query.
+        """
+        snapshot = self._get_snapshot(agent_key)
+        if snapshot is None or not len(snapshot.index):
+            return None
+        return [self._select_chunks(snapshot, matches, token_budget) for matches in self._search_batch(snapshot, queries, top_k)]
+
+    def _select_chunks(self, agent: AgentSnapshot, matches: list, token_budget: int) -> list:
+        selected = []
+        used_tokens = 0
+        page_texts = {}
+        for (url, start, end), score in matches:
+            if score <= 0:
+                break
+            if any(chunk["url"] == url and start < chunk["end"] and chunk["start"] < end for chunk in selected):
+                continue
+            if url not in page_texts:
+                page_texts[url] = agent.get_text(url)
+            text = page_texts[url][start:end]
+            tokens = estimate_tokens(text)
+            if selected and used_tokens + tokens > token_budget:
+                continue
+            selected.append({"url": url, "start": start, "end": end, "score": score, "text": text})
+            used_tokens += tokens
+        return selected
+
+    def _search_batch(self, agent: AgentSnapshot, queries: list[str], top_k: int) -> list[list]:
+        # (key, score) pairs per query, best first, scored by the agent's backend
+        if agent.backend == "tfidf" or agent.dense is None:
+            with metrics.stage("query_preprocess"):
+                preprocessed = preprocess_batch(queries)
+            with metrics.stage("query_score"):
+                return agent.index.search_batch(preprocessed, top_k)
+        with metrics.stage("query_embed"):
+            query_vectors = self.encoder.encode(queries)
+        if agent.backend == "dense":
+            with metrics.stage("query_score"):
+                return agent.dense.search_batch(query_vectors, top_k)
+
+        with metrics.stage("query_preprocess"):
+            preprocessed = preprocess_batch(queries)
+        with metrics.stage("query_score"):
+            keys, tfidf_scores = agent.index.scores_batch(preprocessed)
+            scores = self.hybrid_alpha * agent.dense.scores(query_vectors, keys) + (1 - self.hybrid_alpha) * tfidf_scores
+            return [[(keys[i], float(column[i])) for i in top_indices(column, top_k)] for column in scores.T]
+
+    def retrieve_matched_content(self, agent_key: str, query: str, top_k: int = 5, token_budget: int = 1500):
+        chunks = self.retrieve_matched_chunks(agent_key, query, top_k, token_budget)
+        return "\n\n".join(chunk["text"] for chunk in chunks) if chunks else None